@@ -13,6 +13,17 @@ export interface SessionRequest {
   session_id: string;
 }
 
+// Progress of a running pipeline stage, streamed from /api/progress
+export interface StageProgress {
+  stage: string;
+  status: 'running' | 'completed' | 'failed';
+  phase: string | null;
+  percent: number;
+  fps: number | null;
+  eta: number | null;
+  error?: string | null;
+}
+
 export interface ApiResponse {
   success: boolean;
   message?: string;
@@ -122,6 +133,29 @@ export const addMusic = async (
   return apiCall<ApiResponse>('add-music', 'POST', { session_id });
 };
 
+// Render API (merge, captions and music in a single encode)
+export const renderVideo = async (
+  session_id: string
+): Promise<ApiResponse> => {
+  return apiCall<ApiResponse>('render', 'POST', { session_id });
+};
+
+// Subscribe to the progress events of a session (returns the EventSource so the caller can close it)
+export const subscribeToProgress = (
+  session_id: string,
+  onProgress: (progress: StageProgress) => void
+): EventSource => {
+  const source = new EventSource(`/api/progress?session_id=${encodeURIComponent(session_id)}`);
+  source.onmessage = (event) => {
+    try {
+      onProgress(JSON.parse(event.data));
+    } catch (error) {
+      console.error("Invalid progress event:", error);
+    }
+  };
+  return source;
+};
+
 // Get Video URL API
 export const getVideoUrl = async (
   session_id: string
@@ -0,0 +1,50 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+// Hardcoded API URL - same as used for config updates
+const API_BASE_URL = 'http://0.0.0.0:8000/api';
+
+// Keep the stream open instead of buffering a cached response
+export const dynamic = 'force-dynamic';
+
+/**
+ * GET handler that relays the backend's Server-Sent Events progress stream for a session
+ */
+export async function GET(request: NextRequest) {
+  try {
+    // Get the session ID from the URL query parameters
+    const { searchParams } = new URL(request.url);
+    const session_id = searchParams.get('session_id');
+
+    if (!session_id) {
+      return NextResponse.json(
+        { success: false, error: "Missing session_id" },
+        { status: 400 }
+      );
+    }
+
+    const response = await fetch(`${API_BASE_URL}/session/${encodeURIComponent(session_id)}/progress`, {
+      headers: { 'Accept': 'text/event-stream' },
+      cache: 'no-store',
+      signal: request.signal  // Close the backend stream when the browser disconnects
+    });
+
+    if (!response.ok || !response.body) {
+      throw new Error(`Backend API responded with status: ${response.status}`);
+    }
+
+    // Pass the event stream through unchanged
+    return new Response(response.body, {
+      headers: {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache, no-transform',
+        'Connection': 'keep-alive'
+      }
+    });
+  } catch (error) {
+    console.error("Error streaming progress:", error);
+    return NextResponse.json(
+      { success: false, error: "Failed to stream progress" },
+      { status: 500 }
+    );
+  }
+}
@@ -1,41 +1,104 @@
 import anthropic
+import asyncio
 import os
 from dotenv import load_dotenv
 from config import Config
 import json
+import time
+from app.cache import DiskCache
+from app import tracing
+from app.script_manage import ScriptStreamParser
 
 load_dotenv()
 
 client = anthropic.Anthropic(api_key=os.getenv("ANTRO_CHAT"))
+# The async client and the semaphore bounding concurrent model requests are shared by every
+# request of the process (created on first use in the running event loop). AGENT_CONCURRENCY
+# sets the limit, so batch runs are bounded by the provider rate limits.
+DEFAULT_AGENT_CONCURRENCY = 8
+_async_client = None
+_async_semaphore = None
+_async_loop = None
+MODEL = "claude-3-7-sonnet-20250219"
+MAX_TOKENS = 8000
+TEMPERATURE = 0.7  # Add some creativity while maintaining coherence
+# A response cut off at max_tokens is continued from where it stopped, at most this many
+# rounds in total and this many output tokens across them
+MAX_ROUNDS = 3
+MAX_TOTAL_OUTPUT_TOKENS = 20000
+
+# Finished responses keyed by the full request (model, parameters, system blocks and user
+# prompt), so identical requests from debugging re-runs and batch jobs skip the model
+RESPONSE_CACHE_DIR = "app/data/cache/agent"
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_RESPONSE_CACHE_TTL = 24 * 60 * 60  # Seconds, 0 disables the cache
+_response_cache = None
+
+def get_response_cache():
+    """Create the on-disk response cache on first use"""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = DiskCache(RESPONSE_CACHE_DIR, RESPONSE_CACHE_MAX_BYTES)
+    return _response_cache
     
+def get_async_client():
+    """
+    Return the process-wide async client and concurrency semaphore.
+    Both are tied to an event loop, so they are created again if the loop changes.
+    """
+    global _async_client, _async_semaphore, _async_loop
+    loop = asyncio.get_running_loop()
+    if _async_loop is not loop:
+        _async_client = anthropic.AsyncAnthropic(api_key=os.getenv("ANTRO_CHAT"))
+        _async_semaphore = asyncio.Semaphore(int(os.getenv("AGENT_CONCURRENCY", DEFAULT_AGENT_CONCURRENCY)))
+        _async_loop = loop
+    return _async_client, _async_semaphore
+
 class Agent_Medium:
-    def __init__(self, instructions, mothership, prompt, video_list):
+    def __init__(self, instructions, mothership, prompt, video_list, training_data=None, use_cache=True,
+                 cache_ttl=DEFAULT_RESPONSE_CACHE_TTL):
         self.client = client
         self.instructions = instructions
         self.mothership = mothership
         self.prompt = prompt
         self.video_list = video_list
+        # use_cache=False skips the lookup (a creative re-roll) but still stores the new response
+        self.use_cache = use_cache
+        self.cache_ttl = cache_ttl
 
-        config = Config("military", "medium")
-        config.training_data()
+        # The examples picked for this request (see app/retrieval.py), or every example
+        if training_data is None:
+            config = Config("military", "medium")
+            config.training_data()
+            training_data = config.agent_training_data
 
-        self.agent_training_data = config.agent_training_data
+        self.agent_training_data = training_data
 
-    def merge_prompt(self):
-        final_prompt = f"""
-        Here are your instructions:
-        {self.instructions}
-
-        Here is the video list:
-        {self.video_list}
+    def system_blocks(self):
+        """
+        The system prompt as content blocks, ordered from the most to the least stable part:
+        the agent's instructions, then the examples, then the clip list.
 
-        Here are example responses:
-        {self.agent_training_data}
-        
-        Your response should be in the same format as the example responses with the overarching key 'config'. When finished, add final to the end of your response outside of the json object.
+        There are no prompt caching breakpoints: the examples and clips are picked per
+        request (see app/retrieval.py), and the instructions alone are far below the
+        provider's minimum cacheable prefix, so a breakpoint would never be read back.
+        Repeated requests are served by the response cache instead.
         """
+        sections = [
+            f"""Here are your instructions:
+{self.instructions}
 
-        return final_prompt
+Your response should be in the same format as the example responses with the overarching key 'config'. When finished, add final to the end of your response outside of the json object.""",
+            f"""Here are example responses:
+{self.agent_training_data}""",
+            f"""Here is the video list:
+{self.video_list}"""
+        ]
+        return [{"type": "text", "text": text} for text in sections]
+
+    def merge_prompt(self):
+        """The system prompt as one string"""
+        return "\n\n".join(block["text"] for block in self.system_blocks())
     
     def user_prompt(self):
         user_prompt = f"""
@@ -49,26 +112,211 @@ class Agent_Medium:
         """
         return user_prompt
     
-    def generate_response(self):
-        finished = False
-        num = 0
+    def cache_key(self):
+        """Response cache key of the full request"""
+        return DiskCache.make_key("agent_response", MODEL, MAX_TOKENS, TEMPERATURE,
+                                  self.system_blocks(), self.user_prompt())
+
+    def cached_response(self):
+        """
+        The stored response for this request, unless caching is off, the caller asked for a
+        new one, or it is older than the TTL.
+        """
+        if not self.use_cache or self.cache_ttl <= 0:
+            return None
+        entry = get_response_cache().get(self.cache_key())
+        if entry is None:
+            return None
+        try:
+            with open(os.path.join(entry, "meta.json"), 'r') as f:
+                created = json.load(f)["created"]
+            if time.time() - created > self.cache_ttl:
+                return None
+            with open(os.path.join(entry, "response.txt"), 'r', encoding='utf-8') as f:
+                return f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def store_response(self, response):
+        """Store a finished response, replacing any older one for the same request"""
+        if self.cache_ttl <= 0:
+            return
+        cache = get_response_cache()
+        key = self.cache_key()
+        try:
+            cache.remove(key)
+            cache.put(key, {
+                "response.txt": response.encode("utf-8"),
+                "meta.json": json.dumps({"created": time.time(), "model": MODEL}).encode("utf-8")
+            })
+        except OSError as e:
+            print(f"Error caching agent response: {e}")
+
+    @staticmethod
+    def record_usage(span, usage):
+        """Add the token counts, including the prompt caching ones, to a span"""
+        span["input_tokens"] = usage.input_tokens
+        span["output_tokens"] = usage.output_tokens
+        span["cache_read_input_tokens"] = getattr(usage, "cache_read_input_tokens", None) or 0
+        span["cache_creation_input_tokens"] = getattr(usage, "cache_creation_input_tokens", None) or 0
+
+    def round_messages(self, partial):
+        """
+        Messages of one round: the request, and after a max_tokens cut-off the output so far
+        as a prefilled assistant turn, which the model continues instead of starting over.
+        """
         messages = [{"role": "user", "content": self.user_prompt()}]
-        while not finished:
-            num += 1
-            response = self.client.messages.create(
-                model="claude-3-7-sonnet-20250219",
-                max_tokens=8000,
-                temperature=0.7,  # Add some creativity while maintaining coherence
-                system=self.merge_prompt(),
-                messages=messages
-
-            )
-            messages.append({"role": "assistant", "content": response.content[0].text.strip()})
-            if 'final' in response.content[0].text.strip():
-                finished = True
-            print(f"Response {num}: {response.content[0].text.strip()}\n\n")
-
-        return response.content[0].text.strip()
+        if partial:
+            messages.append({"role": "assistant", "content": partial})
+        return messages
+
+    def round_request(self, partial, output_tokens):
+        """Arguments of one round's messages request, with max_tokens capped by the remaining budget"""
+        return {
+            "model": MODEL,
+            "max_tokens": min(MAX_TOKENS, MAX_TOTAL_OUTPUT_TOKENS - output_tokens),
+            "temperature": TEMPERATURE,
+            "system": self.system_blocks(),
+            "messages": self.round_messages(partial)
+        }
+
+    @staticmethod
+    def response_text(response):
+        """Text of a messages response"""
+        return "".join(block.text for block in response.content if getattr(block, "type", "text") == "text")
+
+    @staticmethod
+    def needs_continuation(stop_reason, num, output_tokens):
+        """Whether a round cut off at stop_reason is continued, within the round and token limits"""
+        if stop_reason != "max_tokens":
+            return False
+        if num == MAX_ROUNDS or output_tokens >= MAX_TOTAL_OUTPUT_TOKENS:
+            print(f"Warning: Response still cut off after {num} rounds ({output_tokens} output tokens). Using the partial script.")
+            return False
+        return True
+
+    def generate_response(self):
+        """
+        Generate the script, continuing it while the model stops at max_tokens (up to
+        MAX_ROUNDS rounds and MAX_TOTAL_OUTPUT_TOKENS output tokens).
+
+        Returns:
+            str: The stitched response
+        """
+        cached = self.cached_response()
+        if cached is not None:
+            print("Response cache hit\n\n")
+            return cached
+
+        response_text = ""
+        output_tokens = 0
+        for num in range(1, MAX_ROUNDS + 1):
+            with tracing.span("anthropic.messages.create", "external", model=MODEL, round=num) as span:
+                response = self.client.messages.create(**self.round_request(response_text, output_tokens))
+                self.record_usage(span, response.usage)
+                span["stop_reason"] = response.stop_reason
+            text = self.response_text(response)
+            response_text += text
+            output_tokens += response.usage.output_tokens
+            print(f"Response {num} ({response.stop_reason}): {text.strip()}\n\n")
+
+            if not self.needs_continuation(response.stop_reason, num, output_tokens):
+                break
+            # The prefilled assistant turn must not end with whitespace
+            response_text = response_text.rstrip()
+
+        response_text = response_text.strip()
+        self.store_response(response_text)
+        return response_text
+
+    async def agenerate_response(self):
+        """
+        generate_response() on the shared async client, so it does not block the event loop.
+        Every round waits for the process-wide concurrency semaphore.
+
+        Returns:
+            str: The stitched response
+        """
+        cached = await asyncio.to_thread(self.cached_response)
+        if cached is not None:
+            print("Response cache hit\n\n")
+            return cached
+
+        async_client, semaphore = get_async_client()
+        response_text = ""
+        output_tokens = 0
+        for num in range(1, MAX_ROUNDS + 1):
+            async with semaphore:
+                with tracing.span("anthropic.messages.create", "external", model=MODEL, round=num) as span:
+                    response = await async_client.messages.create(**self.round_request(response_text, output_tokens))
+                    self.record_usage(span, response.usage)
+                    span["stop_reason"] = response.stop_reason
+            response_text += self.response_text(response)
+            output_tokens += response.usage.output_tokens
+
+            if not self.needs_continuation(response.stop_reason, num, output_tokens):
+                break
+            # The prefilled assistant turn must not end with whitespace
+            response_text = response_text.rstrip()
+
+        response_text = response_text.strip()
+        await asyncio.to_thread(self.store_response, response_text)
+        return response_text
+
+    def stream_response(self, on_pair=None):
+        """
+        Generate the script with a streamed completion, handing every {line, video} pair of
+        the config array to on_pair(index, pair) as soon as it has been received. A response
+        cut off at max_tokens is continued like in generate_response().
+
+        Args:
+            on_pair (callable, optional): Called from this thread for each completed pair
+
+        Returns:
+            str: The complete response text
+        """
+        parser = ScriptStreamParser()
+        cached = self.cached_response()
+        if cached is not None:
+            print("Response cache hit\n\n")
+            # Replay the stored response through the parser so the caller sees the same pairs
+            for index, pair in parser.feed(cached):
+                if on_pair is not None:
+                    on_pair(index, pair)
+            return cached
+
+        output_tokens = 0
+        started = time.perf_counter()
+        for num in range(1, MAX_ROUNDS + 1):
+            with tracing.span("anthropic.messages.stream", "external", model=MODEL, round=num) as span:
+                # Trailing whitespace of each chunk is held back until more text follows, so
+                # the parser sees exactly the (stripped) prefill a continuation round resumes from
+                pending = ""
+                with self.client.messages.stream(**self.round_request(parser.text, output_tokens)) as stream:
+                    for text in stream.text_stream:
+                        text = pending + text
+                        stripped = text.rstrip()
+                        pending = text[len(stripped):]
+                        for index, pair in parser.feed(stripped):
+                            if index == 0:
+                                span["first_pair_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                            if on_pair is not None:
+                                on_pair(index, pair)
+                    message = stream.get_final_message()
+                self.record_usage(span, message.usage)
+                span["stop_reason"] = message.stop_reason
+                span["pairs"] = parser.count
+            output_tokens += message.usage.output_tokens
+
+            if not self.needs_continuation(message.stop_reason, num, output_tokens):
+                if message.stop_reason != "max_tokens":
+                    parser.feed(pending)
+                break
+
+        response = parser.text.strip()
+        print(f"Streamed response ({parser.count} lines): {response}\n\n")
+        self.store_response(response)
+        return response
 
 if __name__ == "__main__":
     with open("video_list.json", "r") as f:
@@ -1,19 +1,49 @@
 import os
 import json
-import requests
+import shutil
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
+from app.cache import DiskCache
+from app.ffmpeg_utils import run_ffmpeg, probe_duration
+from app.http_client import get_http_client, download_to_file
+from app.speech_backends import get_speech_backend
+from app.script_manage import has_speech
+from app import progress
+from app import tracing
+
+# Synthesized speech (audio + timestamps) keyed by the text and voice parameters,
+# shared by every session and worker process
+TTS_CACHE_DIR = "app/data/cache/tts"
+TTS_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+_tts_cache = None
+
+def get_tts_cache():
+    """Create the on-disk speech cache on first use"""
+    global _tts_cache
+    if _tts_cache is None:
+        _tts_cache = DiskCache(TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES)
+    return _tts_cache
 
 class AudioManager:
     """
-    A class to handle UnrealSpeech API requests and manage audio and timestamp files.
+    A class to handle speech backend requests and manage audio and timestamp files.
     """
     
-    def __init__(self):
-        """Initialize the AudioManager, loading API key from environment variables."""
+    def __init__(self, output_dir=os.path.join("app", "data", "current"), use_cache=True, backend=None):
+        """
+        Initialize the AudioManager, loading API key from environment variables.
+
+        Args:
+            output_dir (str): Directory the audio and timestamps are saved in (the session workspace)
+            use_cache (bool): Reuse speech already synthesized for the same text and voice parameters
+            backend (str, optional): Speech backend ("unrealspeech" or "standin"). Defaults to SPEECH_BACKEND.
+        """
         load_dotenv(override=True)
-        self.api_key = os.getenv("VOICE")
-        self.api_url = "https://api.v8.unrealspeech.com/speech"
-        self.output_dir = os.path.join("app", "data", "current")
+        self.backend = get_speech_backend(backend)
+        self.output_dir = output_dir
+        self.use_cache = use_cache
         
         # Ensure the output directory exists
         os.makedirs(self.output_dir, exist_ok=True)
@@ -24,7 +54,7 @@ class AudioManager:
                        audio_format="mp3", output_format="uri", 
                        timestamp_type="sentence", sync=False, speed=0, pitch=1):
         """
-        Generate speech using the UnrealSpeech API.
+        Generate speech using the speech backend.
         
         Args:
             text (str): The text to convert to speech
@@ -50,24 +80,16 @@ class AudioManager:
             "Pitch": pitch
         }
         
-        headers = {
-            'Authorization': f'Bearer {self.api_key}'
-        }
-        
-        response = requests.request("POST", self.api_url, headers=headers, json=payload)
-        
-        if response.status_code != 200:
-            raise Exception(f"API request failed with status code {response.status_code}: {response.text}")
-            
-        return response.json()
+        progress.phase("tts request")
+        return self.backend.synthesize(payload)
     
     def save_audio_and_timestamps(self, response_data, audio_filename=None, timestamps_filename=None):
         """
         Download and save the audio file and timestamps from API response.
-        Files are saved in the data/current directory.
+        Files are saved in the output directory.
         
         Args:
-            response_data (dict): Response data from UnrealSpeech API
+            response_data (dict): Response data from the speech backend
             audio_filename (str, optional): Filename to save audio as. Defaults to taskId.mp3.
             timestamps_filename (str, optional): Filename to save timestamps as. Defaults to taskId.json.
             
@@ -92,25 +114,68 @@ class AudioManager:
         if not timestamps_filename:
             timestamps_filename = f"{task_id}.json"
         
-        # Create full paths within the data/current directory
+        # Create full paths within the output directory
         audio_path = os.path.join(self.output_dir, audio_filename)
         timestamps_path = os.path.join(self.output_dir, timestamps_filename)
         
-        # Download and save audio file
-        audio_content = requests.get(audio_uri).content
-        with open(audio_path, 'wb') as audio_file:
-            audio_file.write(audio_content)
+        # Download the audio and the timestamps concurrently over the pooled client
+        progress.phase("download")
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            audio_future = pool.submit(contextvars.copy_context().run, self.download_audio, audio_uri, audio_path)
+            timestamps_future = pool.submit(contextvars.copy_context().run, self.download_timestamps, timestamps_uri, timestamps_path)
+            audio_future.result()
+            timestamps_future.result()
         
-        # Download and save timestamps
-        timestamps_content = requests.get(timestamps_uri).json()
+        return audio_path, timestamps_path
+    
+    def download_audio(self, audio_uri, audio_path):
+        """Stream the audio file to disk in chunks"""
+        with tracing.span(f"{self.backend.name}.download_audio", "external") as span:
+            span["bytes"] = download_to_file(audio_uri, audio_path)
+    
+    def download_timestamps(self, timestamps_uri, timestamps_path):
+        """Download the timestamps and save them as indented JSON"""
+        with tracing.span(f"{self.backend.name}.download_timestamps", "external"):
+            response = get_http_client().get(timestamps_uri)
+            response.raise_for_status()
+            timestamps_content = response.json()
         with open(timestamps_path, 'w') as timestamps_file:
             json.dump(timestamps_content, timestamps_file, indent=2)
+    
+    def speech_cache_key(self, text, voice_id="Sierra", bitrate="192k", audio_format="mp3",
+                         timestamp_type="sentence", speed=0, pitch=1, **kwargs):
+        """
+        Cache key of a speech request. The defaults mirror generate_speech so that passing
+        a parameter explicitly or relying on its default gives the same key. The backend is
+        part of the key so stand-in audio is never served for real requests.
+        """
+        return DiskCache.make_key("tts", self.backend.name, text, voice_id, speed, pitch, bitrate, audio_format, timestamp_type)
+    
+    def load_cached_speech(self, key, audio_filename, timestamps_filename, audio_format="mp3"):
+        """
+        Copy a cached audio and timestamps pair into the output directory.
         
+        Returns:
+            tuple: (audio_path, timestamps_path), or None on a cache miss
+        """
+        entry = get_tts_cache().get(key)
+        if entry is None:
+            return None
+        
+        audio_path = os.path.join(self.output_dir, audio_filename or f"{key[:16]}.{audio_format}")
+        timestamps_path = os.path.join(self.output_dir, timestamps_filename or f"{key[:16]}.json")
+        try:
+            shutil.copyfile(os.path.join(entry, f"audio.{audio_format}"), audio_path)
+            shutil.copyfile(os.path.join(entry, "timestamps.json"), timestamps_path)
+        except OSError:
+            # Entry evicted while copying; synthesize again
+            return None
         return audio_path, timestamps_path
     
     def process_text_to_speech(self, text, audio_filename=None, timestamps_filename=None, **kwargs):
         """
         Process text to speech and save the results in one step.
+        Identical requests are served from the speech cache without calling the API.
         
         Args:
             text (str): The text to convert to speech
@@ -121,8 +186,147 @@ class AudioManager:
         Returns:
             tuple: (audio_path, timestamps_path) - Paths to saved files
         """
+        os.makedirs(self.output_dir, exist_ok=True)
+        audio_format = kwargs.get("audio_format", "mp3")
+        key = self.speech_cache_key(text, **kwargs)
+        
+        if self.use_cache:
+            cached = self.load_cached_speech(key, audio_filename, timestamps_filename, audio_format)
+            if cached is not None:
+                progress.phase("cache hit")
+                print(f"Speech cache hit ({key[:12]}). Skipping the API request.")
+                return cached
+        
         response_data = self.generate_speech(text, **kwargs)
-        return self.save_audio_and_timestamps(response_data, audio_filename, timestamps_filename)
+        audio_path, timestamps_path = self.save_audio_and_timestamps(response_data, audio_filename, timestamps_filename)
+        
+        if self.use_cache:
+            try:
+                get_tts_cache().put(key, {f"audio.{audio_format}": audio_path, "timestamps.json": timestamps_path})
+            except OSError as e:
+                print(f"Error caching speech: {e}")
+        return audio_path, timestamps_path
+
+    def synthesize_line(self, index, text, retries=1, **kwargs):
+        """
+        Synthesize one script line into the lines directory, retrying failed requests.
+        
+        Returns:
+            tuple: (audio_path, timestamps_path) of the line
+        """
+        audio_format = kwargs.get("audio_format", "mp3")
+        for attempt in range(retries + 1):
+            try:
+                with progress.detached():
+                    return self.process_text_to_speech(
+                        text,
+                        audio_filename=f"line_{index:03d}.{audio_format}",
+                        timestamps_filename=f"line_{index:03d}.json",
+                        **kwargs
+                    )
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                print(f"Error synthesizing line {index} ({e}). Retrying...")
+    
+    def line_manager(self):
+        """AudioManager that writes per-line speech to the lines directory, with this one's settings"""
+        lines_dir = os.path.join(self.output_dir, "lines")
+        return AudioManager(output_dir=lines_dir, use_cache=self.use_cache, backend=self.backend.name)
+    
+    @staticmethod
+    def line_duration(audio_path, timestamps_path):
+        """Length of a line's audio, or its last timestamp's end when the audio cannot be probed"""
+        duration = probe_duration(audio_path)
+        if duration is None:
+            with open(timestamps_path, 'r') as f:
+                line_timestamps = json.load(f)
+            duration = line_timestamps[-1]["end"] if line_timestamps else 0.0
+        return duration
+    
+    def process_lines_to_speech(self, lines, audio_filename="output_audio.mp3",
+                                timestamps_filename="output_timestamps.json", max_workers=4, **kwargs):
+        """
+        Synthesize each script line separately and in parallel, then stitch the results.
+        
+        Every line is its own (cached) request, so latency no longer grows with the script
+        length and a failed request only redoes that line. The line audio is concatenated
+        without re-encoding and the timestamps are rebuilt with one entry per line, which
+        matches create_video_control's one timestamp per video.
+        
+        Args:
+            lines (list): Line texts, in script order
+            audio_filename (str): Filename of the stitched audio
+            timestamps_filename (str): Filename of the stitched timestamps
+            max_workers (int): Maximum concurrent speech requests
+            **kwargs: Additional parameters for the speech generation
+            
+        Returns:
+            tuple: (audio_path, timestamps_path) - Paths to saved files
+        """
+        # Same filter as ScriptManager.extract_data(), so there is still one line per video
+        lines = [line.strip() for line in lines if has_speech(line)]
+        if not lines:
+            raise ValueError("No lines to synthesize")
+        
+        line_manager = self.line_manager()
+        results = [None] * len(lines)
+        
+        progress.phase("tts lines")
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(lines)))) as pool:
+            # Each task runs in a copy of the current context so its trace spans keep the session tags
+            futures = {
+                pool.submit(contextvars.copy_context().run, line_manager.synthesize_line, i, text, **kwargs): i
+                for i, text in enumerate(lines)
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                results[futures[future]] = future.result()
+                reporter = progress.current_reporter()
+                if reporter is not None:
+                    elapsed = time.time() - started
+                    reporter.frames(done, len(lines), done / elapsed if elapsed > 0 else None, report_fps=False)
+        print(f"Synthesized {len(lines)} lines with up to {max_workers} concurrent requests")
+        
+        return self.stitch_lines(lines, results, audio_filename, timestamps_filename)
+    
+    def stitch_lines(self, lines, results, audio_filename, timestamps_filename):
+        """
+        Concatenate the line audio with stream copy and build one timestamp entry per line.
+        
+        Returns:
+            tuple: (audio_path, timestamps_path) - Paths to saved files
+        """
+        progress.phase("stitch")
+        audio_path = os.path.join(self.output_dir, audio_filename)
+        timestamps_path = os.path.join(self.output_dir, timestamps_filename)
+        list_path = os.path.join(self.output_dir, "lines", "concat.txt")
+        
+        timestamps = []
+        offset = 0.0
+        text_offset = 0
+        with open(list_path, 'w') as f:
+            for text, (line_audio_path, line_timestamps_path) in zip(lines, results):
+                f.write(f"file '{os.path.abspath(line_audio_path)}'\n")
+                
+                # The audio length (not the last timestamp) is where the next line starts
+                duration = self.line_duration(line_audio_path, line_timestamps_path)
+                
+                timestamps.append({
+                    "start": offset,
+                    "end": offset + duration,
+                    "text": text + " ",
+                    "text_offset": text_offset
+                })
+                offset += duration
+                text_offset += len(text) + 1
+        
+        run_ffmpeg(["-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", audio_path])
+        with open(timestamps_path, 'w') as f:
+            json.dump(timestamps, f, indent=2)
+        
+        print(f"Stitched {len(lines)} lines ({offset:.2f}s) into {audio_path}")
+        return audio_path, timestamps_path
 
 if __name__ == "__main__":
     audio_manager = AudioManager()
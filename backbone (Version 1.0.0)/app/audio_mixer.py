@@ -0,0 +1,208 @@
+"""
+Speech + music mixing on NumPy arrays.
+
+The speech and music are decoded to PCM once (the music library already keeps a PCM copy
+of every track), then the music gain, start offset, looping, trimming and speech-triggered
+ducking are applied as array operations and the mix is encoded to a single AAC track.
+"""
+import os
+import subprocess
+
+import numpy as np
+
+from app.ffmpeg_utils import get_ffmpeg_binary
+from app import tracing
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+AAC_BITRATE = "192k"
+
+# Ducking: the music is lowered by duck_db while the speech is louder than the threshold
+DUCK_THRESHOLD_DB = -40.0
+DUCK_WINDOW = 0.05    # Seconds per loudness window
+DUCK_ATTACK = 0.1     # Seconds the music takes to fade down (and back up)
+DUCK_RELEASE = 0.3    # Seconds the music stays down after the speech pauses
+
+def decode_audio(path, sample_rate=SAMPLE_RATE, channels=CHANNELS):
+    """
+    Decode the audio of a media file to PCM.
+
+    Returns:
+        np.ndarray: float32 samples in [-1, 1], shaped (frames, channels). Empty if the file has no audio.
+
+    Raises:
+        RuntimeError: If ffmpeg cannot read the file
+    """
+    cmd = [get_ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-i", str(path), "-vn",
+           "-f", "s16le", "-acodec", "pcm_s16le", "-ac", str(channels), "-ar", str(sample_rate), "pipe:1"]
+    with tracing.span("ffmpeg.decode_audio", "external", input=os.path.basename(str(path))):
+        result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        stderr = result.stderr.decode("utf-8", errors="replace").strip()
+        if "does not contain any stream" in stderr:
+            return np.zeros((0, channels), dtype=np.float32)
+        raise RuntimeError(f"ffmpeg exited with status {result.returncode}: {stderr}")
+    samples = np.frombuffer(result.stdout, dtype="<i2").reshape(-1, channels)
+    return samples.astype(np.float32) / 32768.0
+
+def pcm_duration(path, sample_rate=SAMPLE_RATE, channels=CHANNELS):
+    """Length in seconds of a raw s16le PCM file"""
+    return os.path.getsize(path) / (2 * channels * sample_rate)
+
+def load_pcm(path, start=0.0, duration=None, sample_rate=SAMPLE_RATE, channels=CHANNELS):
+    """
+    Read part of a raw s16le PCM file (e.g. the music library's copy) without reading the rest.
+
+    Returns:
+        np.ndarray: float32 samples in [-1, 1], shaped (frames, channels)
+    """
+    data = np.memmap(path, dtype="<i2", mode="r")
+    data = data[:data.size - data.size % channels].reshape(-1, channels)
+    first = int(round(start * sample_rate))
+    last = data.shape[0] if duration is None else first + int(round(duration * sample_rate))
+    return data[first:last].astype(np.float32) / 32768.0
+
+def fit_to_length(samples, frames):
+    """Loop or trim the samples to exactly the given number of frames"""
+    if samples.shape[0] == 0:
+        return np.zeros((frames, samples.shape[1]), dtype=np.float32)
+    if samples.shape[0] >= frames:
+        return samples[:frames]
+    # np.resize repeats the data from the start, which loops the track
+    return np.resize(samples, (frames, samples.shape[1]))
+
+def duck_envelope(speech, duck_db, sample_rate=SAMPLE_RATE, threshold_db=DUCK_THRESHOLD_DB):
+    """
+    Music gain per sample that dips by duck_db wherever the speech is active.
+
+    The speech loudness is measured per window, active windows are held for the release
+    time, and the resulting gain steps are smoothed over the attack time.
+
+    Returns:
+        np.ndarray: float32 gains, one per speech frame
+    """
+    frames = speech.shape[0]
+    if frames == 0:
+        return np.ones(0, dtype=np.float32)
+    window = max(1, int(sample_rate * DUCK_WINDOW))
+    count = -(-frames // window)
+    mono = np.zeros(count * window, dtype=np.float32)
+    # Downmix with a matrix product (much faster than mean(axis=1) on interleaved frames)
+    mono[:frames] = speech @ np.full(speech.shape[1], 1.0 / speech.shape[1], dtype=np.float32)
+    windows = mono.reshape(count, window)
+    rms = np.sqrt(np.einsum("ij,ij->i", windows, windows) / window)
+    active = rms > 10 ** (threshold_db / 20)
+
+    # A window stays ducked if any window in the release time before it had speech
+    hold = max(1, int(round(DUCK_RELEASE / DUCK_WINDOW)))
+    active = np.convolve(active.astype(np.float32), np.ones(hold, dtype=np.float32))[:count] > 0
+
+    target = np.where(active, 10 ** (-abs(duck_db) / 20), 1.0).astype(np.float32)
+    ramp = max(1, int(round(DUCK_ATTACK / DUCK_WINDOW)))
+    if ramp > 1:
+        padded = np.pad(target, (ramp // 2, ramp - 1 - ramp // 2), mode="edge")
+        target = np.convolve(padded, np.ones(ramp, dtype=np.float32) / ramp, mode="valid")
+
+    # Ramp linearly from each window's gain to the next one's within the window
+    following = np.append(target[1:], target[-1])
+    steps = np.arange(window, dtype=np.float32) / window
+    return (target[:, None] + (following - target)[:, None] * steps[None, :]).ravel()[:frames]
+
+def mix(speech, music, duration, volume=100, start_time=0, duck_db=0, music_offset_applied=False,
+        sample_rate=SAMPLE_RATE):
+    """
+    Mix the music under the speech.
+
+    Args:
+        speech (np.ndarray): Speech samples, shaped (frames, channels)
+        music (np.ndarray): Music samples, shaped (frames, channels), or None for speech only
+        duration (float): Length of the mix in seconds
+        volume (int): Music volume in percent
+        start_time (float): Seconds into the music to start from (ignored if past its end)
+        duck_db (float): How far the music is lowered under speech, 0 to disable
+        music_offset_applied (bool): Whether the music was already read from start_time on
+
+    Returns:
+        np.ndarray: float32 mix, shaped (frames, channels)
+    """
+    frames = int(round(duration * sample_rate))
+    channels = speech.shape[1] if speech.ndim == 2 else CHANNELS
+    # Silence (not a loop) after the end of the speech
+    output = np.zeros((frames, channels), dtype=np.float32)
+    output[:min(frames, speech.shape[0])] = speech[:frames]
+
+    if music is not None and music.shape[0]:
+        if not music_offset_applied and start_time > 0:
+            offset = int(round(start_time * sample_rate))
+            if offset < music.shape[0]:
+                music = music[offset:]
+            else:
+                print(f"Warning: Start time ({start_time}s) exceeds music duration "
+                      f"({music.shape[0] / sample_rate:.2f}s). Using from the beginning.")
+        music = fit_to_length(music, frames) * np.float32(volume / 100.0)
+        if duck_db:
+            music *= duck_envelope(output, duck_db, sample_rate)[:, None]
+        output += music
+
+    np.clip(output, -1.0, 1.0, out=output)
+    return output
+
+def write_aac(samples, output_path, sample_rate=SAMPLE_RATE, bitrate=AAC_BITRATE):
+    """Encode the samples to an AAC (.m4a) file"""
+    channels = samples.shape[1]
+    pcm = (samples * 32767).astype("<i2").tobytes()
+    cmd = [get_ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y",
+           "-f", "s16le", "-ar", str(sample_rate), "-ac", str(channels), "-i", "pipe:0",
+           "-c:a", "aac", "-b:a", bitrate, str(output_path)]
+    with tracing.span("ffmpeg.encode_aac", "external", output=os.path.basename(str(output_path))):
+        result = subprocess.run(cmd, input=pcm, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with status {result.returncode}: "
+                           f"{result.stderr.decode('utf-8', errors='replace').strip()}")
+    return str(output_path)
+
+@tracing.traced("audio_mixer.mix_to_file")
+def mix_to_file(speech_path, output_path, duration, music=None):
+    """
+    Decode the speech and the music, mix them and write one AAC track.
+
+    Args:
+        speech_path (str): Speech audio (or a video whose audio track is the speech)
+        output_path (str): Where the AAC track is written
+        duration (float): Length of the mix in seconds
+        music (Music, optional): Music instance whose track has been fetched with get_music()
+
+    Returns:
+        str: Path to the AAC track
+    """
+    speech = decode_audio(speech_path)
+    if speech.shape[0] == 0:
+        print("Warning: No speech audio found. Using music only.")
+
+    music_samples = None
+    offset_applied = False
+    if music is not None:
+        if music.pcm_path is not None and music.pcm_path.exists():
+            try:
+                # Read only the part of the library's PCM copy that is played
+                start = music.start_time
+                if start > 0 and start >= pcm_duration(music.pcm_path):
+                    print(f"Warning: Start time ({start}s) exceeds music duration. Using from the beginning.")
+                    start = 0
+                music_samples = load_pcm(music.pcm_path, start=start, duration=duration)
+                offset_applied = True
+            except (OSError, ValueError) as e:
+                print(f"Error reading the music PCM copy ({e}). Decoding the track instead.")
+                music_samples = None
+        if music_samples is None:
+            if music.music_path.exists():
+                music_samples = decode_audio(music.music_path)
+            else:
+                print(f"Music file not found at {music.music_path}. Mixing without music.")
+
+    mixed = mix(speech, music_samples, duration,
+                volume=music.volume if music is not None else 100,
+                start_time=music.start_time if music is not None else 0,
+                duck_db=music.duck_db if music is not None else 0,
+                music_offset_applied=offset_applied)
+    return write_aac(mixed, output_path)
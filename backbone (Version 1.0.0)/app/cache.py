@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+class DiskCache:
+    """
+    Content-addressed on-disk cache shared by every session and worker process.
+
+    Each entry is a directory of files named by a key hash. Entries are written to a
+    temporary directory and renamed into place, so concurrent writers never expose a
+    half-written entry. Reads touch the entry so eviction removes the least recently
+    used entries once the cache grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes, evict_interval=60):
+        """
+        Args:
+            cache_dir (str): Directory that holds the cache entries
+            max_bytes (int): Size the cache is trimmed back to during eviction
+            evict_interval (int): Minimum seconds between two eviction scans in this process
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.evict_interval = evict_interval
+        self.last_evict = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts):
+        """Hash the parts that identify an entry into a cache key"""
+        payload = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def entry_path(self, key):
+        """Directory of an entry (fanned out by the first two key characters)"""
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key):
+        """
+        Look up an entry.
+
+        Returns:
+            str: Path to the entry directory, or None on a cache miss
+        """
+        path = self.entry_path(key)
+        if not os.path.isdir(path):
+            return None
+        try:
+            # Mark the entry as recently used
+            os.utime(path)
+        except OSError:
+            # Evicted by another process in the meantime
+            return None
+        return path
+
+    def remove(self, key):
+        """Delete an entry, if present (e.g. to replace it, since put() keeps an existing entry)"""
+        shutil.rmtree(self.entry_path(key), ignore_errors=True)
+
+    def put(self, key, files):
+        """
+        Store an entry.
+
+        Args:
+            key (str): Cache key from make_key()
+            files (dict): File name -> bytes, or file name -> path of a file to copy in
+
+        Returns:
+            str: Path to the entry directory
+        """
+        path = self.entry_path(key)
+        temp_path = os.path.join(self.cache_dir, ".tmp", uuid.uuid4().hex)
+        os.makedirs(temp_path)
+
+        try:
+            for name, content in files.items():
+                target = os.path.join(temp_path, name)
+                if isinstance(content, (bytes, bytearray)):
+                    with open(target, 'wb') as f:
+                        f.write(content)
+                else:
+                    shutil.copyfile(content, target)
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                os.rename(temp_path, path)
+            except OSError:
+                # Another process stored the same entry first; keep theirs
+                shutil.rmtree(temp_path, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            raise
+
+        if time.time() - self.last_evict > self.evict_interval:
+            self.evict()
+        return path
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        self.last_evict = time.time()
+        entries = []
+        total = 0
+
+        for fan_dir in os.listdir(self.cache_dir):
+            fan_path = os.path.join(self.cache_dir, fan_dir)
+            if fan_dir == ".tmp" or not os.path.isdir(fan_path):
+                continue
+            for key in os.listdir(fan_path):
+                path = os.path.join(fan_path, key)
+                try:
+                    size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+                    entries.append((os.stat(path).st_mtime, size, path))
+                    total += size
+                except OSError:
+                    continue
+
+        if total <= self.max_bytes:
+            return 0
+
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+
+        print(f"Evicted {removed} entries from {self.cache_dir}")
+        return removed
@@ -0,0 +1,234 @@
+from collections import OrderedDict
+import io
+import os
+
+import numpy as np
+
+from app.cache import DiskCache
+
+# Compiled caption timelines keyed by the control file content, shared by the caption
+# backends of every session and worker process
+TIMELINE_CACHE_DIR = "app/data/cache/captions"
+TIMELINE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+TIMELINE_MEMORY_MAX_ENTRIES = 64
+# Bump when the timing rules below change so stale timelines are not reused
+TIMELINE_VERSION = 1
+_timeline_memory = OrderedDict()
+_timeline_disk_cache = None
+
+# Style ids of the events (the caption backends map them to their own styles)
+STYLE_CAPTION = 0
+
+# Timing rules
+MIN_WORD_DURATION = 0.15        # Shortest time a word (or lone punctuation mark) is shown
+MIN_DISPLAY_DURATION = 0.1      # Shortest time a word cut at a clip boundary is shown
+BOUNDARY_TOLERANCE = 0.01       # Segments starting this close to a clip change start a new clip
+INITIAL_DELAY = 0.3             # Delay of the first word of the video
+CLIP_CHANGE_DELAY = 0.4         # Delay of the first word after a clip change
+LEAD_TIME = 0.1                 # Other segments start this much earlier than their speech
+END_OF_CLIP_BUFFER = 0.5        # Time cut from the last segment before a clip change
+FIRST_TRANSITION_BUFFER = 0.7   # Time cut from the last segment before the first clip change
+BOUNDARY_MARGIN = 0.2           # Words cut at a clip boundary end this long before it
+END_OF_CLIP_TIME_FACTOR = 0.8   # Share of a segment used by its words before a clip change
+TIME_FACTOR = 0.9               # Share of a segment used by its words otherwise
+
+def get_timeline_disk_cache():
+    """Create the on-disk timeline cache on first use"""
+    global _timeline_disk_cache
+    if _timeline_disk_cache is None:
+        _timeline_disk_cache = DiskCache(TIMELINE_CACHE_DIR, TIMELINE_CACHE_MAX_BYTES)
+    return _timeline_disk_cache
+
+class CaptionTimeline:
+    """
+    Caption events as a compact table sorted by start time: one row per word with its
+    text, start, end and style id. The caption backends (MoviePy clips, ASS file) only
+    read rows from it.
+    """
+
+    def __init__(self, words, starts, ends, styles):
+        self.words = list(words)
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        self.styles = np.asarray(styles, dtype=np.int16)
+
+    def __len__(self):
+        return len(self.words)
+
+    def rows(self):
+        """(word, start, end, style id) tuples in display order"""
+        return zip(self.words, self.starts.tolist(), self.ends.tolist(), self.styles.tolist())
+
+    def events(self):
+        """(word, start, duration) tuples in display order"""
+        return [(word, start, end - start) for word, start, end, _ in self.rows()]
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        np.savez(buffer, words=np.array(self.words, dtype=str), starts=self.starts,
+                 ends=self.ends, styles=self.styles)
+        return buffer.getvalue()
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as table:
+            return cls(table["words"].tolist(), table["starts"], table["ends"], table["styles"])
+
+def _near_any(values, sorted_points):
+    """For each value, whether a point lies within BOUNDARY_TOLERANCE of it"""
+    if sorted_points.size == 0:
+        return np.zeros(values.shape, dtype=bool)
+    index = np.searchsorted(sorted_points, values)
+    below = sorted_points[np.clip(index - 1, 0, sorted_points.size - 1)]
+    above = sorted_points[np.clip(index, 0, sorted_points.size - 1)]
+    return np.minimum(np.abs(values - below), np.abs(values - above)) < BOUNDARY_TOLERANCE
+
+def _segment_exclusive_cumsum(values, first_index, segment_index):
+    """Running sum of values within each segment, excluding the value itself"""
+    inclusive = np.cumsum(values)
+    exclusive = inclusive - values
+    return exclusive - exclusive[first_index][segment_index]
+
+def _last_crossed_boundary(word_starts, word_ends, boundaries):
+    """
+    Index of the last boundary (in list order) strictly inside each word's display
+    time, or -1 when the word crosses none.
+    """
+    if boundaries.size == 0:
+        return np.full(word_starts.shape, -1)
+    if np.all(np.diff(boundaries) >= 0):
+        # Clip changes are in time order: the last boundary before the word's end
+        index = np.searchsorted(boundaries, word_ends, side="left") - 1
+        crossed = (index >= 0) & (boundaries[np.maximum(index, 0)] > word_starts)
+        return np.where(crossed, index, -1)
+    crossed = (word_starts[:, None] < boundaries[None, :]) & (boundaries[None, :] < word_ends[:, None])
+    last = boundaries.size - 1 - np.argmax(crossed[:, ::-1], axis=1)
+    return np.where(crossed.any(axis=1), last, -1)
+
+def compile_timeline(segments):
+    """
+    Turn the video control segments into a caption timeline in one pass.
+
+    Each segment's words share the segment's speech time in proportion to their length
+    (at least MIN_WORD_DURATION each). Captions start slightly after the first clip and
+    after every clip change, the last segment before a clip change is shortened, and no
+    word is shown across a clip change.
+
+    Args:
+        segments (list): Video control entries with start, end, text and video_path
+
+    Returns:
+        CaptionTimeline: The caption events
+    """
+    if not segments:
+        return CaptionTimeline([], [], [], [])
+
+    count = len(segments)
+    seg_starts = np.array([segment["start"] for segment in segments], dtype=np.float64)
+    seg_ends = np.array([segment["end"] for segment in segments], dtype=np.float64)
+    videos = [segment.get("video_path", "") for segment in segments]
+
+    # Clip boundaries: starts of the segments showing a different video than the previous one
+    changed = np.array([videos[i] != videos[i - 1] for i in range(1, count)], dtype=bool)
+    boundaries = seg_starts[1:][changed]
+    starts_at_boundary = _near_any(seg_starts, np.sort(boundaries))
+
+    # The last segment before a clip change is the one followed by a segment starting at one
+    end_of_clip = np.zeros(count, dtype=bool)
+    end_of_clip[:-1] = starts_at_boundary[1:]
+    first_transition = boundaries[0] if boundaries.size and boundaries[0] else None
+    before_first_transition = np.zeros(count, dtype=bool)
+    if first_transition is not None:
+        before_first_transition[:-1] = np.abs(seg_starts[1:] - first_transition) < BOUNDARY_TOLERANCE
+
+    # Where each segment's first word starts
+    adjusted_starts = np.where(starts_at_boundary, seg_starts + CLIP_CHANGE_DELAY,
+                               np.maximum(0, seg_starts - LEAD_TIME))
+    adjusted_starts[0] = seg_starts[0] + INITIAL_DELAY
+
+    # Time the segment's words share
+    durations = seg_ends - seg_starts
+    buffers = np.where(before_first_transition, FIRST_TRANSITION_BUFFER, END_OF_CLIP_BUFFER)
+    durations = np.where(end_of_clip & (durations > buffers), durations - buffers, durations)
+    available = durations * np.where(end_of_clip, END_OF_CLIP_TIME_FACTOR, TIME_FACTOR)
+
+    # Flatten the words of every segment into one table
+    segment_words = [segment["text"].strip().split() for segment in segments]
+    counts = np.array([len(words) for words in segment_words])
+    words = [word for words in segment_words for word in words]
+    if not words:
+        return CaptionTimeline([], [], [], [])
+    segment_index = np.repeat(np.arange(count), counts)
+    lengths = np.array([len(word) for word in words], dtype=np.float64)
+    last_index = np.cumsum(counts) - 1
+    first_index = last_index - counts + 1
+    is_first = np.zeros(len(words), dtype=bool)
+    is_last = np.zeros(len(words), dtype=bool)
+    is_first[first_index[counts > 0]] = True
+    is_last[last_index[counts > 0]] = True
+    # Segments without words point at their neighbour's slot, which the gather below never reads
+    first_index = np.minimum(first_index, len(words) - 1)
+
+    # Share the time by word length; once a segment's time runs out the remaining words get
+    # none, and the last word takes whatever is left
+    total_chars = np.bincount(segment_index, weights=lengths, minlength=count)
+    word_available = available[segment_index]
+    proposed = np.maximum(MIN_WORD_DURATION, word_available * lengths / total_chars[segment_index])
+    remaining = np.maximum(word_available - _segment_exclusive_cumsum(proposed, first_index, segment_index), 0)
+    remaining[is_first] = word_available[is_first]
+    word_durations = np.where(is_last, remaining, np.minimum(proposed, remaining))
+    # Lone punctuation marks and one-letter words get the minimum time
+    word_durations[lengths <= 1] = MIN_WORD_DURATION
+
+    word_starts = adjusted_starts[segment_index] + _segment_exclusive_cumsum(word_durations, first_index, segment_index)
+
+    # The last word before the first clip change ends well before it
+    if first_transition is not None:
+        latest_end = first_transition - BOUNDARY_MARGIN
+        trimmed = is_last & before_first_transition[segment_index] & (word_starts + word_durations > latest_end)
+        word_durations = np.where(trimmed, np.maximum(MIN_DISPLAY_DURATION, latest_end - word_starts), word_durations)
+
+    # Words that would run across a clip change are cut short before it
+    crossed = _last_crossed_boundary(word_starts, word_starts + word_durations, boundaries)
+    cut_ends = boundaries[np.maximum(crossed, 0)] - BOUNDARY_MARGIN if boundaries.size else word_starts
+    display_durations = np.where(crossed >= 0, np.maximum(MIN_DISPLAY_DURATION, cut_ends - word_starts), word_durations)
+
+    order = np.argsort(word_starts, kind="stable")
+    return CaptionTimeline(
+        [words[i] for i in order],
+        word_starts[order],
+        (word_starts + display_durations)[order],
+        np.full(len(words), STYLE_CAPTION, dtype=np.int16)
+    )
+
+def load_timeline(segments):
+    """
+    Get the caption timeline of the control segments, compiling it only when neither the
+    in-process LRU nor the on-disk cache has it for this control file content.
+    """
+    key = DiskCache.make_key("caption_timeline", TIMELINE_VERSION, segments)
+
+    timeline = _timeline_memory.get(key)
+    if timeline is not None:
+        _timeline_memory.move_to_end(key)
+        return timeline
+
+    disk_cache = get_timeline_disk_cache()
+    entry = disk_cache.get(key)
+    if entry is not None:
+        try:
+            timeline = CaptionTimeline.load(os.path.join(entry, "timeline.npz"))
+        except (OSError, ValueError, KeyError):
+            timeline = None
+
+    if timeline is None:
+        timeline = compile_timeline(segments)
+        try:
+            disk_cache.put(key, {"timeline.npz": timeline.to_bytes()})
+        except OSError as e:
+            print(f"Error caching caption timeline: {e}")
+
+    _timeline_memory[key] = timeline
+    if len(_timeline_memory) > TIMELINE_MEMORY_MAX_ENTRIES:
+        _timeline_memory.popitem(last=False)
+    return timeline
@@ -1,18 +1,50 @@
-from moviepy import VideoFileClip, TextClip, CompositeVideoClip
+from moviepy import VideoFileClip, TextClip, CompositeVideoClip, ImageClip
+from collections import OrderedDict
+from app.cache import DiskCache
+from app.caption_timeline import load_timeline, STYLE_CAPTION
+from app.ffmpeg_utils import run_ffmpeg, filter_path, probe_duration
+from app import progress
+from app import tracing
+import numpy as np
+import io
 import json
 import os
 import re
 
+# Rendered word sprites (RGBA arrays) shared by every CaptionAdder in this process,
+# backed by an on-disk cache shared across sessions and worker processes
+SPRITE_CACHE_DIR = "app/data/cache/sprites"
+SPRITE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+SPRITE_MEMORY_MAX_ENTRIES = 2048
+_sprite_memory = OrderedDict()
+_sprite_disk_cache = None
+
+# ASS style of each caption timeline style id
+ASS_STYLES = {STYLE_CAPTION: "Caption"}
+
+def get_sprite_disk_cache():
+    """Create the on-disk sprite cache on first use"""
+    global _sprite_disk_cache
+    if _sprite_disk_cache is None:
+        _sprite_disk_cache = DiskCache(SPRITE_CACHE_DIR, SPRITE_CACHE_MAX_BYTES)
+    return _sprite_disk_cache
+
 class CaptionAdder:
     def __init__(self, control_file_path, input_video_path="app/data/current/output_pre_captions.mp4",
                  output_video_path="app/data/current/output_with_captions.mp4",
-                 font_path="app/data/captions/fonts/Montserrat-ExtraBold.ttf", font_size=60, color="white"):
+                 font_path="app/data/captions/fonts/Montserrat-ExtraBold.ttf", font_size=60, color="white",
+                 stroke_color="black", stroke_width=3, backend="moviepy"):
         self.control_file_path = control_file_path
+        # "moviepy" composites a TextClip per word, "ass" burns an ASS subtitle file in with libass
+        self.backend = backend
         self.input_video_path = input_video_path
         self.output_video_path = output_video_path
         self.font = font_path if os.path.exists(font_path) else "Arial"
+        self.font_path = font_path
         self.font_size = font_size
         self.color = color
+        self.stroke_color = stroke_color
+        self.stroke_width = stroke_width
         self.segments = []
         
         # Ensure output directories exist
@@ -42,225 +74,247 @@ class CaptionAdder:
             print(f"Error loading control file: {e}")
             return False
     
-    def word_time_estimator(self, text, total_duration, is_end_of_clip=False):
+    def render_word_sprite(self, word):
+        """Render a word with the caption style and return it as an RGBA array"""
+        # Create the text clip with the required font parameter
+        # Using the documented parameter names from MoviePy v2
+        txt_clip = TextClip(
+            text=word,
+            font=self.font,  # Required parameter in v2
+            font_size=self.font_size,
+            color=self.color,
+            stroke_color=self.stroke_color,
+            stroke_width=self.stroke_width,
+            method="label",  # Default method
+            text_align="center"   # Text alignment within the clip
+        )
+        rgb = txt_clip.get_frame(0)
+        alpha = (txt_clip.mask.get_frame(0) * 255).astype(np.uint8)
+        txt_clip.close()
+        return np.dstack([rgb.astype(np.uint8), alpha])
+    
+    def word_sprite(self, word):
         """
-        Estimates the timing for each word based on its length and the total duration.
-        Longer words will get proportionally more time.
-        
-        Args:
-            text (str): The text to estimate timing for
-            total_duration (float): The total duration available for this text
-            is_end_of_clip (bool): Whether this is the last segment of a clip
+        Get the RGBA sprite of a word, keyed by (font, size, colour, stroke, text).
+        Looks in the in-process LRU first, then the shared on-disk cache, and only
+        renders the word with Pillow when neither has it.
         """
-        # Modified regex to keep apostrophes with words and handle punctuation better
-        # First split by whitespace to preserve words with apostrophes intact
-        raw_words = text.strip().split()
-        
-        # Process each raw word to handle punctuation correctly
-        words = []
-        for raw_word in raw_words:
-            # Check if word ends with punctuation
-            if raw_word and raw_word[-1] in '.,:;!?':
-                # If the word is just punctuation, add it as is
-                if len(raw_word) == 1:
-                    words.append(raw_word)
-                else:
-                    # Add the word with its punctuation attached
-                    words.append(raw_word)
-            else:
-                # Regular word without punctuation
-                words.append(raw_word)
-        
-        if not words:
-            return []
+        disk_cache = get_sprite_disk_cache()
+        key = DiskCache.make_key("word_sprite", self.font, self.font_size, self.color,
+                                 self.stroke_color, self.stroke_width, word)
         
-        # Calculate total characters (as a rough estimate of speaking time)
-        total_chars = sum(len(word) for word in words)
+        sprite = _sprite_memory.get(key)
+        if sprite is not None:
+            _sprite_memory.move_to_end(key)
+            return sprite
         
-        # Minimum duration for very short words (like "a", "I")
-        min_duration = 0.15
+        entry = disk_cache.get(key)
+        if entry is not None:
+            try:
+                sprite = np.load(os.path.join(entry, "sprite.npy"))
+            except (OSError, ValueError):
+                sprite = None
         
-        # Adjust total duration to account for silence at the end
-        # If this is the end of a clip, use more strict timing to ensure no overflow
-        # to the next clip (80% instead of 90% for regular segments)
-        time_factor = 0.8 if is_end_of_clip else 0.9
-        adjusted_duration = total_duration * time_factor
+        if sprite is None:
+            sprite = self.render_word_sprite(word)
+            buffer = io.BytesIO()
+            np.save(buffer, sprite)
+            disk_cache.put(key, {"sprite.npy": buffer.getvalue()})
         
-        # Allocate time proportionally to each word's length, with a minimum duration
-        word_durations = []
-        remaining_duration = adjusted_duration
-        
-        for i, word in enumerate(words):
-            # Last word gets all remaining time to ensure we match the adjusted duration
-            if i == len(words) - 1:
-                word_durations.append((word, remaining_duration))
-            else:
-                # Calculate proportional duration based on word length
-                char_ratio = len(word) / total_chars
-                word_duration = max(min_duration, adjusted_duration * char_ratio)
-                
-                # Ensure we don't exceed remaining time
-                word_duration = min(word_duration, remaining_duration)
-                remaining_duration -= word_duration
-                
-                word_durations.append((word, word_duration))
+        _sprite_memory[key] = sprite
+        if len(_sprite_memory) > SPRITE_MEMORY_MAX_ENTRIES:
+            _sprite_memory.popitem(last=False)
+        return sprite
+    
+    def caption_timeline(self):
+        """
+        Compile the loaded segments into the caption timeline (cached per control file content).
         
-        # For standalone punctuation, give minimum duration
-        word_durations = [(word, dur if len(word) > 1 else min_duration) 
-                          for word, dur in word_durations]
+        Returns:
+            CaptionTimeline: Caption events sorted by start time
+        """
+        if not self.segments:
+            print("No segments loaded. Call load_control_file() first.")
+        timeline = load_timeline(self.segments)
+        print(f"Caption timeline: {len(timeline)} words from {len(self.segments)} segments")
+        return timeline
+    
+    def compute_word_events(self):
+        """
+        Work out when each caption word is shown.
         
-        return word_durations
+        Returns:
+            list: (word, start, duration) tuples in display order
+        """
+        return self.caption_timeline().events()
     
+    @tracing.traced("CaptionAdder.create_word_clips")
     def create_word_clips(self, video_size):
         """Create a list of TextClips for each word with correct timing"""
-        if not self.segments:
-            print("No segments loaded. Call load_control_file() first.")
-            return []
-        
         all_clips = []
-        video_width, video_height = video_size
-        
-        # Process segments and identify clip boundaries
-        clip_boundaries = []
-        prev_video_path = None
-        
-        for segment in self.segments:
-            current_video_path = segment.get("video_path", "")
-            if current_video_path != prev_video_path and prev_video_path is not None:
-                clip_boundaries.append(segment["start"])
-            prev_video_path = current_video_path
         
-        print(f"Detected clip transitions at: {clip_boundaries}")
-        
-        # Special handling for first-to-second clip transition
-        first_clip_transition = None
-        if clip_boundaries:
-            first_clip_transition = clip_boundaries[0]
-            print(f"First clip transition detected at: {first_clip_transition}")
-        
-        for i, segment in enumerate(self.segments):
-            start_time = segment["start"]
-            end_time = segment["end"]
-            text = segment["text"]
-            duration = end_time - start_time
-            
-            # Check if this segment is the last one before a clip change
-            is_end_of_clip = False
-            for boundary in clip_boundaries:
-                # If the next segment would start at a clip boundary
-                if i < len(self.segments) - 1 and abs(self.segments[i+1]["start"] - boundary) < 0.01:
-                    is_end_of_clip = True
-                    print(f"Segment {i+1} is the last one before clip change at {boundary}")
-                    break
-            
-            # Special handling for the last segment before first clip transition
-            is_last_before_first_transition = first_clip_transition and i < len(self.segments) - 1 and abs(self.segments[i+1]["start"] - first_clip_transition) < 0.01
-            if is_last_before_first_transition:
-                print(f"Segment {i+1} is the last one before FIRST clip transition")
-            
-            # Adjust timing based on position
-            if i == 0:  # First segment
-                # Add a slight delay at the beginning of the video
-                initial_delay = 0.3  # Reduced from 0.4 to 0.3 seconds
-                adjusted_start = start_time + initial_delay
-                print(f"First segment: Adding {initial_delay}s delay")
-            else:
-                # For clip transitions, be more careful with timing
-                if any(abs(start_time - boundary) < 0.01 for boundary in clip_boundaries):
-                    # This is the first segment after a clip change
-                    timing_offset = 0.4  # Increased delay after clip change from 0.3 to 0.4
-                    adjusted_start = start_time + timing_offset
-                    print(f"Segment {i+1}: First after clip change, adding {timing_offset}s delay")
-                else:
-                    # Regular segment, start slightly earlier
-                    timing_offset = 0.1  # Reduced from 0.2 to 0.1 seconds
-                    adjusted_start = max(0, start_time - timing_offset)
-                    print(f"Segment {i+1}: Regular segment, starting {timing_offset}s earlier")
-            
-            # For the last segment before a clip change, shorten duration to avoid overlap
-            segment_duration = duration
-            if is_end_of_clip:
-                # Use a larger buffer for the first clip transition
-                buffer_time = 0.7 if is_last_before_first_transition else 0.5  # Increased buffer for first transition
-                if duration > buffer_time:
-                    segment_duration = duration - buffer_time
-                    print(f"Reducing segment {i+1} duration by {buffer_time}s to avoid overlap with next clip")
-            
-            # Get word timing estimates
-            word_timings = self.word_time_estimator(text, segment_duration, is_end_of_clip)
-            
-            # Create a clip for each word
-            segment_start = adjusted_start
-            for j, (word, word_duration) in enumerate(word_timings):
+        for word, start, end, style in self.caption_timeline().rows():
+            duration = end - start
+            try:
+                # Get the rendered word from the sprite cache (renders it on a miss)
+                txt_clip = ImageClip(self.word_sprite(word), transparent=True)
+                
+                # In MoviePy v2, use with_position and with_start/with_duration instead of set_*
+                txt_clip = txt_clip.with_position("center")
+                txt_clip = txt_clip.with_start(start)
+                txt_clip = txt_clip.with_duration(duration)
+                
+                print(f"Created clip for word '{word}', starts at {start:.2f}s, duration: {duration:.2f}s")
+                all_clips.append(txt_clip)
+                
+            except Exception as e:
+                print(f"Error creating text clip for word '{word}': {e}")
+                # Try fallback with just the minimal required parameters
                 try:
-                    # Special handling for last word of last segment before first clip transition
-                    if is_last_before_first_transition and j == len(word_timings) - 1:
-                        # Ensure the last word of the first clip ends well before the transition
-                        # by reducing its duration and ensuring it ends before the clip boundary
-                        safety_margin = 0.2  # Additional safety margin for the last word
-                        if segment_start + word_duration > first_clip_transition - safety_margin:
-                            word_duration = max(0.1, first_clip_transition - segment_start - safety_margin)
-                            print(f"Special handling: Reducing last word '{word}' duration of first clip to {word_duration:.2f}s")
-                    
-                    # Create the text clip with the required font parameter
-                    # Using the documented parameter names from MoviePy v2
                     txt_clip = TextClip(
                         text=word,
-                        font=self.font,  # Required parameter in v2
-                        font_size=self.font_size,
-                        color=self.color,
-                        stroke_color="black",
-                        stroke_width=3,
-                        method="label",  # Default method
-                        text_align="center"   # Text alignment within the clip
+                        font="Arial",  # Use a standard system font as fallback
+                        font_size=self.font_size
                     )
                     
-                    # In MoviePy v2, use with_position and with_start/with_duration instead of set_*
+                    # Also use with_* methods in the fallback
                     txt_clip = txt_clip.with_position("center")
-                    txt_clip = txt_clip.with_start(segment_start)
-                    txt_clip = txt_clip.with_duration(word_duration)
-                    
-                    # Ensure this word doesn't cross over a clip boundary
-                    for boundary in clip_boundaries:
-                        if segment_start < boundary < segment_start + word_duration:
-                            # This word would cross a clip boundary, cut it short
-                            new_duration = max(0.1, boundary - segment_start - 0.2)  # End 0.2s before boundary (increased from 0.1)
-                            txt_clip = txt_clip.with_duration(new_duration)
-                            print(f"Cutting word '{word}' short to avoid crossing clip boundary")
+                    txt_clip = txt_clip.with_start(start)
+                    txt_clip = txt_clip.with_duration(duration)
                     
-                    print(f"Created clip for word '{word}', starts at {segment_start:.2f}s, duration: {word_duration:.2f}s")
                     all_clips.append(txt_clip)
-                    
-                except Exception as e:
-                    print(f"Error creating text clip for word '{word}': {e}")
-                    # Try fallback with just the minimal required parameters
-                    try:
-                        txt_clip = TextClip(
-                            text=word,
-                            font="Arial",  # Use a standard system font as fallback
-                            font_size=self.font_size
-                        )
-                        
-                        # Also use with_* methods in the fallback
-                        txt_clip = txt_clip.with_position("center")
-                        txt_clip = txt_clip.with_start(segment_start)
-                        txt_clip = txt_clip.with_duration(word_duration)
-                        
-                        all_clips.append(txt_clip)
-                        print(f"Created fallback clip for word '{word}'")
-                    except Exception as e2:
-                        print(f"All attempts failed for word '{word}': {e2}")
-                
-                segment_start += word_duration
+                    print(f"Created fallback clip for word '{word}'")
+                except Exception as e2:
+                    print(f"All attempts failed for word '{word}': {e2}")
         
         print(f"Total clips created: {len(all_clips)}")
         return all_clips
     
+    def ass_colour(self, color):
+        """Convert a colour name or hex string to the ASS &HAABBGGRR format"""
+        from PIL import ImageColor
+        red, green, blue = ImageColor.getrgb(color)[:3]
+        return f"&H00{blue:02X}{green:02X}{red:02X}"
+    
+    def ass_font(self):
+        """
+        Return the (font name, font size) to use in the ASS style.
+        libass sizes text by the font's ascent + descent rather than its em size,
+        so the size is converted to render the same glyph height as the TextClips.
+        """
+        if self.font == "Arial":
+            return "Arial", self.font_size
+        try:
+            from PIL import ImageFont
+            font = ImageFont.truetype(self.font, self.font_size)
+            family, style = font.getname()
+            ascent, descent = font.getmetrics()
+            name = family if style in ("Regular", "Normal") or style in family else f"{family} {style}"
+            return name, ascent + descent
+        except Exception as e:
+            print(f"Could not read font metrics from {self.font}: {e}")
+            return os.path.splitext(os.path.basename(self.font))[0], self.font_size
+    
+    @tracing.traced("CaptionAdder.write_ass_file")
+    def write_ass_file(self, ass_path, video_size):
+        """
+        Write the word-by-word captions as an ASS subtitle file.
+        Uses the same caption timeline as create_word_clips() and the same styling
+        (font, colour, black stroke, centred on the frame).
+        
+        Args:
+            ass_path (str): Path where the subtitle file will be saved
+            video_size (tuple): (width, height) of the video the captions are burned into
+            
+        Returns:
+            str: Path to the subtitle file, or None if there are no captions
+        """
+        timeline = self.caption_timeline()
+        if not len(timeline):
+            print("No caption events were created.")
+            return None
+        
+        def timestamp(seconds):
+            centiseconds = int(round(max(0, seconds) * 100))
+            hours, centiseconds = divmod(centiseconds, 360000)
+            minutes, centiseconds = divmod(centiseconds, 6000)
+            secs, centiseconds = divmod(centiseconds, 100)
+            return f"{hours}:{minutes:02d}:{secs:02d}.{centiseconds:02d}"
+        
+        width, height = video_size
+        font_name, font_size = self.ass_font()
+        primary = self.ass_colour(self.color)
+        outline = self.ass_colour(self.stroke_color)
+        
+        lines = [
+            "[Script Info]",
+            "ScriptType: v4.00+",
+            f"PlayResX: {width}",
+            f"PlayResY: {height}",
+            "WrapStyle: 2",
+            "ScaledBorderAndShadow: yes",
+            "",
+            "[V4+ Styles]",
+            "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+            "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+            "Alignment, MarginL, MarginR, MarginV, Encoding",
+            # Alignment 5 centres the word on the frame like with_position("center")
+            f"Style: Caption,{font_name},{font_size},{primary},{primary},{outline},&H00000000,"
+            f"0,0,0,0,100,100,0,0,1,{self.stroke_width},0,5,0,0,0,1",
+            "",
+            "[Events]",
+            "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+        ]
+        # Pin every word to the centre so overlapping words are drawn on top of each
+        # other like the composited clips, instead of being stacked by libass
+        position = f"{{\\pos({width // 2},{height // 2})}}"
+        for word, start, end, style in timeline.rows():
+            # Braces and backslashes start override tags in ASS
+            text = word.replace("\\", "").replace("{", "(").replace("}", ")")
+            lines.append(f"Dialogue: 0,{timestamp(start)},{timestamp(end)},{ASS_STYLES[style]},,0,0,0,,{position}{text}")
+        
+        with open(ass_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        
+        print(f"Wrote {len(timeline)} caption events to {ass_path}")
+        return ass_path
+    
+    def subtitles_filter(self, ass_path):
+        """ffmpeg filter that burns the ASS file in, loading fonts from the caption font folder"""
+        font_dir = os.path.dirname(self.font_path) or "."
+        return f"subtitles=filename={filter_path(ass_path)}:fontsdir={filter_path(font_dir)}"
+    
+    @tracing.traced("CaptionAdder.add_captions_with_ass")
+    def add_captions_with_ass(self):
+        """Burn the captions into the video with ffmpeg's subtitles filter (libass)"""
+        from app.ffmpeg_utils import VIDEO_WIDTH, VIDEO_HEIGHT
+        ass_path = os.path.join(os.path.dirname(self.output_video_path), "captions.ass")
+        if not self.write_ass_file(ass_path, (VIDEO_WIDTH, VIDEO_HEIGHT)):
+            return False
+        
+        print(f"Burning captions into {self.input_video_path}")
+        run_ffmpeg([
+            "-i", self.input_video_path,
+            "-vf", self.subtitles_filter(ass_path),
+            "-c:v", "libx264",
+            "-pix_fmt", "yuv420p",
+            "-c:a", "copy",  # The speech track is unchanged
+            self.output_video_path
+        ], duration=probe_duration(self.input_video_path))
+        return self.output_video_path
+    
+    @tracing.traced("CaptionAdder.add_captions_to_video")
     def add_captions_to_video(self):
         """Add word-by-word captions to the video"""
         if not self.load_control_file():
             return False
         
+        if self.backend == "ass":
+            try:
+                return self.add_captions_with_ass()
+            except Exception as e:
+                print(f"Error burning ASS captions: {e}. Falling back to MoviePy...")
+        
         try:
             print(f"Loading video from {self.input_video_path}")
             video = VideoFileClip(self.input_video_path)
@@ -286,8 +340,9 @@ class CaptionAdder:
                 self.output_video_path,
                 codec="libx264",
                 audio_codec="aac",
-                temp_audiofile="temp-audio.m4a",
-                remove_temp=True
+                temp_audiofile=os.path.join(os.path.dirname(self.output_video_path), "temp-audio.m4a"),
+                remove_temp=True,
+                logger=progress.moviepy_logger()
             )
             
             # Close all clips to free resources
@@ -15,6 +15,8 @@ class Config:
             self.voice_data(action, data)
         elif object == 'user':
             self.user_data(action, data)
+        elif object == 'render':
+            self.render_data(action, data)
 
     def genres(self):
         """
@@ -61,8 +63,12 @@ class Config:
     def voice_data(self, action, data):
         self.voice_path = f"app/data/config/voice/voice_config.json"
         if action == 'update':
+            # Keep settings the update does not mention (e.g. mode, line_workers)
+            with open(self.voice_path, "r") as f:
+                voice_config = json.load(f)
+            voice_config.update(data)
             with open(self.voice_path, "w") as f:
-                json.dump(data, f)
+                json.dump(voice_config, f)
 
         with open(self.voice_path, "r") as f:
             self.data = json.load(f)
@@ -91,6 +97,21 @@ class Config:
 
         return self.data
                 
+    def render_data(self, action, data):
+        self.render_path = f"app/data/config/render/render_config.json"
+        if action == 'update':
+            # Keep settings the update does not mention (e.g. job_workers, speech_workers)
+            with open(self.render_path, "r") as f:
+                render_config = json.load(f)
+            render_config.update(data)
+            with open(self.render_path, "w") as f:
+                json.dump(render_config, f)
+
+        with open(self.render_path, "r") as f:
+            self.data = json.load(f)
+
+        return self.data
+                
     def update_training_data(self, action, data):
         data_dict = self.agent_training_data
 
@@ -4,6 +4,7 @@ import cloudinary.api
 import os
 from dotenv import load_dotenv
 import time
+from app import tracing
 
 # Load environment variables from .env file
 load_dotenv()
@@ -49,12 +50,13 @@ def upload_to_cloudinary(video_path):
         print(f"Uploading video from: {video_path}")
         
         # Upload the video to Cloudinary
-        result = cloudinary.uploader.upload(
-            video_path,
-            resource_type="video",
-            folder="webhook_videos",
-            overwrite=True
-        )
+        with tracing.span("cloudinary.upload", "external", bytes=os.path.getsize(video_path)):
+            result = cloudinary.uploader.upload(
+                video_path,
+                resource_type="video",
+                folder="webhook_videos",
+                overwrite=True
+            )
         
         # Get URLs from the result
         video_url = result['secure_url']
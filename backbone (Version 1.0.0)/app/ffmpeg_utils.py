@@ -0,0 +1,190 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+from app.progress import current_reporter
+from app import tracing
+
+# Output format shared by every render path (matches the gallery ingest format)
+VIDEO_WIDTH = 480
+VIDEO_HEIGHT = 854
+VIDEO_FPS = 24
+
+# Mezzanine format for gallery clips and re-encoded segments. Every file encoded with
+# these parameters starts on a keyframe, has a fixed one-second GOP and no B-frames,
+# so segments can be cut at any frame and concatenated with stream copy.
+MEZZANINE_VERSION = 1
+MEZZANINE_MANIFEST = "mezzanine.json"
+MEZZANINE_ARGS = [
+    "-c:v", "libx264",
+    "-preset", "veryfast",
+    "-crf", "18",
+    "-profile:v", "high",
+    "-pix_fmt", "yuv420p",
+    "-r", str(VIDEO_FPS),
+    "-g", str(VIDEO_FPS),
+    "-keyint_min", str(VIDEO_FPS),
+    "-sc_threshold", "0",
+    "-bf", "0",
+    "-x264-params", "repeat-headers=1",
+    "-video_track_timescale", str(VIDEO_FPS * 512),
+    "-an",
+]
+
+def get_ffmpeg_binary():
+    """
+    Return the ffmpeg executable to use.
+    Prefers the binary bundled with imageio-ffmpeg (installed with MoviePy) so the
+    subprocess engines use the same ffmpeg build as MoviePy does.
+    """
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return shutil.which("ffmpeg") or "ffmpeg"
+
+def run_ffmpeg(args, duration=None):
+    """
+    Run ffmpeg with the given arguments.
+
+    Args:
+        args (list): Arguments passed to ffmpeg after the global options
+        duration (float, optional): Length of the output in seconds. Inside a tracked stage
+            ffmpeg's -progress output is then reported as percent, fps and ETA.
+
+    Returns:
+        subprocess.CompletedProcess: The finished process
+
+    Raises:
+        RuntimeError: If ffmpeg exits with a non-zero status
+    """
+    cmd = [get_ffmpeg_binary(), "-hide_banner", "-loglevel", "error", "-y"]
+    args = [str(arg) for arg in args]
+    with tracing.span("ffmpeg", "external", output=os.path.basename(args[-1]) if args else None, duration=duration):
+        reporter = current_reporter()
+        if duration and reporter is not None:
+            return _run_ffmpeg_with_progress(cmd + ["-progress", "pipe:1", "-nostats"] + args, duration, reporter)
+
+        result = subprocess.run(cmd + args, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with status {result.returncode}: {result.stderr.strip()}")
+        return result
+
+def _run_ffmpeg_with_progress(cmd, duration, reporter):
+    """Run ffmpeg with -progress pipe:1 and forward its key=value blocks to the reporter"""
+    reporter.phase("encode")
+    with tempfile.TemporaryFile(mode="w+") as stderr_file:
+        # stderr goes to a file so a chatty ffmpeg can never block on a full pipe
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file, text=True)
+        block = {}
+        for line in process.stdout:
+            key, _, value = line.strip().partition("=")
+            block[key] = value
+            if key != "progress":
+                continue
+
+            # End of a progress block
+            out_time_us = block.get("out_time_us") or block.get("out_time_ms")  # Both are microseconds
+            speed = block.get("speed", "").rstrip("x")
+            try:
+                out_time = int(out_time_us) / 1_000_000
+            except (TypeError, ValueError):
+                out_time = 0.0
+            try:
+                fps = float(block.get("fps", 0))
+            except ValueError:
+                fps = 0.0
+            try:
+                eta = (duration - out_time) / float(speed)
+            except (ValueError, ZeroDivisionError):
+                eta = None
+            reporter.update(percent=round(min(100.0 * out_time / duration, 100.0), 1),
+                            fps=round(fps, 1) if fps else None,
+                            eta=round(max(eta, 0.0), 1) if eta is not None else None)
+            block = {}
+
+        returncode = process.wait()
+        stderr_file.seek(0)
+        stderr = stderr_file.read()
+
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with status {returncode}: {stderr.strip()}")
+    return subprocess.CompletedProcess(cmd, returncode, "", stderr)
+
+def remux_audio(video_path, audio_path, output_path, audio_args=("-c:a", "aac", "-b:a", "192k"), duration=None):
+    """
+    Replace the audio track of a video, copying the video stream as is.
+    Only the audio is (re-)encoded, so this takes seconds instead of a full video encode.
+
+    Args:
+        video_path (str): Video whose video stream is kept
+        audio_path (str): New audio track
+        output_path (str): Where the remuxed video is written
+        audio_args (tuple): Audio codec arguments (("-c:a", "copy") for an AAC track)
+        duration (float, optional): Length of the output, defaults to the video's length
+
+    Returns:
+        str: Path to the remuxed video
+    """
+    duration = duration or probe_duration(video_path)
+    run_ffmpeg([
+        "-i", video_path,
+        "-i", audio_path,
+        "-map", "0:v:0",
+        "-map", "1:a:0",
+        "-c:v", "copy",
+    ] + list(audio_args) + (["-t", f"{duration:.3f}"] if duration else []) + [
+        "-movflags", "+faststart",
+        output_path
+    ])
+    return output_path
+
+def fit_filter(width=VIDEO_WIDTH, height=VIDEO_HEIGHT, fps=VIDEO_FPS):
+    """Filter chain that letterboxes a stream to the output size and frame rate"""
+    return (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={fps}"
+    )
+
+def black_source(duration, width=VIDEO_WIDTH, height=VIDEO_HEIGHT, fps=VIDEO_FPS):
+    """Input arguments for a black lavfi source of the given duration"""
+    return ["-f", "lavfi", "-t", f"{duration:.3f}", "-i", f"color=c=black:s={width}x{height}:r={fps}"]
+
+def filter_path(path):
+    """Quote a file path for use as a filter option value (e.g. subtitles=filename=...)"""
+    path = str(path).replace("\\", "/").replace("'", "")
+    return "'" + path.replace(":", "\\:") + "'"
+
+def probe_duration(path):
+    """
+    Return the duration of a media file in seconds, or None if it cannot be read.
+    Parses the ffmpeg banner so it works without ffprobe (imageio-ffmpeg only ships ffmpeg).
+    """
+    cmd = [get_ffmpeg_binary(), "-hide_banner", "-i", str(path)]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    match = re.search(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)", result.stderr)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+def read_mezzanine_manifest(gallery_path):
+    """Load the mezzanine manifest of a gallery folder (video name -> clip info)"""
+    manifest_path = os.path.join(gallery_path, MEZZANINE_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        print(f"Error reading {manifest_path}, ignoring mezzanine manifest")
+        return {}
+
+def write_mezzanine_manifest(gallery_path, manifest):
+    """Save the mezzanine manifest of a gallery folder"""
+    manifest_path = os.path.join(gallery_path, MEZZANINE_MANIFEST)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=4)
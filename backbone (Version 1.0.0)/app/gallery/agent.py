@@ -1,6 +1,7 @@
 from app.gallery.config import GalleryConfig
 from openai import OpenAI
 from app.gallery.landmark_service import landmark_pipeline
+from app import tracing
 
 class Agent:
     def __init__(self, genre: str):
@@ -66,11 +67,12 @@ class Agent:
             {"role": "developer", "content": self.developer_prompt},
             {"role": "user", "content": prompt}
         ]
-        completion = self.client.chat.completions.create(
-        model="o3-mini",
-        messages=messages,
-        tools=self.load_tools()
-        )
+        with tracing.span("openai.chat.completions.create", "external", model="o3-mini", round=1):
+            completion = self.client.chat.completions.create(
+            model="o3-mini",
+            messages=messages,
+            tools=self.load_tools()
+            )
 
         if completion.choices[0].message.tool_calls:
             for tool_call in completion.choices[0].message.tool_calls:
@@ -84,11 +86,12 @@ class Agent:
                         "tool_call_id": tool_call.id,
                         "content": str(landmark_dict)
                     })
-                    completion_2 = self.client.chat.completions.create(
-                        model="o3-mini",
-                        messages=messages,
-                        tools=self.load_tools()
-                    )
+                    with tracing.span("openai.chat.completions.create", "external", model="o3-mini", round=2):
+                        completion_2 = self.client.chat.completions.create(
+                            model="o3-mini",
+                            messages=messages,
+                            tools=self.load_tools()
+                        )
                     return completion_2.choices[0].message.content
                 
         return completion.choices[0].message.content
@@ -4,6 +4,10 @@ import requests
 import subprocess
 import sys
 import shutil
+from app.ffmpeg_utils import (MEZZANINE_ARGS, MEZZANINE_VERSION, VIDEO_FPS, fit_filter, get_ffmpeg_binary,
+                              probe_duration, read_mezzanine_manifest, write_mezzanine_manifest)
+from app.retrieval import read_clip_descriptions, write_clip_descriptions
+from app import tracing
 class GalleryConfig:
     def __init__(self, genre: str):
         self.genre = genre
@@ -113,9 +117,27 @@ class GalleryConfig:
             except Exception as e:
                 print(f"Error updating screenshot.json: {str(e)}")
             
+        # Remove the entry from the mezzanine manifest if it exists
+        manifest = read_mezzanine_manifest(self.gallery_path)
+        if video_name in manifest:
+            del manifest[video_name]
+            write_mezzanine_manifest(self.gallery_path, manifest)
+            
+        # Remove the clip description if it exists
+        descriptions = read_clip_descriptions(self.gallery_path)
+        if video_name in descriptions:
+            del descriptions[video_name]
+            write_clip_descriptions(self.gallery_path, descriptions)
+            
         # Update the video list 
         self.update_video_list()
     
+    def set_description(self, video_name: str, description: str):
+        """Record what a clip shows, so the script agent's clip retrieval can match it"""
+        descriptions = read_clip_descriptions(self.gallery_path)
+        descriptions[video_name] = description
+        write_clip_descriptions(self.gallery_path, descriptions)
+    
     def add_video(self, video_name: str, video_url: str):
 
 
@@ -180,24 +202,15 @@ class GalleryConfig:
             
             # Execute the download command
             print(f"Downloading video from {video_url}...")
-            subprocess.run(download_command, check=True)
+            with tracing.span("yt-dlp.download_video", "external", url=video_url):
+                subprocess.run(download_command, check=True)
             
             print(f"Successfully downloaded video to {temp_video_path}")
             
-            # Now convert/resize the video to exactly 480x854 with ffmpeg
-            print(f"Converting video to 480x854 resolution...")
-            convert_command = [
-                "ffmpeg",
-                "-i", temp_video_path,
-                "-vf", "scale=480:854:force_original_aspect_ratio=decrease,pad=480:854:(ow-iw)/2:(oh-ih)/2",
-                "-c:v", "h264",
-                "-c:a", "aac",
-                "-y",  # Overwrite output file if it exists
-                video_path
-            ]
-            
-            subprocess.run(convert_command, check=True)
-            print(f"Successfully converted video to 480x854 resolution: {video_path}")
+            # Now convert/resize the video to the 480x854 mezzanine format with ffmpeg
+            print(f"Converting video to 480x854 mezzanine format...")
+            self.transcode_to_mezzanine(temp_video_path, video_path)
+            print(f"Successfully converted video to 480x854 mezzanine format: {video_path}")
             
             # Remove the temporary file
             if os.path.exists(temp_video_path):
@@ -213,6 +226,71 @@ class GalleryConfig:
         except Exception as e:
             print(f"Unexpected error processing video: {str(e)}")
 
+    def transcode_to_mezzanine(self, source_path, video_path):
+        """
+        Transcode a clip to the mezzanine format (480x854, fixed fps, fixed one-second GOP,
+        no B-frames) and record it in the gallery's mezzanine manifest.
+        VideoMerger's copy engine cuts and concatenates recorded clips without re-encoding.
+        
+        Args:
+            source_path: Path to the clip to transcode
+            video_path: Path where the mezzanine clip will be saved
+        """
+        convert_command = [
+            get_ffmpeg_binary(),
+            "-i", source_path,
+            "-vf", fit_filter(),
+        ] + MEZZANINE_ARGS + [
+            "-y",  # Overwrite output file if it exists
+            video_path
+        ]
+        with tracing.span("ffmpeg.transcode_to_mezzanine", "external", source=os.path.basename(source_path)):
+            subprocess.run(convert_command, check=True)
+        
+        duration = probe_duration(video_path)
+        if duration is None:
+            print(f"Warning: Could not read the duration of {video_path}. It will be re-encoded when merged.")
+            return
+        
+        manifest = read_mezzanine_manifest(self.gallery_path)
+        manifest[os.path.basename(video_path)] = {
+            "version": MEZZANINE_VERSION,
+            "fps": VIDEO_FPS,
+            "frames": int(round(duration * VIDEO_FPS))
+        }
+        write_mezzanine_manifest(self.gallery_path, manifest)
+    
+    def convert_gallery_to_mezzanine(self):
+        """
+        Re-encode every clip of the gallery that is not yet in the current mezzanine format.
+        Used to migrate galleries that were ingested before the mezzanine format existed.
+        """
+        manifest = read_mezzanine_manifest(self.gallery_path)
+        video_files = [f for f in os.listdir(self.gallery_path) if f.endswith('.mp4')]
+        converted = 0
+        
+        for video_name in sorted(video_files):
+            entry = manifest.get(video_name)
+            if entry and entry.get("version") == MEZZANINE_VERSION:
+                continue
+            
+            video_path = os.path.join(self.gallery_path, video_name)
+            temp_video_path = os.path.join(self.gallery_path, f"temp_{video_name}")
+            try:
+                print(f"Converting {video_name} to mezzanine format...")
+                shutil.move(video_path, temp_video_path)
+                self.transcode_to_mezzanine(temp_video_path, video_path)
+                os.remove(temp_video_path)
+                converted += 1
+            except subprocess.CalledProcessError as e:
+                print(f"Error converting {video_name}: {str(e)}")
+                # Keep the original clip if the conversion failed
+                if os.path.exists(temp_video_path):
+                    shutil.move(temp_video_path, video_path)
+        
+        print(f"Converted {converted} videos in {self.gallery_path} to mezzanine format")
+        return converted
+
     def landmark_clear(self):
         """Clear all files in the landmarks folder while preserving the folder itself."""
         landmarks_path = os.path.join("app", "gallery", "data", "landmarks")
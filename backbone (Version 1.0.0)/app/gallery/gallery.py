@@ -32,6 +32,9 @@ class Gallery:
     def delete_video(self, video_name: str):
         self.config.remove_video(video_name)
 
+    def convert_to_mezzanine(self):
+        return self.config.convert_gallery_to_mezzanine()
+
 
     def upload_pipeline(self, video_url: str, description: str):
         # Get the video name from the agent
@@ -48,6 +51,8 @@ class Gallery:
         genre_prefix = self.genre + '_'
         if not video_name.startswith(genre_prefix):
             video_name = genre_prefix + video_name
+        if description:
+            self.config.set_description(video_name, description)
             
         # Pass the correctly formatted name to screenshots pipeline
         self.screenshots_pipeline(video_name)
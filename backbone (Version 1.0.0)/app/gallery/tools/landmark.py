@@ -1,3 +1,5 @@
+from app import tracing
+
 def detect_landmarks(path, landmark_dict):
     """
     Detects landmarks in an image file using Google Cloud Vision API.
@@ -41,7 +43,8 @@ def detect_landmarks(path, landmark_dict):
 
     image = vision.Image(content=content)
     print('Getting landmarks')
-    response = client.landmark_detection(image=image)
+    with tracing.span("vision.landmark_detection", "external", bytes=len(content)):
+        response = client.landmark_detection(image=image)
     landmarks = response.landmark_annotations
     print('Landmarks detected: ' + str(landmarks))
 
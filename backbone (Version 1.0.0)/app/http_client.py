@@ -0,0 +1,55 @@
+import importlib.util
+import os
+import threading
+
+import httpx
+
+# One pooled client per process: keep-alive connections are reused across requests,
+# threads and sessions, and HTTP/2 is negotiated when the h2 package is installed
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+def get_http_client():
+    """
+    Return the process-wide pooled HTTP client.
+    A new client is created after a fork, since pooled sockets cannot be shared between processes.
+    """
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = httpx.Client(
+                http2=HTTP2_AVAILABLE,
+                timeout=httpx.Timeout(120.0, connect=10.0),
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=16),
+                follow_redirects=True
+            )
+            _client_pid = os.getpid()
+        return _client
+
+def download_to_file(url, path, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    Stream a URL to a file in chunks, so memory stays flat for large files.
+    Writes to a temporary file and renames it, so a failed download never leaves a partial file.
+
+    Returns:
+        int: Number of bytes written
+    """
+    temp_path = f"{path}.part"
+    written = 0
+    try:
+        with get_http_client().stream("GET", url) as response:
+            response.raise_for_status()
+            with open(temp_path, 'wb') as f:
+                for chunk in response.iter_bytes(chunk_size):
+                    f.write(chunk)
+                    written += len(chunk)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return written
@@ -0,0 +1,104 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import threading
+import time
+import traceback
+import uuid
+from app.tracing import run_with_tags
+
+class JobManager:
+    """
+    Runs blocking pipeline stages outside the API's event loop.
+
+    CPU-bound stages (video merging, captions, music, rendering) go to a process pool
+    so several renders can run at once; network-bound stages (speech) go to a thread pool.
+    Every submission is tracked as a job whose status can be polled.
+    """
+
+    def __init__(self, process_workers=2, thread_workers=8):
+        self.process_pool = ProcessPoolExecutor(max_workers=process_workers)
+        self.thread_pool = ThreadPoolExecutor(max_workers=thread_workers)
+        self.jobs = {}
+        self.futures = {}
+        self.lock = threading.Lock()
+        print(f"JobManager initialized with {process_workers} process workers and {thread_workers} thread workers")
+
+    def submit(self, session_id, stage, fn, *args, cpu=True, on_success=None, tags=None):
+        """
+        Queue a stage.
+
+        Args:
+            session_id (str): Session the job belongs to
+            stage (str): Name of the pipeline stage
+            fn (callable): Module-level function to run (must be picklable for the process pool)
+            *args: Arguments passed to fn
+            cpu (bool): Run in the process pool (True) or the thread pool (False)
+            on_success (callable, optional): Called with the result when the job succeeds
+            tags (dict, optional): Trace tags (genre, agent, segments) for the job's spans
+
+        Returns:
+            tuple: (job_id, concurrent.futures.Future)
+        """
+        job_id = str(uuid.uuid4())
+        with self.lock:
+            self.jobs[job_id] = {
+                "job_id": job_id,
+                "session_id": session_id,
+                "stage": stage,
+                "status": "queued",
+                "created_at": time.time(),
+                "finished_at": None,
+                "result": None,
+                "error": None
+            }
+
+        pool = self.process_pool if cpu else self.thread_pool
+        # Run inside a stage span; tags are passed explicitly since context does not cross processes
+        tags = dict(tags or {}, session_id=session_id, job_id=job_id)
+        future = pool.submit(run_with_tags, tags, stage, fn, *args)
+        self.futures[job_id] = future
+        future.add_done_callback(lambda done: self._finish(job_id, done, on_success))
+        print(f"Queued {stage} job {job_id} for session {session_id}")
+        return job_id, future
+
+    def _finish(self, job_id, future, on_success):
+        """Record the outcome of a finished job"""
+        error = future.exception()
+        result = None if error else future.result()
+
+        if error is None and on_success is not None:
+            try:
+                on_success(result)
+            except Exception as e:
+                traceback.print_exc()
+                error = e
+
+        with self.lock:
+            job = self.jobs[job_id]
+            job["finished_at"] = time.time()
+            if error is None:
+                job["status"] = "completed"
+                job["result"] = result.get("data") if isinstance(result, dict) else result
+            else:
+                job["status"] = "failed"
+                job["error"] = str(error)
+                print(f"{job['stage']} job {job_id} failed: {error}")
+            self.futures.pop(job_id, None)
+
+    def get_job(self, job_id):
+        """Get a copy of a job's status, or None if the job does not exist"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+
+        future = self.futures.get(job_id)
+        if job["status"] == "queued" and future is not None and future.running():
+            job["status"] = "running"
+        return job
+
+    def session_jobs(self, session_id):
+        """List the jobs of a session, oldest first"""
+        with self.lock:
+            job_ids = [job_id for job_id, job in self.jobs.items() if job["session_id"] == session_id]
+        return [self.get_job(job_id) for job_id in job_ids]
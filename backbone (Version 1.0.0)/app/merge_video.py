@@ -1,13 +1,237 @@
-from moviepy import VideoFileClip, concatenate_videoclips, TextClip, CompositeVideoClip, AudioFileClip
+from moviepy import VideoFileClip, VideoClip, concatenate_videoclips, TextClip, CompositeVideoClip, AudioFileClip, vfx
+from app.ffmpeg_utils import (run_ffmpeg, fit_filter, black_source, read_mezzanine_manifest, remux_audio,
+                              MEZZANINE_ARGS, MEZZANINE_VERSION, VIDEO_FPS)
+from app import progress
+from app import tracing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import contextvars
 import json
 import os
+import threading
+import time
+
+# Chunks already encoded in a chunk directory (chunk name -> video, frames, version), so the
+# copy and parallel engines reuse chunks encoded ahead of the merge (see ChunkPrefetcher)
+PREPARED_MANIFEST = "prepared.json"
+DEFAULT_VIDEO_DIRECTORY = "app/data/videos/cat"
+
+def video_directory_for(video_name):
+    """Gallery folder of a video, from the genre prefix of its name (e.g. cat_***.mp4 -> cat)"""
+    return f"app/data/videos/{video_name.split('_')[0]}"
+
+def chunk_name(index):
+    """Filename of a segment's chunk"""
+    return f"segment_{index:03d}.mp4"
+
+def read_prepared_chunks(chunk_dir):
+    """Load the prepared chunk manifest of a chunk directory"""
+    manifest_path = os.path.join(chunk_dir, PREPARED_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        print(f"Error reading {manifest_path}, ignoring prepared chunks")
+        return {}
+
+def write_prepared_chunks(chunk_dir, prepared):
+    """Save the prepared chunk manifest of a chunk directory"""
+    manifest_path = os.path.join(chunk_dir, PREPARED_MANIFEST)
+    temp_path = f"{manifest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(prepared, f, indent=2)
+    os.replace(temp_path, manifest_path)
+
+def prepared_entry(video, frames):
+    """Manifest entry of a chunk encoding `frames` frames of the video"""
+    return {"video": video, "frames": frames, "version": MEZZANINE_VERSION}
+
+def is_mezzanine(manifest, video, video_path):
+    """Whether the gallery clip can be stream-copied instead of encoded"""
+    info = manifest.get(video)
+    return bool(info and info.get("version") == MEZZANINE_VERSION and info.get("frames") and os.path.exists(video_path))
+
+class FrameCounter:
+    """
+    Frame count of each segment in order. Rounding is done on the running total, so
+    per-segment rounding never drifts from the audio.
+    """
+
+    def __init__(self):
+        self.elapsed = 0.0
+        self.emitted_frames = 0
+
+    def add(self, duration):
+        """Frames of the next segment"""
+        self.elapsed += duration
+        frames = int(round(self.elapsed * VIDEO_FPS)) - self.emitted_frames
+        self.emitted_frames += frames
+        return frames
+
+def render_segment_chunk(video_path, duration, output_path, threads=0):
+    """
+    Encode one segment (looped and trimmed to the duration) as a mezzanine chunk that
+    can be stream-copied next to mezzanine gallery clips. Missing videos become black.
+    Module-level so it can run in a ProcessPoolExecutor worker.
+    """
+    if video_path and os.path.exists(video_path):
+        input_args = ["-stream_loop", "-1", "-t", f"{duration:.3f}", "-i", video_path]
+    else:
+        input_args = black_source(duration)
+    
+    thread_args = ["-threads", threads] if threads else []
+    run_ffmpeg(input_args + [
+        "-vf", f"{fit_filter()},trim=duration={duration:.3f},setpts=PTS-STARTPTS",
+    ] + MEZZANINE_ARGS + thread_args + [output_path])
+    return output_path
+
+class LoopFrameCache:
+    """
+    Decoded playthroughs of looped clips, shared by every segment of a VideoMerger and
+    bounded by one byte budget. The least recently used buffers are dropped when a new
+    one does not fit; a segment whose buffer was dropped decodes it again when it next
+    needs a frame. Segments only hold the cache key, so a dropped buffer is really freed.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # Key -> (frames, bytes)
+        self.used_bytes = 0
+
+    def frames(self, key, size, load):
+        """Frames of a buffer, decoding them with load() (and evicting others) when missing"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry[0]
+        while self.entries and self.used_bytes + size > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.used_bytes -= evicted_size
+        frames = load()
+        self.entries[key] = (frames, size)
+        self.used_bytes += size
+        return frames
+
+    def clear(self):
+        self.entries.clear()
+        self.used_bytes = 0
+
+class ChunkPrefetcher:
+    """
+    Encodes segment chunks for the copy and parallel engines while the script and its
+    speech are still being generated.
+
+    A segment's frame count depends on the durations of every line before it, so a chunk
+    is submitted as soon as its video and the durations of all lines up to it are known.
+    Encoded chunks are recorded in the chunk directory's prepared manifest, where
+    plan_copy_segments() picks them up; a chunk whose video or length changed by merge
+    time is simply encoded again.
+    """
+
+    def __init__(self, chunk_dir, engine="copy", workers=1, chunk_threads=0):
+        self.chunk_dir = chunk_dir
+        self.copy_mezzanine = engine != "parallel"
+        self.chunk_threads = chunk_threads
+        self.videos = {}
+        self.durations = {}
+        self.next_index = 0      # First segment not submitted yet
+        self.offset = 0.0        # Start of that segment in the stitched speech
+        self.counter = FrameCounter()
+        self.video_directory = None
+        self.manifest = {}
+        self.prepared = read_prepared_chunks(chunk_dir)
+        self.lock = threading.Lock()
+        self.futures = []
+        os.makedirs(chunk_dir, exist_ok=True)
+        # ffmpeg does the work in subprocesses, so threads are enough to keep the workers busy
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers))
+
+    def add_video(self, index, video):
+        """Set the video of a segment (ignored once its chunk has been submitted)"""
+        with self.lock:
+            if index >= self.next_index:
+                self.videos[index] = video
+            self.submit_ready()
+
+    def add_duration(self, index, duration):
+        """Set the speech duration of a segment (ignored once its chunk has been submitted)"""
+        with self.lock:
+            if index >= self.next_index:
+                self.durations[index] = duration
+            self.submit_ready()
+
+    def submit_ready(self):
+        """Submit the chunks whose video and preceding durations are known. Call with the lock held."""
+        if self.video_directory is None:
+            if 0 not in self.videos:
+                return
+            # Same gallery folder VideoMerger derives from the first video
+            self.video_directory = video_directory_for(self.videos[0])
+            if self.copy_mezzanine:
+                self.manifest = read_mezzanine_manifest(self.video_directory)
+
+        while self.next_index in self.videos and self.next_index in self.durations:
+            index = self.next_index
+            video = self.videos.pop(index)
+            duration = self.durations.pop(index)
+            self.next_index += 1
+
+            # Same arithmetic as stitch_lines and plan_copy_segments, so the frame counts match
+            start, end = self.offset, self.offset + duration
+            self.offset += duration
+            frames = self.counter.add(end - start)
+            video_path = os.path.join(self.video_directory, video)
+            if frames <= 0 or is_mezzanine(self.manifest, video, video_path):
+                continue
+
+            name = chunk_name(index)
+            entry = prepared_entry(video, frames)
+            if self.prepared.get(name) == entry and os.path.exists(os.path.join(self.chunk_dir, name)):
+                continue
+            self.futures.append(self.pool.submit(
+                contextvars.copy_context().run, self.render, name, video_path, frames, entry
+            ))
+
+    def render(self, name, video_path, frames, entry):
+        """Encode one chunk and record it in the prepared manifest"""
+        try:
+            render_segment_chunk(video_path, frames / VIDEO_FPS, os.path.join(self.chunk_dir, name), self.chunk_threads)
+        except Exception as e:
+            # Not fatal: the merge encodes the chunk itself
+            print(f"Error preparing {name}: {e}")
+            return False
+        with self.lock:
+            self.prepared[name] = entry
+            write_prepared_chunks(self.chunk_dir, self.prepared)
+        return True
+
+    def close(self):
+        """
+        Wait for the submitted chunks.
+
+        Returns:
+            int: Number of chunks prepared
+        """
+        self.pool.shutdown(wait=True)
+        return sum(1 for future in self.futures if future.result())
 
 class VideoMerger:
     def __init__(self, video_control_path, video_directory=None, 
                  temp_output_path="app/data/current/output.mp4",
                  final_output_path="app/data/current/output_pre_captions.mp4",
-                 audio_path="app/data/current/output_audio.mp3"):
+                 audio_path="app/data/current/output_audio.mp3", engine="moviepy", loop_cache_mb=512,
+                 workers=1, chunk_threads=0):
         self.video_control_path = video_control_path
+        # "moviepy" composites frames in Python, "ffmpeg" runs one native filtergraph,
+        # "copy" stream-copies mezzanine gallery clips and only encodes the other segments,
+        # "parallel" encodes every segment as an independent chunk across a process pool
+        self.engine = engine
+        self.workers = workers  # Process pool size for chunk encodes
+        self.chunk_threads = chunk_threads  # Encoder threads per chunk (0 lets ffmpeg decide)
+        self.loop_cache_bytes = loop_cache_mb * 1024 * 1024  # Frame buffer budget shared by all looped clips
+        self.loop_frames = LoopFrameCache(self.loop_cache_bytes)
         # If video_directory not provided, determine from the video control file
         if video_directory is None:
             # Extract genre from first video filename in control file
@@ -15,15 +239,13 @@ class VideoMerger:
                 with open(video_control_path, 'r') as file:
                     segments = json.load(file)
                     if segments and 'video' in segments[0]:
-                        # Extract genre from first part of filename (e.g., cat_***.mp4 -> cat)
-                        genre = segments[0]['video'].split('_')[0]
-                        self.video_directory = f"app/data/videos/{genre}"
+                        self.video_directory = video_directory_for(segments[0]['video'])
                     else:
                         # Fallback to default
-                        self.video_directory = "app/data/videos/cat"
+                        self.video_directory = DEFAULT_VIDEO_DIRECTORY
             except Exception:
                 # Fallback to default
-                self.video_directory = "app/data/videos/cat"
+                self.video_directory = DEFAULT_VIDEO_DIRECTORY
         else:
             self.video_directory = video_directory
         self.temp_output_path = temp_output_path  # Path for the video-only output
@@ -41,6 +263,7 @@ class VideoMerger:
         print(f"Video control path: {self.video_control_path}")
         print(f"Audio path: {self.audio_path}")
         print(f"Final output path: {self.final_output_path}")
+        print(f"Merge engine: {self.engine} (workers: {self.workers}, threads per chunk: {self.chunk_threads})")
         
         # Load video control file
         self.load_control_file()
@@ -59,9 +282,11 @@ class VideoMerger:
             print(f"Error loading video control file: {e}")
             return False
             
+    @tracing.traced("VideoMerger.prepare_clips")
     def prepare_clips(self):
         """Load and trim each video clip according to timestamps"""
         self.clips = []
+        progress.phase("clip prep")
         
         for i, segment in enumerate(self.segments):
             video_path = os.path.join(self.video_directory, segment["video"])
@@ -91,6 +316,8 @@ class VideoMerger:
                 clip.duration = duration
                 print(f"  Set clip duration to: {clip.duration:.2f}s")
                 
+                clip.video_path = video_path
+                
                 # Add to our list of clips
                 self.clips.append(clip)
                 
@@ -108,6 +335,44 @@ class VideoMerger:
         print(f"Total clip duration: {total_duration:.2f} seconds")
         return len(self.clips) > 0
         
+    def loop_clip(self, clip, original_duration, required_duration):
+        """
+        Loop a clip that is shorter than its segment.
+        
+        One playthrough is decoded into the merger's shared frame cache and replayed from
+        there, so the source is decoded once rather than once per loop (and per segment,
+        when several segments show it). Segments render in order, so the single budget
+        holds whatever the number of looped segments. Playthroughs larger than the whole
+        budget are looped by time instead, which streams from the clip's reader.
+        """
+        fps = getattr(clip.reader, "fps", None) or clip.fps or VIDEO_FPS
+        width, height = clip.size
+        frame_count = max(1, int(original_duration * fps))
+        buffer_bytes = frame_count * width * height * 3
+        
+        def loop_by_time():
+            return clip.with_duration(original_duration).with_effects([vfx.Loop(duration=required_duration)])
+        
+        if buffer_bytes > self.loop_cache_bytes:
+            print(f"  Clip needs {buffer_bytes / 1024 / 1024:.0f} MB to buffer. Looping by time instead")
+            return loop_by_time()
+        
+        print(f"  Looping to {required_duration:.2f}s from original {original_duration:.2f}s with {frame_count} buffered frames")
+        key = (getattr(clip, "video_path", id(clip)), fps, width, height, frame_count)
+        source = clip.with_duration(original_duration)
+        
+        def load():
+            return list(source.iter_frames(fps=fps, dtype="uint8"))
+        
+        def frame_function(t):
+            frames = self.loop_frames.frames(key, buffer_bytes, load)
+            if not frames:
+                return source.get_frame(t % original_duration)
+            return frames[int(t * fps + 1e-6) % len(frames)]
+        
+        return VideoClip(frame_function=frame_function, duration=required_duration)
+    
+    @tracing.traced("VideoMerger.merge_videos")
     def merge_videos(self):
         """Concatenate all the clips into a final video"""
         if not self.clips:
@@ -117,10 +382,11 @@ class VideoMerger:
         try:
             # Process clips that need looping
             final_clips = []
+            self.loop_frames.clear()
             for clip in self.clips:
                 # If clip has the "needs_loop" attribute and it's True, we need to manually handle looping
                 if hasattr(clip, 'needs_loop') and clip.needs_loop:
-                    # Calculate how many times we need to loop the clip to reach the required duration
+                    # Get the length of one playthrough of the source
                     try:
                         # Try to get the original duration from reader
                         original_duration = clip.reader.duration
@@ -129,21 +395,8 @@ class VideoMerger:
                         print(f"  Could not access reader.duration: {e}")
                         original_duration = clip.duration  # Use the current duration as fallback
                     
-                    # Calculate how many times we need to loop
-                    required_duration = clip.duration
-                    loop_count = max(2, int(required_duration / original_duration) + 1)
-                    print(f"  Looping video {loop_count} times to reach {required_duration:.2f}s from original {original_duration:.2f}s")
-                    
-                    # Create multiple clips with the original duration
-                    loop_clips = []
-                    for _ in range(loop_count):
-                        loop_clip = VideoFileClip(clip.filename, audio=False)
-                        loop_clips.append(loop_clip)
-                    
-                    # Concatenate the loop clips
-                    looped_clip = concatenate_videoclips(loop_clips, method="compose")
-                    # Trim to exact duration needed
-                    looped_clip = looped_clip.subclip(0, clip.duration)
+                    # Loop the clip from one decoded playthrough, shared with the other segments of its source
+                    looped_clip = self.loop_clip(clip, original_duration, clip.duration)
                     final_clips.append(looped_clip)
                 else:
                     final_clips.append(clip)
@@ -163,6 +416,185 @@ class VideoMerger:
                 print(f"Fallback also failed: {e2}")
                 return None
             
+    def build_filtergraph(self):
+        """
+        Build the ffmpeg inputs and filtergraph that trim, loop, scale and concatenate
+        every segment, mirroring prepare_clips() and merge_videos().
+        
+        Returns:
+            tuple: (input_args, filtergraph, output_label)
+        """
+        input_args = []
+        filters = []
+        labels = []
+        
+        for i, segment in enumerate(self.segments):
+            video_path = os.path.join(self.video_directory, segment["video"])
+            duration = segment["end"] - segment["start"]
+            
+            if os.path.exists(video_path):
+                # Loop the input natively and stop reading once the segment is filled
+                input_args += ["-stream_loop", "-1", "-t", f"{duration:.3f}", "-i", video_path]
+            else:
+                # Same fallback as prepare_clips: a black clip keeps the timing intact
+                print(f"Video {segment['video']} not found. Using a blank clip as fallback for {duration} seconds")
+                input_args += black_source(duration)
+            
+            filters.append(f"[{i}:v]{fit_filter()},trim=duration={duration:.3f},setpts=PTS-STARTPTS[v{i}]")
+            labels.append(f"[v{i}]")
+        
+        filters.append(f"{''.join(labels)}concat=n={len(labels)}:v=1:a=0[outv]")
+        return input_args, ";".join(filters), "[outv]"
+    
+    @tracing.traced("VideoMerger.merge_videos_ffmpeg")
+    def merge_videos_ffmpeg(self):
+        """Merge the segments with a single ffmpeg filtergraph and save the video-only output"""
+        if not self.segments:
+            print("No segments to merge. Run load_control_file() first.")
+            return False
+            
+        try:
+            input_args, filtergraph, output_label = self.build_filtergraph()
+            duration = sum(segment["end"] - segment["start"] for segment in self.segments)
+            print(f"Saving video-only output to {self.temp_output_path} with the ffmpeg engine")
+            run_ffmpeg(input_args + [
+                "-filter_complex", filtergraph,
+                "-map", output_label,
+                "-c:v", "libx264",
+                "-pix_fmt", "yuv420p",
+                "-r", VIDEO_FPS,
+                "-an",  # No audio needed for this step
+                self.temp_output_path
+            ], duration=duration)
+            return True
+        except Exception as e:
+            print(f"Error merging videos with ffmpeg: {e}")
+            return False
+            
+    def plan_copy_segments(self, chunk_dir, copy_mezzanine=True):
+        """
+        Work out the concat list for the copy and parallel engines.
+        
+        Mezzanine clips (see GalleryConfig.transcode_to_mezzanine) start on a keyframe and have
+        no B-frames, so they are cut at any frame and looped by repeating the file, all with
+        stream copy. Segments whose clip is missing or not in mezzanine format (or every
+        segment, when copy_mezzanine is False) are encoded into mezzanine chunks, which
+        render_chunks() spreads over the process pool. Chunks the chunk directory's prepared
+        manifest already has for the same video and frame count are reused as they are.
+        
+        Returns:
+            list: (path, frames) entries, frames is None when the whole file is used
+        """
+        manifest = read_mezzanine_manifest(self.video_directory) if copy_mezzanine else {}
+        chunk_jobs = []
+        os.makedirs(chunk_dir, exist_ok=True)
+        prepared = read_prepared_chunks(chunk_dir)
+        rendered = {}
+        reused = 0
+        entries = []
+        counter = FrameCounter()
+        
+        for i, segment in enumerate(self.segments):
+            video_path = os.path.join(self.video_directory, segment["video"])
+            frames = counter.add(segment["end"] - segment["start"])
+            if frames <= 0:
+                continue
+            
+            if is_mezzanine(manifest, segment["video"], video_path):
+                info = manifest[segment["video"]]
+                remaining = frames
+                while remaining > info["frames"]:
+                    entries.append((video_path, None))
+                    remaining -= info["frames"]
+                entries.append((video_path, remaining))
+            else:
+                name = chunk_name(i)
+                chunk_path = os.path.join(chunk_dir, name)
+                entry = prepared_entry(segment["video"], frames)
+                if prepared.get(name) == entry and os.path.exists(chunk_path):
+                    reused += 1
+                else:
+                    chunk_jobs.append((video_path, frames / VIDEO_FPS, chunk_path))
+                    rendered[name] = entry
+                entries.append((chunk_path, None))
+        
+        if reused:
+            print(f"Reusing {reused} prepared segment chunks")
+        self.render_chunks(chunk_jobs)
+        if rendered:
+            prepared.update(rendered)
+            write_prepared_chunks(chunk_dir, prepared)
+        return entries
+    
+    @tracing.traced("VideoMerger.render_chunks")
+    def render_chunks(self, chunk_jobs):
+        """Encode segment chunks, in a ProcessPoolExecutor when more than one worker is configured"""
+        if not chunk_jobs:
+            return
+        
+        print(f"Encoding {len(chunk_jobs)} segment chunks with {self.workers} workers")
+        progress.phase("encode chunks")
+        total_frames = sum(round(duration * VIDEO_FPS) for _, duration, _ in chunk_jobs)
+        started = time.time()
+        done_frames = 0
+        
+        def chunk_done(duration):
+            # Report encoded frames across all chunks
+            nonlocal done_frames
+            done_frames += round(duration * VIDEO_FPS)
+            reporter = progress.current_reporter()
+            if reporter is not None:
+                elapsed = time.time() - started
+                reporter.frames(done_frames, total_frames, done_frames / elapsed if elapsed > 0 else None)
+        
+        if self.workers <= 1 or len(chunk_jobs) == 1:
+            for video_path, duration, chunk_path in chunk_jobs:
+                render_segment_chunk(video_path, duration, chunk_path, self.chunk_threads)
+                chunk_done(duration)
+            return
+        
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(chunk_jobs))) as pool:
+            futures = {
+                pool.submit(tracing.run_with_tags, tracing.current_tags(), "render_segment_chunk",
+                            render_segment_chunk, video_path, duration, chunk_path, self.chunk_threads): duration
+                for video_path, duration, chunk_path in chunk_jobs
+            }
+            # Raise the first failure, if any
+            for future in as_completed(futures):
+                future.result()
+                chunk_done(futures[future])
+    
+    @tracing.traced("VideoMerger.merge_videos_copy")
+    def merge_videos_copy(self):
+        """Concatenate the segments with stream copy and save the video-only output"""
+        if not self.segments:
+            print("No segments to merge. Run load_control_file() first.")
+            return False
+        
+        chunk_dir = os.path.join(os.path.dirname(self.temp_output_path), "chunks")
+        list_path = os.path.join(chunk_dir, "concat.txt")
+        try:
+            entries = self.plan_copy_segments(chunk_dir, copy_mezzanine=self.engine != "parallel")
+            with open(list_path, 'w') as f:
+                for path, frames in entries:
+                    f.write(f"file '{os.path.abspath(path)}'\n")
+                    if frames is not None:
+                        # Stop half a frame early so exactly `frames` frames are kept
+                        f.write(f"outpoint {(frames - 0.5) / VIDEO_FPS:.6f}\n")
+            
+            print(f"Saving video-only output to {self.temp_output_path} with the copy engine")
+            run_ffmpeg([
+                "-f", "concat", "-safe", "0", "-i", list_path,
+                "-c", "copy",
+                "-an",  # No audio needed for this step
+                self.temp_output_path
+            ], duration=sum(segment["end"] - segment["start"] for segment in self.segments))
+            return True
+        except Exception as e:
+            print(f"Error merging videos with stream copy: {e}")
+            return False
+            
+    @tracing.traced("VideoMerger.save_video")
     def save_video(self, final_clip=None):
         """Save the video-only output to temp location"""
         if final_clip is None:
@@ -178,7 +610,8 @@ class VideoMerger:
                 self.temp_output_path, 
                 codec="libx264", 
                 audio=False,  # No audio needed for this step
-                fps=24  # Consistent frame rate
+                fps=24,  # Consistent frame rate
+                logger=progress.moviepy_logger()
             )
             
             # Close all clips to free resources
@@ -191,19 +624,36 @@ class VideoMerger:
             print(f"Error saving video: {e}")
             return False
     
+    @tracing.traced("VideoMerger.merge_audio_with_video")
     def merge_audio_with_video(self):
-        """Merge the audio file with the video and create the final output using modern MoviePy approach"""
+        """
+        Merge the audio file with the video and create the final output.
+        The video stream is copied as is and only the speech is encoded; MoviePy re-encoding is the fallback.
+        """
+        # Check if the video file exists
+        if not os.path.exists(self.temp_output_path):
+            print(f"Error: Video file {self.temp_output_path} does not exist")
+            return False
+            
+        # Check if the audio file exists
+        if not os.path.exists(self.audio_path):
+            print(f"Error: Audio file {self.audio_path} does not exist")
+            return False
+        
+        try:
+            progress.phase("remux")
+            print(f"Remuxing audio from {self.audio_path} with video from {self.temp_output_path} (video stream copied)")
+            remux_audio(self.temp_output_path, self.audio_path, self.final_output_path)
+            print(f"Final video with audio saved to {self.final_output_path}")
+            return True
+        except Exception as e:
+            print(f"Error remuxing audio with video: {e}. Falling back to MoviePy...")
+        
+        return self.merge_audio_with_moviepy()
+    
+    def merge_audio_with_moviepy(self):
+        """Merge the audio file with the video by re-encoding both with MoviePy"""
         try:
-            # Check if the video file exists
-            if not os.path.exists(self.temp_output_path):
-                print(f"Error: Video file {self.temp_output_path} does not exist")
-                return False
-                
-            # Check if the audio file exists
-            if not os.path.exists(self.audio_path):
-                print(f"Error: Audio file {self.audio_path} does not exist")
-                return False
-                
             print(f"Merging audio from {self.audio_path} with video from {self.temp_output_path}")
             
             # Load the video and audio
@@ -220,10 +670,11 @@ class VideoMerger:
                 self.final_output_path,
                 codec="libx264",
                 audio_codec="aac",  # AAC is the recommended audio codec for mp4
-                temp_audiofile="temp-audio.m4a",  # Specify temp file to avoid issues
+                temp_audiofile=os.path.join(os.path.dirname(self.final_output_path), "temp-audio.m4a"),  # Keep temp files in the output directory
                 remove_temp=True,  # Remove temp files after processing
                 audio_bitrate="192k",  # Higher quality audio
-                fps=24
+                fps=24,
+                logger=progress.moviepy_logger()
             )
             
             # Close the resources
@@ -239,11 +690,22 @@ class VideoMerger:
             print(f"Error merging audio with video: {e}")
             return False
             
+    @tracing.traced("VideoMerger.process")
     def process(self):
         """Run the full video merging process"""
         if not self.load_control_file():
             return False
             
+        if self.engine in ("copy", "parallel"):
+            if self.merge_videos_copy():
+                return self.merge_audio_with_video()
+            print(f"{self.engine.capitalize()} engine failed. Falling back to MoviePy...")
+            
+        if self.engine == "ffmpeg":
+            if self.merge_videos_ffmpeg():
+                return self.merge_audio_with_video()
+            print("ffmpeg engine failed. Falling back to MoviePy...")
+            
         if not self.prepare_clips():
             return False
             
@@ -3,6 +3,35 @@ import subprocess
 from pathlib import Path
 import sys
 import shutil
+import threading
+from app.audio_mixer import mix_to_file, SAMPLE_RATE, CHANNELS
+from app.cache import DiskCache
+from app.ffmpeg_utils import run_ffmpeg, probe_duration, remux_audio
+from app import progress
+from app import tracing
+
+# Music library: downloaded tracks keyed by URL, each with a decoded PCM copy for mixing,
+# shared by every session and worker process
+MUSIC_CACHE_DIR = "app/data/cache/music"
+MUSIC_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+# The PCM copy is signed 16-bit little-endian, interleaved, in the mixer's sample format
+PCM_FILENAME = "music.s16"
+_music_cache = None
+# One download per URL at a time in this process; other sessions wait and reuse it
+_download_locks = {}
+_download_locks_guard = threading.Lock()
+
+def get_music_cache():
+    """Create the on-disk music library on first use"""
+    global _music_cache
+    if _music_cache is None:
+        _music_cache = DiskCache(MUSIC_CACHE_DIR, MUSIC_CACHE_MAX_BYTES)
+    return _music_cache
+
+def download_lock(key):
+    """Lock that serializes downloads of the same track in this process"""
+    with _download_locks_guard:
+        return _download_locks.setdefault(key, threading.Lock())
 
 # Track if pydub is available
 PYDUB_AVAILABLE = False
@@ -28,14 +57,98 @@ except Exception as e:
 SET_VOLUME_IN_MERGE = True
 
 class Music:
-    def __init__(self, youtube_url: str, volume: int = 100, start_time: int = 0):
+    def __init__(self, youtube_url: str, volume: int = 100, start_time: int = 0, music_path: str = "data/current/music.mp3",
+                 use_cache: bool = True, duck_db: float = 0):
         self.youtube_url = youtube_url
         self.volume = volume
         self.start_time = start_time  # Time in seconds to start the audio from
+        self.duck_db = duck_db  # How far the music is lowered while the speech plays (0 = no ducking)
+        self.music_path = Path(music_path)  # Where get_music stores the track (the session workspace)
+        self.use_cache = use_cache  # Reuse the track from the music library instead of downloading it again
+        self.pcm_path = None  # Decoded PCM copy of the track in the music library, once available
 
+    @tracing.traced("Music.get_music")
     def get_music(self):
         """
-        Download audio from a YouTube URL.
+        Get the audio of the YouTube URL into music_path.
+        
+        Tracks already in the music library are linked in without downloading or
+        transcoding anything. New tracks are downloaded, decoded to PCM and added to it.
+        
+        Returns:
+            str: Path to the mp3 file
+        """
+        # Create output directory if it doesn't exist
+        self.music_path.parent.mkdir(parents=True, exist_ok=True)
+        if not self.use_cache:
+            return self.download_music()
+        
+        key = DiskCache.make_key("music", self.youtube_url)
+        with download_lock(key):
+            entry = get_music_cache().get(key)
+            if entry is None:
+                self.download_music()
+                entry = self.add_to_library(key)
+            else:
+                progress.phase("cache hit")
+                print(f"Music library hit for {self.youtube_url}. Skipping the download.")
+                if not self.link_from_library(entry):
+                    self.download_music()
+                    entry = self.add_to_library(key)
+        
+        if entry is not None:
+            self.pcm_path = Path(entry) / PCM_FILENAME
+        return str(self.music_path)
+    
+    def add_to_library(self, key):
+        """
+        Decode the downloaded track to PCM and store both in the music library.
+        
+        Returns:
+            str: Path to the library entry, or None if it could not be stored
+        """
+        progress.phase("decode")
+        pcm_path = self.music_path.with_suffix(".s16.tmp")
+        try:
+            run_ffmpeg(["-i", str(self.music_path), "-f", "s16le", "-acodec", "pcm_s16le",
+                        "-ac", str(CHANNELS), "-ar", str(SAMPLE_RATE), str(pcm_path)])
+            entry = get_music_cache().put(key, {"music.mp3": str(self.music_path), PCM_FILENAME: str(pcm_path)})
+        except (OSError, RuntimeError) as e:
+            print(f"Error adding music to the library: {e}")
+            return None
+        finally:
+            if pcm_path.exists():
+                pcm_path.unlink()
+        self.link_from_library(entry)
+        return entry
+    
+    def link_from_library(self, entry):
+        """
+        Put the library's copy of the track at music_path. A hard link shares the file
+        between sessions (and survives eviction); a copy is made where links are not possible.
+        
+        Returns:
+            bool: True if the track is in place
+        """
+        source = Path(entry) / "music.mp3"
+        temp_path = self.music_path.with_name(f".{self.music_path.name}.{os.getpid()}.tmp")
+        try:
+            try:
+                os.link(source, temp_path)
+            except OSError:
+                shutil.copyfile(source, temp_path)
+            os.replace(temp_path, self.music_path)
+            return True
+        except OSError as e:
+            # Entry evicted in the meantime
+            print(f"Error reading music from the library: {e}")
+            if temp_path.exists():
+                temp_path.unlink()
+            return False
+    
+    def download_music(self):
+        """
+        Download audio from the YouTube URL to music_path.
         
         This function tries multiple methods:
         1. yt-dlp (external tool)
@@ -45,12 +158,10 @@ class Music:
         Returns:
             str: Path to the downloaded mp3 file
         """
-        # Create output directory if it doesn't exist
-        output_dir = Path("data/current")
-        output_dir.mkdir(parents=True, exist_ok=True)
+        progress.phase("download")
         
         # Always use "music.mp3" as the filename
-        output_file = output_dir / "music.mp3"
+        output_file = self.music_path
         
         # Method 1: Try yt-dlp
         if self._try_ytdlp(output_file):
@@ -78,11 +189,16 @@ class Music:
             "3. pytube: pip install pytube\n"
         )
     
+    @tracing.traced("Music.merge_with_video")
     def merge_with_video(self, video_path="data/current/output_with_captions.mp4", output_path="data/current/output_final.mp4"):
         """
         Merge the downloaded music with a video file and adjust volume in the process.
         Preserves the original audio (speech) and overlays the music on top.
         
+        The speech and music are mixed as PCM arrays (audio_mixer) into one AAC track,
+        which is then remuxed with the video stream copied as is, so changing the music
+        never re-encodes the video. MoviePy's audio compositing is the fallback.
+        
         Args:
             video_path: Path to the video file to merge with
             output_path: Path where the final video will be saved
@@ -90,6 +206,44 @@ class Music:
         Returns:
             str: Path to the final output video with music
         """
+        video_path = Path(video_path)
+        output_path = Path(output_path)
+        if not self.music_path.exists():
+            print(f"Music file not found at {self.music_path}")
+            return None
+        if not video_path.exists():
+            print(f"Video file not found at {video_path}")
+            return None
+        
+        try:
+            return self.merge_with_mixer(video_path, output_path)
+        except Exception as e:
+            print(f"Error mixing music with the NumPy mixer: {e}. Falling back to MoviePy...")
+        return self.merge_with_moviepy(video_path, output_path)
+    
+    @tracing.traced("Music.merge_with_mixer")
+    def merge_with_mixer(self, video_path, output_path):
+        """Mix the video's speech with the music into one AAC track and remux it with the video stream copied"""
+        duration = probe_duration(video_path)
+        if not duration:
+            raise RuntimeError(f"Could not read the duration of {video_path}")
+        
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        mix_path = output_path.parent / "music_mix.m4a"
+        progress.phase("mix audio")
+        print(f"Mixing music from {self.music_path} at {self.volume}% under the speech of {video_path}")
+        mix_to_file(str(video_path), str(mix_path), duration, music=self)
+        
+        # Only the audio changed: copy the video stream instead of encoding it again
+        progress.phase("remux")
+        remux_audio(str(video_path), str(mix_path), str(output_path), audio_args=("-c:a", "copy"), duration=duration)
+        mix_path.unlink()
+        
+        print(f"Final video with overlaid music saved to {output_path}")
+        return str(output_path)
+    
+    def merge_with_moviepy(self, video_path, output_path):
+        """Overlay the music on the video's audio with MoviePy's CompositeAudioClip"""
         try:
             # Try to import in this method to bypass potential module-level import issues
             try:
@@ -103,7 +257,7 @@ class Music:
                 return None
             
             # Create paths
-            music_file = Path("data/current/music.mp3")
+            music_file = self.music_path
             video_path = Path(video_path)
             output_path = Path(output_path)
             
@@ -134,33 +288,8 @@ class Music:
             # Load the music
             music_audio = AudioFileClip(str(music_file))
             
-            # Apply start time offset if specified
-            if self.start_time > 0:
-                if self.start_time < music_audio.duration:
-                    print(f"Starting music at {self.start_time} seconds into the audio clip")
-                    music_audio = music_audio.subclipped(self.start_time)
-                else:
-                    print(f"Warning: Start time ({self.start_time}s) exceeds music duration ({music_audio.duration:.2f}s). Using from the beginning.")
-            
-            # Apply volume adjustment using MultiplyVolume
-            volume_factor = self.volume / 100.0
-            print(f"Setting music volume to {self.volume}% ({volume_factor:.2f} multiplier) using MultiplyVolume effect")
-            
-            # Create the volume effect and apply it to the music audio correctly
-            volume_effect = MultiplyVolume(volume_factor)
-            adjusted_music = music_audio.with_effects([volume_effect])
-            print(f"Applied volume factor {volume_factor} to music audio using with_effects")
-            
-            # If music is shorter than video, loop it to fill the entire duration
-            if adjusted_music.duration < video.duration:
-                print(f"Music ({adjusted_music.duration:.2f}s) is shorter than video ({video.duration:.2f}s). Will loop music to fill video.")
-                loop_effect = AudioLoop(duration=video.duration)
-                adjusted_music = adjusted_music.with_effects([loop_effect])
-                print(f"Applied audio looping to cover entire video duration")
-            # If music is longer than video, trim it
-            elif adjusted_music.duration > video.duration:
-                adjusted_music = adjusted_music.subclipped(0, video.duration)
-                print(f"Music trimmed to match video duration: {video.duration:.2f} seconds")
+            # Apply start offset, volume and loop/trim to fit the video
+            adjusted_music = self.build_music_track(music_audio, video.duration)
             
             # Create a composite audio track with both original audio and music
             if original_audio is not None:
@@ -183,10 +312,11 @@ class Music:
                 str(output_path),
                 codec="libx264",
                 audio_codec="aac",  # AAC is the recommended audio codec for mp4
-                temp_audiofile="temp-audio.m4a",  # Specify temp file to avoid issues
+                temp_audiofile=str(output_path.parent / "temp-audio.m4a"),  # Keep temp files in the output directory
                 remove_temp=True,  # Remove temp files after processing
                 audio_bitrate="192k",  # Higher quality audio
-                fps=24
+                fps=24,
+                logger=progress.moviepy_logger()
             )
             
             # Close all resources properly
@@ -212,6 +342,50 @@ class Music:
             traceback.print_exc()
             return None
     
+    def build_music_track(self, music_audio, duration):
+        """
+        Apply the start offset and volume to the music and fit it to a duration.
+        
+        Args:
+            music_audio: AudioFileClip of the downloaded music
+            duration: Duration in seconds the music has to cover
+            
+        Returns:
+            AudioClip: Volume-adjusted music, looped or trimmed to the duration
+        """
+        from moviepy.audio.fx import MultiplyVolume
+        from moviepy.audio.fx import AudioLoop
+        
+        # Apply start time offset if specified
+        if self.start_time > 0:
+            if self.start_time < music_audio.duration:
+                print(f"Starting music at {self.start_time} seconds into the audio clip")
+                music_audio = music_audio.subclipped(self.start_time)
+            else:
+                print(f"Warning: Start time ({self.start_time}s) exceeds music duration ({music_audio.duration:.2f}s). Using from the beginning.")
+        
+        # Apply volume adjustment using MultiplyVolume
+        volume_factor = self.volume / 100.0
+        print(f"Setting music volume to {self.volume}% ({volume_factor:.2f} multiplier) using MultiplyVolume effect")
+        
+        # Create the volume effect and apply it to the music audio correctly
+        volume_effect = MultiplyVolume(volume_factor)
+        adjusted_music = music_audio.with_effects([volume_effect])
+        print(f"Applied volume factor {volume_factor} to music audio using with_effects")
+        
+        # If music is shorter than video, loop it to fill the entire duration
+        if adjusted_music.duration < duration:
+            print(f"Music ({adjusted_music.duration:.2f}s) is shorter than video ({duration:.2f}s). Will loop music to fill video.")
+            loop_effect = AudioLoop(duration=duration)
+            adjusted_music = adjusted_music.with_effects([loop_effect])
+            print(f"Applied audio looping to cover entire video duration")
+        # If music is longer than video, trim it
+        elif adjusted_music.duration > duration:
+            adjusted_music = adjusted_music.subclipped(0, duration)
+            print(f"Music trimmed to match video duration: {duration:.2f} seconds")
+        
+        return adjusted_music
+    
     def _adjust_volume(self, file_path):
         """
         Adjust the volume of the audio file using MoviePy.
@@ -309,7 +483,8 @@ class Music:
                 "-o", str(output_file),
                 self.youtube_url
             ]
-            subprocess.run(cmd, check=True)
+            with tracing.span("yt-dlp.download_audio", "external", url=self.youtube_url):
+                subprocess.run(cmd, check=True)
             print(f"Successfully downloaded audio using yt-dlp to {output_file}")
             return True
         except subprocess.SubprocessError as e:
@@ -336,7 +511,8 @@ class Music:
                 "-o", str(output_file),
                 self.youtube_url
             ]
-            subprocess.run(cmd, check=True)
+            with tracing.span("youtube-dl.download_audio", "external", url=self.youtube_url):
+                subprocess.run(cmd, check=True)
             print(f"Successfully downloaded audio using youtube-dl to {output_file}")
             return True
         except subprocess.SubprocessError as e:
@@ -356,7 +532,7 @@ class Music:
                 output_file.unlink()
                 
             # Create a temporary directory for the download
-            temp_dir = Path("data/temp")
+            temp_dir = output_file.parent / "temp"
             temp_dir.mkdir(parents=True, exist_ok=True)
             temp_file = temp_dir / "temp_audio"
             
@@ -369,7 +545,8 @@ class Music:
                 return False
                 
             # Download the audio to the temp directory
-            downloaded_file = audio_stream.download(output_path=str(temp_dir), filename=temp_file.name)
+            with tracing.span("pytube.download_audio", "external", url=self.youtube_url):
+                downloaded_file = audio_stream.download(output_path=str(temp_dir), filename=temp_file.name)
             
             # Convert to mp3 using moviepy
             clip = AudioFileClip(downloaded_file)
@@ -0,0 +1,277 @@
+import contextvars
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from app.audio_manage import AudioManager
+from app.script_manage import ScriptManager, sanitize_script
+from app.merge_video import VideoMerger, ChunkPrefetcher
+from app.captions import CaptionAdder
+from app.music import Music
+from app.render import Renderer
+from app.gallery.gallery import Gallery
+from app import progress
+
+# Blocking pipeline stages. Each stage takes the session's Workspace and plain values and
+# returns a dict with the "session" values to store and the "data" to send back, so it can
+# run in a JobManager worker (thread or process) instead of on the API's event loop.
+# The gallery stages work on a genre folder instead of a session workspace.
+
+def create_video_control(workspace, script, parsed_script, timestamps_path):
+    """
+    Create the video control file from the speech timestamps and the parsed script.
+
+    Returns:
+        str: Path to the video control file
+    """
+    print("\nCreating video control file...")
+    # Load timestamps from file
+    with open(timestamps_path, 'r') as f:
+        timestamps = json.load(f)
+
+    # Create the video control file using the ScriptManager
+    script_manager = ScriptManager(script or "", output_dir=workspace.path)
+    script_manager.full_script = parsed_script.get("full_script", "")
+    script_manager.videos = parsed_script.get("videos", [])
+
+    # Use the existing parsed data
+    video_control = script_manager.create_video_control(timestamps)
+    video_control_path = script_manager.save_video_control(video_control, os.path.basename(workspace.video_control_path))
+    print(f"Video control file created: {video_control_path}")
+    return video_control_path
+
+def create_speech_stage(workspace, script_text, voice_id, speed, pitch, lines=None, mode="script", line_workers=4,
+                        backend=None):
+    """
+    Generate the speech audio and timestamps for the script, either in one request
+    (mode "script") or one request per line in parallel (mode "lines"), with the given
+    speech backend ("unrealspeech" or "standin", SPEECH_BACKEND by default)
+    """
+    with progress.track(workspace.path, "create-speech"):
+        audio_manager = AudioManager(output_dir=workspace.path, backend=backend)
+        if mode == "lines" and lines:
+            audio_path, timestamps_path = audio_manager.process_lines_to_speech(
+                lines,
+                audio_filename=os.path.basename(workspace.audio_path),
+                timestamps_filename=os.path.basename(workspace.timestamps_path),
+                max_workers=line_workers,
+                voice_id=voice_id,
+                speed=speed,
+                pitch=pitch
+            )
+        else:
+            audio_path, timestamps_path = audio_manager.process_text_to_speech(
+                text=script_text,
+                voice_id=voice_id,
+                audio_filename=os.path.basename(workspace.audio_path),
+                timestamps_filename=os.path.basename(workspace.timestamps_path),
+                speed=speed,
+                pitch=pitch
+            )
+        print(f"Speech generation successful. Audio saved to: {audio_path}")
+
+        paths = {"audio_path": audio_path, "timestamps_path": timestamps_path}
+        return {"session": paths, "data": paths}
+
+def stream_script_stage(workspace, agent, voice, render_settings):
+    """
+    Generate the script with a streamed completion and start on every line as soon as its
+    {line, video} pair is complete: its speech is synthesized right away (one request per
+    line, as in "lines" mode) and, for the copy and parallel merge engines, its segment
+    chunk is encoded once the durations before it are known. Replaces /api/generate-script,
+    /api/parse-script and /api/create-speech with one stage.
+
+    The complete response is parsed again with ScriptManager.extract_data(), which stays
+    authoritative: lines it reads differently from the stream are synthesized again, and
+    chunks that no longer match are encoded again by the merge.
+    """
+    with progress.track(workspace.path, "stream-script"):
+        audio_manager = AudioManager(output_dir=workspace.path, backend=voice.get("backend"))
+        line_manager = audio_manager.line_manager()
+        speech_kwargs = {"voice_id": voice["voice_id"], "speed": voice["speed"], "pitch": voice["pitch"]}
+        prefetcher = None
+        if render_settings["merge_engine"] in ("copy", "parallel"):
+            prefetcher = ChunkPrefetcher(
+                workspace.chunks_dir,
+                engine=render_settings["merge_engine"],
+                workers=render_settings["merge_workers"],
+                chunk_threads=render_settings["chunk_threads"]
+            )
+
+        def synthesize(index, text):
+            result = line_manager.synthesize_line(index, text, **speech_kwargs)
+            if prefetcher is not None:
+                prefetcher.add_duration(index, AudioManager.line_duration(*result))
+            return result
+
+        # Both keyed by the line's index among the lines with speech, as in extract_data()
+        submitted = {}  # Line index -> (text, future)
+        streamed_videos = {}  # Line index -> video
+        pool = ThreadPoolExecutor(max_workers=max(1, voice.get("line_workers", 4)))
+
+        def submit(index, text):
+            # Each task runs in a copy of the current context so its trace spans keep the session tags
+            submitted[index] = (text, pool.submit(contextvars.copy_context().run, synthesize, index, text))
+
+        def on_pair(index, pair):
+            submit(index, pair["line"].strip())
+            streamed_videos[index] = pair["video"]
+            if prefetcher is not None:
+                prefetcher.add_video(index, pair["video"])
+
+        try:
+            progress.phase("stream script")
+            raw_script = agent.stream_response(on_pair)
+            script = sanitize_script(raw_script)
+            script_manager = ScriptManager(script, output_dir=workspace.path)
+            config = script_manager.extract_data()
+
+            # extract_data() only keeps lines with speech, so config, videos and the
+            # streamed indices all share one index space
+            lines = [item["line"].strip() for item in config]
+            if not lines:
+                raise ValueError("No lines to synthesize")
+            print(f"Script streamed: {len(submitted)} lines started early, {len(lines)} in the final parse")
+            for index, text in enumerate(lines):
+                if index not in submitted or submitted[index][0] != text:
+                    if index in submitted:
+                        # Both requests write the same line files, so let the stale one finish first
+                        submitted[index][1].exception()
+                    submit(index, text)
+                video = script_manager.videos[index]
+                if prefetcher is not None and streamed_videos.get(index) != video:
+                    prefetcher.add_video(index, video)
+
+            progress.phase("tts lines")
+            results = [submitted[index][1].result() for index in range(len(lines))]
+        finally:
+            pool.shutdown(wait=True)
+            if prefetcher is not None:
+                prepared = prefetcher.close()
+                print(f"Prepared {prepared} segment chunks while the script was streaming")
+
+        audio_path, timestamps_path = audio_manager.stitch_lines(
+            lines, results,
+            os.path.basename(workspace.audio_path),
+            os.path.basename(workspace.timestamps_path)
+        )
+        parsed_script = {
+            "lines": config,
+            "full_script": script_manager.full_script,
+            "videos": script_manager.videos
+        }
+
+        return {
+            "session": {
+                "script": script,
+                "parsed_script": parsed_script,
+                "audio_path": audio_path,
+                "timestamps_path": timestamps_path
+            },
+            "data": {
+                "script": script,
+                "lines": config,
+                "videos": script_manager.videos,
+                "audio_path": audio_path,
+                "timestamps_path": timestamps_path
+            }
+        }
+
+def merge_videos_stage(workspace, script, parsed_script, timestamps_path, audio_path, render_settings):
+    """Create the video control file and merge the videos with the speech"""
+    with progress.track(workspace.path, "merge-videos"):
+        video_control_path = create_video_control(workspace, script, parsed_script, timestamps_path)
+
+        print(f"\nMerging videos with the {render_settings['merge_engine']} engine...")
+        merger = VideoMerger(
+            video_control_path,
+            temp_output_path=workspace.merged_video_path,
+            final_output_path=workspace.pre_captions_path,
+            audio_path=audio_path,
+            engine=render_settings["merge_engine"],
+            workers=render_settings["merge_workers"],
+            chunk_threads=render_settings["chunk_threads"]
+        )
+        if not merger.process():
+            raise RuntimeError("Video merging failed. See the server log for details.")
+        print(f"Merged video saved to: {merger.final_output_path}")
+
+        return {
+            "session": {"video_control_path": video_control_path, "video_path": merger.final_output_path},
+            "data": {"video_path": merger.final_output_path, "video_control_path": video_control_path}
+        }
+
+def add_captions_stage(workspace, video_control_path, video_path, caption_backend):
+    """Add word-by-word captions to the merged video"""
+    with progress.track(workspace.path, "add-captions"):
+        caption_adder = CaptionAdder(
+            video_control_path,
+            input_video_path=video_path,
+            output_video_path=workspace.captioned_video_path,
+            backend=caption_backend
+        )
+        captioned_video_path = caption_adder.add_captions_to_video()
+        if not captioned_video_path:
+            raise RuntimeError("Adding captions failed. See the server log for details.")
+
+        return {
+            "session": {"captioned_video_path": captioned_video_path},
+            "data": {"video_path": captioned_video_path}
+        }
+
+def add_music_stage(workspace, youtube_url, volume, start_time, captioned_video_path, duck_db=0):
+    """Download the music and mix it into the captioned video"""
+    with progress.track(workspace.path, "add-music"):
+        music = Music(youtube_url, volume, start_time, music_path=workspace.music_path, duck_db=duck_db)
+        music_file = music.get_music()
+        print(f"music_file: {music_file}\n\n")
+        final_output = music.merge_with_video(video_path=captioned_video_path, output_path=workspace.final_video_path)
+        if not final_output:
+            raise RuntimeError("Adding music failed. See the server log for details.")
+
+        return {
+            "session": {"final_video_path": final_output},
+            "data": {"video_path": final_output}
+        }
+
+def render_stage(workspace, script, parsed_script, timestamps_path, audio_path, music_params, render_engine):
+    """Create the video control file and render the final video in a single encode"""
+    with progress.track(workspace.path, "render"):
+        video_control_path = create_video_control(workspace, script, parsed_script, timestamps_path)
+
+        youtube_url, volume, start_time, duck_db = music_params
+        music = Music(youtube_url, volume, start_time, music_path=workspace.music_path, duck_db=duck_db)
+        try:
+            music_file = music.get_music()
+            print(f"music_file: {music_file}\n\n")
+        except Exception as e:
+            print(f"Error downloading music, rendering without it: {str(e)}")
+            music = None
+
+        print(f"\nRendering final video with the {render_engine} engine...")
+        renderer = Renderer(
+            video_control_path,
+            audio_path=audio_path,
+            output_path=workspace.final_video_path,
+            music=music,
+            engine=render_engine
+        )
+        final_output = renderer.render()
+        if not final_output:
+            raise RuntimeError("Rendering failed. See the server log for details.")
+
+        return {
+            "session": {"video_control_path": video_control_path, "final_video_path": final_output},
+            "data": {"video_path": final_output, "video_control_path": video_control_path}
+        }
+
+def gallery_upload_stage(genre, video_url, description):
+    """Name, download and screenshot a new gallery clip"""
+    gallery = Gallery(genre)
+    gallery.upload_pipeline(video_url, description)
+    return {"session": {}, "data": {"genre": genre}}
+
+def gallery_mezzanine_stage(genre):
+    """Re-encode the clips of a gallery into the mezzanine format"""
+    gallery = Gallery(genre)
+    converted = gallery.convert_to_mezzanine()
+    return {"session": {}, "data": {"genre": genre, "converted": converted}}
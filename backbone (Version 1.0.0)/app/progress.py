@@ -0,0 +1,166 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import json
+import os
+import threading
+import time
+
+from proglog import ProgressBarLogger
+
+PROGRESS_FILE = "progress.json"
+
+# Reporter of the stage running in the current worker (thread or process)
+_current_reporter = ContextVar("progress_reporter", default=None)
+
+class ProgressReporter:
+    """
+    Writes the progress of a session's running stage to progress.json in its workspace.
+
+    The file holds the stage, the current phase (e.g. "tts request", "encode"), percent
+    done, frames per second and ETA. The API streams it to the browser over SSE, so
+    stages running in worker processes only need to write the file.
+    """
+
+    def __init__(self, workspace_path, stage, min_interval=0.25):
+        """
+        Args:
+            workspace_path (str): Session workspace directory
+            stage (str): Name of the pipeline stage
+            min_interval (float): Minimum seconds between two writes of a running phase
+        """
+        self.path = os.path.join(workspace_path, PROGRESS_FILE)
+        self.min_interval = min_interval
+        self.last_write = 0
+        self.state = {
+            "stage": stage,
+            "status": "running",
+            "phase": None,
+            "percent": 0.0,
+            "fps": None,
+            "eta": None,
+            "started_at": time.time(),
+            "updated_at": None,
+            "error": None
+        }
+
+    def phase(self, name):
+        """Start a new phase of the stage"""
+        self.update(force=True, phase=name, percent=0.0, fps=None, eta=None)
+        print(f"[{self.state['stage']}] {name}")
+
+    def update(self, force=False, **values):
+        """Update the progress, writing at most once per min_interval unless forced"""
+        self.state.update(values)
+        now = time.time()
+        if not force and now - self.last_write < self.min_interval:
+            return
+        self.last_write = now
+        self.state["updated_at"] = now
+
+        # Write to a temp file and rename so readers never see a partial file
+        temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.{time.monotonic_ns()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(temp_path, self.path)
+
+    def frames(self, index, total, rate, report_fps=True):
+        """
+        Report progress through a bar of work items (frames, audio chunks, segments).
+
+        Args:
+            index (int): Items done
+            total (int): Items in the bar
+            rate (float): Items per second so far, used for the ETA
+            report_fps (bool): Whether the items are video frames, so the rate is reported as fps
+        """
+        eta = (total - index) / rate if rate and total else None
+        percent = 100.0 * index / total if total else 0.0
+        self.update(percent=round(min(percent, 100.0), 1),
+                    fps=round(rate, 1) if rate and report_fps else None,
+                    eta=round(eta, 1) if eta is not None else None)
+
+    def finish(self, error=None):
+        """Mark the stage as completed, or failed with the given error"""
+        if error is None:
+            self.update(force=True, status="completed", percent=100.0, eta=0)
+        else:
+            self.update(force=True, status="failed", error=str(error))
+
+class MoviePyProgressLogger(ProgressBarLogger):
+    """proglog logger that forwards MoviePy's frame and audio chunk bars to a ProgressReporter"""
+
+    def __init__(self, reporter):
+        super().__init__()
+        self.reporter = reporter
+        self.bar_started = {}
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        if attr != "index":
+            return
+        if value == 0 or bar not in self.bar_started:
+            self.bar_started[bar] = time.time()
+            self.reporter.phase("encode" if bar == "frame_index" else "encode audio")
+            return
+
+        total = self.bars[bar].get("total")
+        elapsed = time.time() - self.bar_started[bar]
+        rate = value / elapsed if elapsed > 0 else None
+        # Frames per second for the video bar; audio chunks are reported as percent only
+        self.reporter.frames(value, total, rate, report_fps=bar == "frame_index")
+
+def current_reporter():
+    """Reporter of the running stage, or None outside a tracked stage"""
+    return _current_reporter.get()
+
+def phase(name):
+    """Start a new phase of the running stage (no-op outside a tracked stage)"""
+    reporter = current_reporter()
+    if reporter is not None:
+        reporter.phase(name)
+
+def report(**values):
+    """Update the progress of the running stage (no-op outside a tracked stage)"""
+    reporter = current_reporter()
+    if reporter is not None:
+        reporter.update(**values)
+
+def moviepy_logger():
+    """Logger argument for MoviePy's write_* methods: progress reporting in a tracked stage, the console bar otherwise"""
+    reporter = current_reporter()
+    if reporter is None:
+        return "bar"
+    return MoviePyProgressLogger(reporter)
+
+@contextmanager
+def detached():
+    """Run a block without reporting (e.g. sub-tasks whose phases would overwrite their parent's)"""
+    token = _current_reporter.set(None)
+    try:
+        yield
+    finally:
+        _current_reporter.reset(token)
+
+@contextmanager
+def track(workspace_path, stage):
+    """Report the progress of a stage to its session's workspace while the block runs"""
+    reporter = ProgressReporter(workspace_path, stage)
+    token = _current_reporter.set(reporter)
+    reporter.update(force=True)
+    try:
+        yield reporter
+    except Exception as e:
+        reporter.finish(error=e)
+        raise
+    else:
+        reporter.finish()
+    finally:
+        _current_reporter.reset(token)
+
+def read_progress(workspace_path):
+    """Load the last progress written for a workspace, or None"""
+    path = os.path.join(workspace_path, PROGRESS_FILE)
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
@@ -0,0 +1,241 @@
+from moviepy import AudioFileClip, CompositeAudioClip, CompositeVideoClip
+from app.merge_video import VideoMerger
+from app.captions import CaptionAdder
+from app.audio_mixer import mix_to_file
+from app.ffmpeg_utils import run_ffmpeg, remux_audio, VIDEO_WIDTH, VIDEO_HEIGHT, VIDEO_FPS
+from app import progress
+from app import tracing
+import os
+
+class Renderer:
+    """
+    Single-pass renderer that builds one timeline from the video control file,
+    the speech track, the caption events and the music settings, then encodes once.
+
+    The per-stage path (VideoMerger -> CaptionAdder -> Music) encodes the video
+    four times; this produces the same final output with a single encode.
+
+    With engine="moviepy" the timeline is composited in MoviePy. With engine="ffmpeg"
+    it is one native filtergraph (VideoMerger.build_filtergraph) with the captions
+    burned in by libass (CaptionAdder.write_ass_file).
+    """
+
+    def __init__(self, video_control_path, audio_path="app/data/current/output_audio.mp3",
+                 output_path="app/data/current/output_final.mp4", music=None, engine="moviepy"):
+        """
+        Args:
+            video_control_path (str): Path to the video control file
+            audio_path (str): Path to the speech audio file
+            output_path (str): Path where the final video will be saved
+            music (Music, optional): Music instance whose track has already been downloaded
+            engine (str): "moviepy" or "ffmpeg"
+        """
+        self.video_control_path = video_control_path
+        self.audio_path = audio_path
+        self.output_path = output_path
+        self.music = music
+        self.engine = engine
+        self.work_dir = os.path.dirname(self.output_path)  # Intermediate files live next to the output
+
+        # Ensure output directories exist
+        os.makedirs(os.path.dirname(self.output_path), exist_ok=True)
+
+        print(f"Renderer control file path: {self.video_control_path}")
+        print(f"Renderer audio path: {self.audio_path}")
+        print(f"Renderer output path: {self.output_path}")
+        print(f"Render engine: {self.engine}")
+
+    def create_merger(self, engine="moviepy"):
+        """VideoMerger for this render, with its intermediate paths in the work directory"""
+        return VideoMerger(
+            self.video_control_path,
+            temp_output_path=os.path.join(self.work_dir, "output.mp4"),
+            final_output_path=os.path.join(self.work_dir, "output_pre_captions.mp4"),
+            audio_path=self.audio_path,
+            engine=engine
+        )
+
+    def create_caption_adder(self):
+        """CaptionAdder for this render, with its intermediate paths in the work directory"""
+        return CaptionAdder(
+            self.video_control_path,
+            input_video_path=os.path.join(self.work_dir, "output_pre_captions.mp4"),
+            output_video_path=os.path.join(self.work_dir, "output_with_captions.mp4")
+        )
+
+    @tracing.traced("Renderer.build_video")
+    def build_video(self):
+        """Build the merged video timeline with the caption overlays composited on top"""
+        merger = self.create_merger()
+        if not merger.prepare_clips():
+            return None, merger
+
+        video = merger.merge_videos()
+        if not video:
+            return None, merger
+
+        caption_adder = self.create_caption_adder()
+        text_clips = caption_adder.create_word_clips(video.size)
+        if text_clips:
+            print(f"Adding {len(text_clips)} word captions to the timeline")
+            video = CompositeVideoClip([video] + text_clips).with_duration(video.duration)
+        else:
+            print("No text clips were created. Rendering without captions.")
+
+        return video, merger
+
+    def build_audio(self, duration):
+        """Build the speech track with the music overlaid on top as a MoviePy composite"""
+        if not os.path.exists(self.audio_path):
+            print(f"Error: Audio file {self.audio_path} does not exist")
+            return None, []
+
+        speech = AudioFileClip(self.audio_path)
+        sources = [speech]
+        tracks = [speech]
+
+        if self.music is not None:
+            if self.music.music_path.exists():
+                music_audio = AudioFileClip(str(self.music.music_path))
+                sources.append(music_audio)
+                tracks.append(self.music.build_music_track(music_audio, duration))
+            else:
+                print(f"Music file not found at {self.music.music_path}. Rendering without music.")
+
+        if len(tracks) == 1:
+            return speech, sources
+        return CompositeAudioClip(tracks).with_duration(duration), sources
+
+    @tracing.traced("Renderer.write_audio_track")
+    def write_audio_track(self, duration):
+        """
+        Mix the speech and music into one AAC file with the NumPy mixer, falling back to
+        a MoviePy composite if the mixer fails.
+        """
+        if not os.path.exists(self.audio_path):
+            print(f"Error: Audio file {self.audio_path} does not exist")
+            return None
+        audio_track_path = os.path.join(self.work_dir, "render_audio.m4a")
+        progress.phase("mix audio")
+
+        music = self.music
+        if music is not None and not music.music_path.exists():
+            print(f"Music file not found at {music.music_path}. Rendering without music.")
+            music = None
+        try:
+            return mix_to_file(self.audio_path, audio_track_path, duration, music=music)
+        except Exception as e:
+            print(f"Error mixing audio with the NumPy mixer: {e}. Falling back to MoviePy...")
+
+        audio, sources = self.build_audio(duration)
+        if audio is None:
+            return None
+        try:
+            audio.write_audiofile(audio_track_path, fps=44100, codec="aac", bitrate="192k",
+                                  logger=progress.moviepy_logger())
+        finally:
+            for source in sources:
+                if hasattr(source, 'close'):
+                    source.close()
+        return audio_track_path
+
+    @tracing.traced("Renderer.render_ffmpeg")
+    def render_ffmpeg(self):
+        """
+        Render the final video with one ffmpeg run: concat filtergraph, libass captions
+        and the mixed audio track, decoded and encoded once.
+
+        Returns:
+            str: Path to the final video, or False if rendering failed
+        """
+        merger = self.create_merger(engine="ffmpeg")
+        if not merger.segments:
+            print("No segments to render.")
+            return False
+        duration = sum(segment["end"] - segment["start"] for segment in merger.segments)
+
+        input_args, filtergraph, video_label = merger.build_filtergraph()
+
+        caption_adder = self.create_caption_adder()
+        ass_path = os.path.join(self.work_dir, "captions.ass")
+        if caption_adder.write_ass_file(ass_path, (VIDEO_WIDTH, VIDEO_HEIGHT)):
+            filtergraph += f";{video_label}{caption_adder.subtitles_filter(ass_path)}[captioned]"
+            video_label = "[captioned]"
+        else:
+            print("No caption events were created. Rendering without captions.")
+
+        audio_track_path = self.write_audio_track(duration)
+        if audio_track_path is None:
+            return False
+        audio_input = len(merger.segments)
+
+        print(f"Rendering final video to {self.output_path} with the ffmpeg engine")
+        run_ffmpeg(input_args + ["-i", audio_track_path] + [
+            "-filter_complex", filtergraph,
+            "-map", video_label,
+            "-map", f"{audio_input}:a",
+            "-c:v", "libx264",
+            "-pix_fmt", "yuv420p",
+            "-r", VIDEO_FPS,
+            "-c:a", "copy",  # Already encoded as AAC by write_audio_track
+            "-t", f"{duration:.3f}",
+            self.output_path
+        ], duration=duration)
+
+        print(f"Final video saved to {self.output_path}")
+        return self.output_path
+
+    @tracing.traced("Renderer.render")
+    def render(self):
+        """
+        Render the final video in a single encode.
+
+        Returns:
+            str: Path to the final video, or False if rendering failed
+        """
+        if self.engine == "ffmpeg":
+            try:
+                return self.render_ffmpeg()
+            except Exception as e:
+                print(f"Error rendering video with ffmpeg: {e}. Falling back to MoviePy...")
+
+        merger = None
+        try:
+            video, merger = self.build_video()
+            if video is None:
+                print("Could not build the video timeline. Cannot proceed.")
+                return False
+
+            audio_track_path = self.write_audio_track(video.duration)
+            if audio_track_path is None:
+                return False
+
+            # Encode only the video, then add the already encoded AAC track with stream copy,
+            # so the audio is not decoded and encoded a second time
+            video_only_path = os.path.join(self.work_dir, "render_video.mp4")
+            print(f"Rendering final video to {self.output_path}")
+            video.write_videofile(
+                video_only_path,
+                codec="libx264",
+                audio=False,
+                fps=24,
+                logger=progress.moviepy_logger()
+            )
+            progress.phase("remux")
+            remux_audio(video_only_path, audio_track_path, self.output_path,
+                        audio_args=("-c:a", "copy"), duration=video.duration)
+            os.remove(video_only_path)
+
+            print(f"Final video saved to {self.output_path}")
+            return self.output_path
+        except Exception as e:
+            print(f"Error rendering video: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        finally:
+            # Close all clips to free resources
+            if merger is not None:
+                for clip in merger.clips:
+                    if hasattr(clip, 'close'):
+                        clip.close()
@@ -0,0 +1,167 @@
+"""
+Lexical retrieval of the clips and training examples the script agent sees.
+
+Instead of the whole video list and every example, the prompt gets the top-k clips and
+examples for the user's request, ranked with BM25 over their words (clip filenames plus
+any gallery descriptions, example lines). The indexes are NumPy postings arrays, built
+once per document set and kept in memory.
+"""
+from collections import OrderedDict
+import json
+import os
+import re
+
+import numpy as np
+
+# Per-clip descriptions of a gallery folder (video name -> text), written by the upload pipeline
+CLIP_DESCRIPTIONS = "descriptions.json"
+DEFAULT_CLIP_K = 30
+DEFAULT_EXAMPLE_K = 2
+INDEX_MEMORY_MAX_ENTRIES = 32
+_index_memory = OrderedDict()
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or that the this to was were "
+    "will with mp4 about into over under".split()
+)
+
+def tokenize(text):
+    """Lowercase words of a text (underscores split words), without stop words and plural s"""
+    tokens = []
+    for word in TOKEN_PATTERN.findall(text.lower().replace("_", " ")):
+        if word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+class BM25Index:
+    """
+    BM25 ranking over a fixed list of documents. The saturated term weights are stored
+    as postings (document, weight) grouped by term, so a query only touches the postings
+    of its own words however large the gallery is.
+    """
+
+    def __init__(self, documents, k1=BM25_K1, b=BM25_B):
+        tokenized = [tokenize(document) for document in documents]
+        self.vocabulary = {}
+        term_ids = []
+        for tokens in tokenized:
+            term_ids.append([self.vocabulary.setdefault(token, len(self.vocabulary)) for token in tokens])
+        self.size = len(documents)
+
+        lengths = np.array([len(ids) for ids in term_ids], dtype=np.float64)
+        doc_of_token = np.repeat(np.arange(self.size), lengths.astype(np.int64))
+        term_of_token = np.fromiter((term for ids in term_ids for term in ids), dtype=np.int64, count=len(doc_of_token))
+
+        # One posting per (term, document) pair, sorted by term then document
+        keys, frequency = np.unique(term_of_token * max(1, self.size) + doc_of_token, return_counts=True)
+        terms = keys // max(1, self.size)
+        self.documents = keys % max(1, self.size)
+        self.offsets = np.searchsorted(terms, np.arange(len(self.vocabulary) + 1))
+
+        document_frequency = np.diff(self.offsets)
+        self.idf = np.log1p((self.size - document_frequency + 0.5) / (document_frequency + 0.5))
+        average_length = lengths.mean() if self.size and lengths.mean() > 0 else 1.0
+        norm = k1 * (1 - b + b * lengths / average_length)
+        self.weights = frequency * (k1 + 1) / (frequency + norm[self.documents])
+
+    def scores(self, query):
+        """BM25 score of every document for the query"""
+        scores = np.zeros(self.size)
+        # Repeated query words count once per occurrence, like in the standard formula
+        for token in tokenize(query):
+            term = self.vocabulary.get(token)
+            if term is None:
+                continue
+            start, end = self.offsets[term], self.offsets[term + 1]
+            scores[self.documents[start:end]] += self.weights[start:end] * self.idf[term]
+        return scores
+
+    def top_k(self, query, k):
+        """
+        Indices of the k best documents, best first. Ties (including documents that match
+        nothing) keep their original order.
+        """
+        order = np.argsort(-self.scores(query), kind="stable")
+        return order[:k].tolist()
+
+def get_index(documents):
+    """BM25 index of the documents, reused while the same documents are asked for"""
+    key = tuple(documents)
+    index = _index_memory.get(key)
+    if index is not None:
+        _index_memory.move_to_end(key)
+        return index
+    index = BM25Index(documents)
+    _index_memory[key] = index
+    if len(_index_memory) > INDEX_MEMORY_MAX_ENTRIES:
+        _index_memory.popitem(last=False)
+    return index
+
+def read_clip_descriptions(gallery_path):
+    """Load the clip descriptions of a gallery folder (video name -> text)"""
+    descriptions_path = os.path.join(gallery_path, CLIP_DESCRIPTIONS)
+    if not os.path.exists(descriptions_path):
+        return {}
+    try:
+        with open(descriptions_path, 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        print(f"Error reading {descriptions_path}, ignoring clip descriptions")
+        return {}
+
+def write_clip_descriptions(gallery_path, descriptions):
+    """Save the clip descriptions of a gallery folder"""
+    with open(os.path.join(gallery_path, CLIP_DESCRIPTIONS), 'w') as f:
+        json.dump(descriptions, f, indent=4)
+
+def select_clips(video_list, query, k=DEFAULT_CLIP_K, descriptions=None):
+    """
+    The k clips of a gallery most relevant to the query.
+
+    Args:
+        video_list (list): Video filenames of the gallery
+        query (str): The user's request (mothership and prompt)
+        k (int): Number of clips to keep
+        descriptions (dict, optional): Video name -> description, indexed with the filename
+
+    Returns:
+        list: Video filenames, most relevant first (the whole list if it has k clips or fewer)
+    """
+    if len(video_list) <= k:
+        return list(video_list)
+    descriptions = descriptions or {}
+    documents = [f"{video} {descriptions.get(video, '')}" for video in video_list]
+    return [video_list[i] for i in get_index(documents).top_k(query, k)]
+
+def example_text(example):
+    """Searchable text of a training example (its lines and videos)"""
+    if isinstance(example, list):
+        return " ".join(f"{item.get('line', '')} {item.get('video', '')}" if isinstance(item, dict) else str(item)
+                        for item in example)
+    return str(example)
+
+def select_examples(training_data, query, k=DEFAULT_EXAMPLE_K):
+    """
+    The k training examples most similar to the query.
+
+    Args:
+        training_data (dict): Example name -> example, as in agent.json
+        query (str): The user's request (mothership and prompt)
+        k (int): Number of examples to keep
+
+    Returns:
+        dict: The selected examples, most similar first
+    """
+    if len(training_data) <= k:
+        return dict(training_data)
+    names = list(training_data)
+    index = get_index([example_text(training_data[name]) for name in names])
+    return {names[i]: training_data[names[i]] for i in index.top_k(query, k)}
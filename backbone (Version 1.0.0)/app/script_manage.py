@@ -2,18 +2,134 @@ import json
 import re
 import os
 
+# Finds the start of the config array in a (partial) agent response
+CONFIG_ARRAY_PATTERN = re.compile(r'"config"\s*:\s*\[')
+
+def has_speech(line):
+    """
+    Whether a script line has text to speak. Lines without it get no audio, so they are
+    left out of the parsed script to keep one video per synthesized line.
+    """
+    return bool(line and line.strip())
+
+def sanitize_script(script):
+    """
+    Sanitize the script to fix common issues with AI-generated content.
+    """
+    if not script:
+        return script
+        
+    # Fix duplicate line keys
+    script = re.sub(r'"line": "(.*?)"\s*"line": "(.*?)"', r'"line": "\1\2"', script)
+    
+    # Fix incomplete JSON blocks
+    if '```json' in script and '```' not in script.split('```json', 1)[1]:
+        script += "\n```"
+    
+    # Make sure the final tag is present
+    if not script.strip().endswith('final'):
+        script = script.strip() + "\nfinal"
+    
+    return script
+
+class ScriptStreamParser:
+    """
+    Incremental parser for a streamed agent response. Text is fed as it arrives and every
+    {"line", "video"} object of the config array is returned as soon as its closing brace
+    has been received, so work on a line can start before the rest of the script exists.
+    Objects without spoken text are skipped and not numbered, so the indices match the
+    positions in ScriptManager.extract_data(), which stays the authoritative parse.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.position = 0       # Next character to scan
+        self.in_config = False  # Inside the config array
+        self.finished = False   # The config array has been closed
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.object_start = None
+        self.count = 0          # Pairs returned so far
+
+    def feed(self, chunk):
+        """
+        Add streamed text.
+
+        Returns:
+            list: (index, pair) tuples for the objects completed by this chunk
+        """
+        self.text += chunk
+        if self.finished:
+            return []
+        if not self.in_config:
+            # Rescan a little before the new text in case the key was split across chunks
+            match = CONFIG_ARRAY_PATTERN.search(self.text, max(0, self.position - 16))
+            if not match:
+                self.position = len(self.text)
+                return []
+            self.in_config = True
+            self.position = match.end()
+
+        pairs = []
+        text = self.text
+        while self.position < len(text):
+            char = text[self.position]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == '{':
+                if self.depth == 0:
+                    self.object_start = self.position
+                self.depth += 1
+            elif char == '}' and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    pair = self.parse_object(text[self.object_start:self.position + 1])
+                    if pair is not None:
+                        pairs.append((self.count, pair))
+                        self.count += 1
+            elif char == ']' and self.depth == 0:
+                self.finished = True
+                self.position += 1
+                break
+            self.position += 1
+        return pairs
+
+    def parse_object(self, object_str):
+        """Parse one config object the way extract_data() does, or None if it has no spoken line and video"""
+        object_str = re.sub(r'"line": "(.*?)"\s*"line": "(.*?)"', r'"line": "\1\2"', object_str)
+        try:
+            item = json.loads(object_str)
+        except json.JSONDecodeError:
+            match = re.search(r'"line"\s*:\s*"(.*?)",\s*"video"\s*:\s*"(.*?)"', object_str, re.DOTALL)
+            if not match:
+                return None
+            item = {"line": match.group(1).replace('\\"', '"'), "video": match.group(2)}
+        if not isinstance(item, dict) or 'line' not in item or 'video' not in item or not has_speech(item['line']):
+            return None
+        item['video'] = ScriptManager.sanitize_video_name(item['video'])
+        return item
+
 class ScriptManager:
-    def __init__(self, agent_response):
+    def __init__(self, agent_response, output_dir=os.path.join("app", "data", "current")):
         self.script = agent_response
         self.scripts = []  # Initialize the scripts list
-        self.output_dir = os.path.join("app", "data", "current")
+        self.output_dir = output_dir  # Where the video control file is saved (the session workspace)
         
         # Ensure the output directory exists
         os.makedirs(self.output_dir, exist_ok=True)
         
         print(f"ScriptManager initialized with output directory: {self.output_dir}")
 
-    def sanitize_video_name(self, video_name):
+    @staticmethod
+    def sanitize_video_name(video_name):
         """
         Sanitize video name by removing newlines and other problematic characters.
         
@@ -45,6 +161,9 @@ class ScriptManager:
         The response is expected to be a markdown code block starting with ```json
         containing a JSON object with a 'config' key.
         
+        Items without spoken text are skipped, so the lines, videos and speech timestamps
+        stay aligned.
+        
         Returns:
             list: List of dictionaries with 'line' and 'video' keys
         """
@@ -74,15 +193,17 @@ class ScriptManager:
             if 'config' in data:
                 config_data = data['config']
                 # Extract text and videos
+                result = []
                 for item in config_data:
-                    if 'line' in item and 'video' in item:
+                    if 'line' in item and 'video' in item and has_speech(item['line']):
                         self.full_script += item['line'] + " "
                         # Sanitize the video name before adding it
                         item['video'] = self.sanitize_video_name(item['video'])
                         self.videos.append(item['video'])
+                        result.append(item)
                 
                 self.ensure_script_format()
-                return config_data
+                return result
             else:
                 raise ValueError("JSON does not contain a 'config' key")
         except json.JSONDecodeError as e:
@@ -98,6 +219,8 @@ class ScriptManager:
                 for line, video in matches:
                     # Unescape any escaped quotes in the line
                     line = line.replace('\\"', '"')
+                    if not has_speech(line):
+                        continue
                     # Sanitize the video name
                     video = self.sanitize_video_name(video)
                     result.append({"line": line, "video": video})
@@ -120,6 +243,8 @@ class ScriptManager:
                     # Match as many lines with videos as possible
                     for i in range(min(len(lines), len(videos))):
                         line = lines[i].replace('\\"', '"')
+                        if not has_speech(line):
+                            continue
                         # Sanitize the video name
                         video = self.sanitize_video_name(videos[i])
                         result.append({"line": line, "video": video})
@@ -183,7 +308,7 @@ class ScriptManager:
     
     def save_video_control(self, video_control, output_file="video_control.json"):
         """
-        Saves the video control data to a JSON file in the data/current directory.
+        Saves the video control data to a JSON file in the output directory.
         
         Args:
             video_control: List of dictionaries with timestamp and video data
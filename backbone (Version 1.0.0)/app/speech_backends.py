@@ -0,0 +1,85 @@
+from abc import ABC, abstractmethod
+import os
+
+from app.http_client import get_http_client
+from app import tracing
+
+# When neither the caller nor the voice config picks a backend, the SPEECH_BACKEND
+# environment variable does: SPEECH_BACKEND=standin sends every request to the local
+# stand-in server (app/speech_standin.py), at SPEECH_STANDIN_URL if set
+DEFAULT_SPEECH_BACKEND = "unrealspeech"
+UNREALSPEECH_URL = "https://api.v8.unrealspeech.com/speech"
+STANDIN_URL = "http://127.0.0.1:8001/speech"
+
+class SpeechBackend(ABC):
+    """
+    A text-to-speech service that answers a speech request with the UnrealSpeech
+    response shape: a dict with TaskId, OutputUri (audio) and TimestampsUri (timestamps).
+    """
+
+    name = None
+
+    @abstractmethod
+    def synthesize(self, payload):
+        """
+        Request speech for a payload.
+
+        Args:
+            payload (dict): UnrealSpeech request fields (Text, VoiceId, Bitrate, AudioFormat, ...)
+
+        Returns:
+            dict: Response containing TaskId, OutputUri and TimestampsUri
+        """
+
+class UnrealSpeechBackend(SpeechBackend):
+    """The UnrealSpeech /speech API"""
+
+    name = "unrealspeech"
+
+    def __init__(self, api_key, api_url=UNREALSPEECH_URL):
+        self.api_key = api_key
+        self.api_url = api_url
+
+    def synthesize(self, payload):
+        headers = {
+            'Authorization': f'Bearer {self.api_key}'
+        }
+        with tracing.span(f"{self.name}.speech", "external", voice_id=payload.get("VoiceId"),
+                          characters=len(payload.get("Text", ""))):
+            response = get_http_client().post(self.api_url, headers=headers, json=payload)
+
+        if response.status_code != 200:
+            raise Exception(f"API request failed with status code {response.status_code}: {response.text}")
+
+        return response.json()
+
+class StandInSpeechBackend(UnrealSpeechBackend):
+    """
+    The local stand-in server. It speaks the UnrealSpeech protocol but returns
+    deterministic tone audio, so the pipeline can be load-tested offline.
+    """
+
+    name = "standin"
+
+    def __init__(self, api_url=None):
+        super().__init__(api_key="standin", api_url=api_url or os.getenv("SPEECH_STANDIN_URL", STANDIN_URL))
+
+SPEECH_BACKENDS = {
+    UnrealSpeechBackend.name: lambda: UnrealSpeechBackend(os.getenv("VOICE")),
+    StandInSpeechBackend.name: StandInSpeechBackend,
+}
+
+def get_speech_backend(name=None):
+    """
+    Create a speech backend by name ("unrealspeech" or "standin").
+
+    Args:
+        name (str, optional): Backend name. Defaults to the SPEECH_BACKEND environment variable.
+
+    Returns:
+        SpeechBackend: The backend
+    """
+    name = name or os.getenv("SPEECH_BACKEND", DEFAULT_SPEECH_BACKEND)
+    if name not in SPEECH_BACKENDS:
+        raise ValueError(f"Unknown speech backend '{name}'. Available: {', '.join(SPEECH_BACKENDS)}")
+    return SPEECH_BACKENDS[name]()
@@ -0,0 +1,141 @@
+"""
+Local stand-in for the UnrealSpeech /speech API.
+
+Answers speech requests in the same shape (TaskId, OutputUri, TimestampsUri) with
+deterministic audio: a tone (or silence) whose length follows the word count and the
+requested speed, and sentence timestamps that add up to it. Point the backend at it to
+load-test or benchmark the whole pipeline offline without using API quota:
+
+    python -m app.speech_standin --port 8001
+    SPEECH_BACKEND=standin python run.py
+
+Set STANDIN_LATENCY (seconds) to add a fixed delay to every speech request.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+import zlib
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse
+import uvicorn
+
+from app.ffmpeg_utils import run_ffmpeg
+
+STANDIN_DIR = "app/data/standin"
+WORDS_PER_SECOND = 2.6  # Speaking rate at speed 0
+MIN_SENTENCE_SECONDS = 0.3
+SAMPLE_RATE = 44100
+SENTENCE_PATTERN = re.compile(r"[^.!?]+(?:[.!?]+|$)\s*")
+
+app = FastAPI(title="Speech stand-in", description="Deterministic offline stand-in for the UnrealSpeech API")
+
+def sentence_timestamps(text, speed=0):
+    """
+    Split the text into sentences and give each a duration proportional to its word count.
+    Text without any sentence is covered by a single MIN_SENTENCE_SECONDS timestamp.
+
+    Returns:
+        list: Timestamps with start, end, text and text_offset, like UnrealSpeech's sentence timestamps
+    """
+    words_per_second = WORDS_PER_SECOND * max(0.25, 1 + float(speed))
+    timestamps = []
+    start = 0.0
+    for match in SENTENCE_PATTERN.finditer(text):
+        sentence = match.group(0)
+        if not sentence.strip():
+            continue
+        duration = max(MIN_SENTENCE_SECONDS, len(sentence.split()) / words_per_second)
+        timestamps.append({
+            "start": round(start, 3),
+            "end": round(start + duration, 3),
+            "text": sentence,
+            "text_offset": match.start()
+        })
+        start += duration
+    if not timestamps and text.strip():
+        # Punctuation-only text ("...", "?!") has no sentence words but still gets a short pause
+        timestamps.append({
+            "start": 0.0,
+            "end": MIN_SENTENCE_SECONDS,
+            "text": text,
+            "text_offset": 0
+        })
+    return timestamps
+
+def tone_frequency(voice_id, pitch=1):
+    """Every voice gets its own tone, shifted by the pitch"""
+    return (180 + zlib.crc32(str(voice_id).encode("utf-8")) % 200) * float(pitch or 1)
+
+def render_audio(path, duration, voice_id, pitch, bitrate, audio_format):
+    """Encode the tone (or silence, with STANDIN_AUDIO=silence) for the request"""
+    if os.getenv("STANDIN_AUDIO", "tone") == "silence":
+        source = f"anullsrc=r={SAMPLE_RATE}:cl=mono"
+    else:
+        source = f"sine=frequency={tone_frequency(voice_id, pitch):.1f}:sample_rate={SAMPLE_RATE}"
+    codec = ["-c:a", "libmp3lame", "-b:a", bitrate] if audio_format == "mp3" else ["-c:a", "pcm_s16le"]
+
+    # Encode to a temp file and rename so concurrent identical requests never serve a partial file
+    temp_path = f"{path}.{os.getpid()}.{time.monotonic_ns()}.tmp.{audio_format}"
+    run_ffmpeg(["-f", "lavfi", "-i", source, "-t", f"{duration:.3f}"] + codec + [temp_path])
+    os.replace(temp_path, path)
+
+@app.post("/speech")
+def speech(payload: dict, request: Request):
+    """Synthesize a request, reusing the files of an identical earlier request"""
+    text = payload.get("Text", "")
+    if not text.strip():
+        raise HTTPException(status_code=400, detail="Text is required")
+
+    latency = float(os.getenv("STANDIN_LATENCY", "0"))
+    if latency > 0:
+        time.sleep(latency)
+
+    voice_id = payload.get("VoiceId", "Sierra")
+    audio_format = payload.get("AudioFormat", "mp3")
+    if audio_format not in ("mp3", "wav"):
+        raise HTTPException(status_code=400, detail=f"Unsupported AudioFormat '{audio_format}'")
+
+    task_id = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+    audio_name = f"{task_id}.{audio_format}"
+    timestamps_name = f"{task_id}.json"
+    audio_path = os.path.join(STANDIN_DIR, audio_name)
+    timestamps_path = os.path.join(STANDIN_DIR, timestamps_name)
+
+    if not (os.path.exists(audio_path) and os.path.exists(timestamps_path)):
+        os.makedirs(STANDIN_DIR, exist_ok=True)
+        timestamps = sentence_timestamps(text, payload.get("Speed", 0))
+        render_audio(audio_path, timestamps[-1]["end"], voice_id, payload.get("Pitch", 1),
+                     payload.get("Bitrate", "192k"), audio_format)
+        temp_path = f"{timestamps_path}.{os.getpid()}.{time.monotonic_ns()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(timestamps, f, indent=2)
+        os.replace(temp_path, timestamps_path)
+
+    return {
+        "TaskId": task_id,
+        "TaskStatus": "completed",
+        "VoiceId": voice_id,
+        "RequestCharacters": len(text),
+        "OutputUri": str(request.url_for("files", name=audio_name)),
+        "TimestampsUri": str(request.url_for("files", name=timestamps_name)),
+        "CreationTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    }
+
+@app.get("/files/{name}", name="files")
+def files(name: str):
+    """Serve a synthesized audio or timestamps file"""
+    path = os.path.join(STANDIN_DIR, os.path.basename(name))
+    if not name or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="File not found")
+    return FileResponse(path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the UnrealSpeech API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,124 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+import json
+import os
+import threading
+import time
+
+# Spans are written in the Chrome trace event format (JSON array of "X" complete events),
+# one file per session. Open a file in chrome://tracing or https://ui.perfetto.dev to see
+# where a render spent its time. Set TRACING=0 to turn tracing off.
+TRACE_DIR = "app/data/traces"
+TRACING_ENABLED = os.getenv("TRACING", "1") != "0"
+
+# Tags (session_id, genre, agent, segments) attached to every span in the current context
+_trace_tags = ContextVar("trace_tags", default={})
+_write_lock = threading.Lock()
+
+def trace_path(session_id=None):
+    """Trace file of a session (spans outside a session go to trace.json)"""
+    return os.path.join(TRACE_DIR, f"{session_id}.json" if session_id else "trace.json")
+
+def current_tags():
+    """Tags of the current context"""
+    return dict(_trace_tags.get())
+
+@contextmanager
+def bind(**tags):
+    """Attach tags to every span opened inside the block"""
+    merged = current_tags()
+    merged.update({key: value for key, value in tags.items() if value is not None})
+    token = _trace_tags.set(merged)
+    try:
+        yield merged
+    finally:
+        _trace_tags.reset(token)
+
+def _create_trace_file(path):
+    """
+    Create a trace file holding the opening bracket, unless it exists already. The header
+    is written to a temp file and hard-linked into place, so the file appears with its
+    bracket at once and only one process (or thread) ever creates it.
+    """
+    if os.path.exists(path):
+        return
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w') as f:
+        f.write("[\n")
+    try:
+        os.link(temp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(temp_path)
+
+def _write_event(event, session_id):
+    path = trace_path(session_id)
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    # The array format allows a missing closing bracket, so events are only ever
+    # appended: every process can add to the same file without rewriting it
+    line = json.dumps(event, default=str) + ",\n"
+    with _write_lock:
+        _create_trace_file(path)
+        with open(path, 'a') as f:
+            f.write(line)
+
+@contextmanager
+def span(name, category="stage", **attributes):
+    """
+    Time a block as a span.
+
+    Args:
+        name (str): Span name (e.g. "merge-videos", "unrealspeech.generate")
+        category (str): "stage" for pipeline work, "external" for calls to other services
+        **attributes: Extra span arguments
+
+    Yields:
+        dict: The span arguments, so the block can add attributes (e.g. token counts)
+    """
+    if not TRACING_ENABLED:
+        yield dict(attributes)
+        return
+
+    args = current_tags()
+    args.update(attributes)
+    start = time.time()
+    try:
+        yield args
+    except BaseException as e:
+        args["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        end = time.time()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": int(start * 1_000_000),
+            "dur": int((end - start) * 1_000_000),
+            "pid": os.getpid(),
+            "tid": threading.get_native_id(),
+            "args": args,
+        }
+        try:
+            _write_event(event, args.get("session_id"))
+        except OSError as e:
+            print(f"Error writing trace span {name}: {e}")
+
+def traced(name=None, category="stage"):
+    """Decorator that wraps every call of a function in a span"""
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name, category):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def run_with_tags(tags, name, fn, *args):
+    """Run fn inside a span with the given tags (used to carry tags into worker processes)"""
+    with bind(**tags), span(name, "stage"):
+        return fn(*args)
@@ -0,0 +1,39 @@
+import os
+import shutil
+
+WORKSPACES_DIR = "app/data/workspaces"
+
+class Workspace:
+    """
+    Working directory of one session.
+
+    Every file a pipeline stage reads or writes (speech, timestamps, video control file,
+    intermediate and final videos, music, temp files) lives under
+    app/data/workspaces/<session_id>/, so concurrent sessions never share a path.
+    Only holds plain strings, so it can be passed to JobManager worker processes.
+    Readers pass create=False so looking at a workspace never creates its directory.
+    """
+
+    def __init__(self, session_id, root=WORKSPACES_DIR, create=True):
+        self.session_id = session_id
+        self.path = os.path.join(root, session_id)
+        if create:
+            os.makedirs(self.path, exist_ok=True)
+
+        self.audio_path = self.file("output_audio.mp3")
+        self.timestamps_path = self.file("output_timestamps.json")
+        self.video_control_path = self.file("video_control.json")
+        self.merged_video_path = self.file("output.mp4")  # Video-only merge output
+        self.pre_captions_path = self.file("output_pre_captions.mp4")
+        self.captioned_video_path = self.file("output_with_captions.mp4")
+        self.final_video_path = self.file("output_final.mp4")
+        self.music_path = self.file("music.mp3")
+        self.chunks_dir = self.file("chunks")  # Segment chunks of the copy and parallel merge engines
+
+    def file(self, name):
+        """Path of a file inside the workspace"""
+        return os.path.join(self.path, name)
+
+    def remove(self):
+        """Delete the workspace and everything in it"""
+        shutil.rmtree(self.path, ignore_errors=True)
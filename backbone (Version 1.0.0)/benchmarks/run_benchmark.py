@@ -0,0 +1,324 @@
+"""
+Offline end-to-end render benchmark.
+
+Builds a synthetic genre (colour bar, test pattern and noise clips at 480x854 in several
+durations), synthetic agent scripts with UnrealSpeech-style sentence timestamps, a tone
+speech track and a tone music track, then runs
+
+    ScriptManager -> VideoMerger -> CaptionAdder -> Music.merge_with_video
+
+without any network access. Each stage runs in its own child process and reports wall
+time, CPU time (including ffmpeg and worker subprocesses), peak RSS and output fps.
+
+Usage (from the backbone directory):
+
+    python -m benchmarks.run_benchmark
+    python -m benchmarks.run_benchmark --segments 5 20 --merge-engine copy --caption-backend ass
+    python -m benchmarks.run_benchmark --stages script render --render-engine ffmpeg --json results.json
+
+Unix only (uses the resource module for CPU time and peak RSS).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import time
+from pathlib import Path
+
+BACKBONE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKBONE_DIR))
+
+from app.ffmpeg_utils import (run_ffmpeg, probe_duration, write_mezzanine_manifest, fit_filter,
+                              MEZZANINE_ARGS, MEZZANINE_VERSION, VIDEO_WIDTH, VIDEO_HEIGHT, VIDEO_FPS)
+
+GENRE = "bench"
+CLIP_DURATIONS = [2, 4, 6, 8]
+# lavfi sources and the filter applied on top of them
+CLIP_PATTERNS = {
+    "bars": ("smptehdbars", ""),
+    "testsrc": ("testsrc2", ""),
+    "noise": ("color=c=gray", ",noise=alls=60:allf=t+u"),
+}
+WORDS_PER_SECOND = 2.6  # Speaking rate used for the synthetic timestamps
+VOCABULARY = (
+    "the convoy moved across a dusty ridge while engines roared and soldiers watched "
+    "distant smoke rise above quiet villages under a pale morning sky as radios crackled "
+    "with orders from command and every crew checked their gear before the long advance"
+).split()
+STAGES = ["script", "merge", "captions", "music", "render"]
+DEFAULT_STAGES = ["script", "merge", "captions", "music"]
+
+def build_gallery(gallery_dir):
+    """Encode the synthetic clips in the mezzanine format and record them in the manifest"""
+    gallery_dir.mkdir(parents=True, exist_ok=True)
+    manifest = {}
+    for name, (source, extra_filter) in CLIP_PATTERNS.items():
+        for duration in CLIP_DURATIONS:
+            video_name = f"{GENRE}_{name}_{duration}s.mp4"
+            video_path = gallery_dir / video_name
+            if not video_path.exists():
+                separator = ":" if "=" in source else "="
+                run_ffmpeg([
+                    "-f", "lavfi", "-i", f"{source}{separator}s={VIDEO_WIDTH}x{VIDEO_HEIGHT}:r={VIDEO_FPS}:d={duration}",
+                    "-vf", fit_filter() + extra_filter,
+                ] + MEZZANINE_ARGS + [str(video_path)])
+            manifest[video_name] = {"version": MEZZANINE_VERSION, "fps": VIDEO_FPS, "frames": duration * VIDEO_FPS}
+    write_mezzanine_manifest(str(gallery_dir), manifest)
+    return sorted(manifest)
+
+def build_case(case_dir, segments, videos, seed):
+    """
+    Write the synthetic agent script, timestamps, speech and music for one script size.
+
+    Returns:
+        dict: Paths and sizes of the case, passed to every stage
+    """
+    case_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed + segments)
+
+    config = []
+    timestamps = []
+    start = 0.0
+    text_offset = 0
+    for i in range(segments):
+        words = [rng.choice(VOCABULARY) for _ in range(rng.randint(6, 16))]
+        line = " ".join(words).capitalize() + ". "
+        end = start + len(words) / WORDS_PER_SECOND
+        config.append({"line": line.strip(), "video": videos[i % len(videos)]})
+        timestamps.append({"start": round(start, 3), "end": round(end, 3), "text": line, "text_offset": text_offset})
+        text_offset += len(line)
+        start = end
+    duration = start
+
+    script = "```json\n" + json.dumps({"config": config}, indent=2) + "\n```\nfinal"
+    timestamps_path = case_dir / "output_timestamps.json"
+    with open(timestamps_path, 'w') as f:
+        json.dump(timestamps, f, indent=2)
+
+    # Tone tracks stand in for the TTS and YouTube downloads
+    speech_path = case_dir / "output_audio.mp3"
+    music_path = case_dir / "music.mp3"
+    run_ffmpeg(["-f", "lavfi", "-i", f"sine=frequency=220:sample_rate=44100:duration={duration:.3f}",
+                "-c:a", "libmp3lame", "-b:a", "192k", str(speech_path)])
+    run_ffmpeg(["-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=44100:duration={duration + 30:.3f}",
+                "-c:a", "libmp3lame", "-b:a", "192k", str(music_path)])
+
+    return {
+        "segments": segments,
+        "duration": duration,
+        "dir": str(case_dir),
+        "script": script,
+        "timestamps_path": str(timestamps_path),
+        "speech_path": str(speech_path),
+        "music_path": str(music_path),
+        "video_control_path": str(case_dir / "video_control.json"),
+        "merged_path": str(case_dir / "output.mp4"),
+        "pre_captions_path": str(case_dir / "output_pre_captions.mp4"),
+        "captioned_path": str(case_dir / "output_with_captions.mp4"),
+        "final_path": str(case_dir / "output_final.mp4"),
+        "render_path": str(case_dir / "render_final.mp4"),
+    }
+
+def stage_script(case, options):
+    from app.script_manage import ScriptManager
+    script_manager = ScriptManager(case["script"], output_dir=case["dir"])
+    script_manager.extract_data()
+    with open(case["timestamps_path"], 'r') as f:
+        timestamps = json.load(f)
+    video_control = script_manager.create_video_control(timestamps)
+    script_manager.save_video_control(video_control, os.path.basename(case["video_control_path"]))
+    return None
+
+def stage_merge(case, options):
+    from app.merge_video import VideoMerger
+    merger = VideoMerger(
+        case["video_control_path"],
+        video_directory=options["gallery_dir"],
+        temp_output_path=case["merged_path"],
+        final_output_path=case["pre_captions_path"],
+        audio_path=case["speech_path"],
+        engine=options["merge_engine"],
+        workers=options["workers"],
+        chunk_threads=options["chunk_threads"]
+    )
+    if not merger.process():
+        raise RuntimeError("VideoMerger.process() failed")
+    return case["pre_captions_path"]
+
+def stage_captions(case, options):
+    from app.captions import CaptionAdder
+    caption_adder = CaptionAdder(
+        case["video_control_path"],
+        input_video_path=case["pre_captions_path"],
+        output_video_path=case["captioned_path"],
+        backend=options["caption_backend"]
+    )
+    output = caption_adder.add_captions_to_video()
+    if not output:
+        raise RuntimeError("CaptionAdder.add_captions_to_video() failed")
+    return output
+
+def offline_music(case):
+    """Music instance whose track is the synthetic tone (get_music is never called)"""
+    from app.music import Music
+    return Music("offline", volume=30, start_time=0, music_path=case["music_path"])
+
+def stage_music(case, options):
+    output = offline_music(case).merge_with_video(video_path=case["captioned_path"], output_path=case["final_path"])
+    if not output:
+        raise RuntimeError("Music.merge_with_video() failed")
+    return str(output)
+
+def stage_render(case, options):
+    from app.render import Renderer
+    renderer = Renderer(
+        case["video_control_path"],
+        audio_path=case["speech_path"],
+        output_path=case["render_path"],
+        music=offline_music(case),
+        engine=options["render_engine"]
+    )
+    output = renderer.render()
+    if not output:
+        raise RuntimeError("Renderer.render() failed")
+    return output
+
+STAGE_FUNCTIONS = {
+    "script": stage_script,
+    "merge": stage_merge,
+    "captions": stage_captions,
+    "music": stage_music,
+    "render": stage_render,
+}
+
+def max_rss_mb(usage):
+    """ru_maxrss is in kilobytes on Linux and bytes on macOS"""
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return usage.ru_maxrss / divisor
+
+def measure_stage(stage, case, options, conn):
+    """Child process body: run one stage and send back its measurements"""
+    os.chdir(BACKBONE_DIR)  # Components resolve fonts and config relative to the backbone directory
+    if options["quiet"]:
+        sys.stdout = open(os.devnull, 'w')
+
+    start_wall = time.perf_counter()
+    start_self = resource.getrusage(resource.RUSAGE_SELF)
+    start_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    error = None
+    output = None
+    try:
+        output = STAGE_FUNCTIONS[stage](case, options)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    wall = time.perf_counter() - start_wall
+    end_self = resource.getrusage(resource.RUSAGE_SELF)
+    end_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    cpu = ((end_self.ru_utime - start_self.ru_utime) + (end_self.ru_stime - start_self.ru_stime)
+           + (end_children.ru_utime - start_children.ru_utime) + (end_children.ru_stime - start_children.ru_stime))
+    conn.send({
+        "wall": wall,
+        "cpu": cpu,
+        "peak_rss_mb": max(max_rss_mb(end_self), max_rss_mb(end_children)),
+        "output": output,
+        "error": error,
+    })
+    conn.close()
+
+def run_stage(stage, case, options):
+    """Run a stage in a fresh process so its peak RSS is not mixed with other stages"""
+    parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=measure_stage, args=(stage, case, options, child_conn))
+    process.start()
+    child_conn.close()
+    try:
+        result = parent_conn.recv()
+    except EOFError:
+        result = {"wall": None, "cpu": None, "peak_rss_mb": None, "output": None,
+                  "error": f"stage process exited with status {process.exitcode}"}
+    process.join()
+
+    output = result.pop("output")
+    result["fps"] = None
+    if output and result["error"] is None and result["wall"]:
+        duration = probe_duration(output)
+        if duration:
+            result["fps"] = duration * VIDEO_FPS / result["wall"]
+    return result
+
+def format_value(value, digits=2):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+def print_report(results):
+    header = f"{'segments':>8}  {'stage':<9} {'wall s':>8} {'cpu s':>8} {'rss MB':>8} {'fps':>8}  error"
+    print(header)
+    print("-" * len(header))
+    for row in results:
+        print(f"{row['segments']:>8}  {row['stage']:<9} {format_value(row['wall']):>8} {format_value(row['cpu']):>8} "
+              f"{format_value(row['peak_rss_mb'], 1):>8} {format_value(row['fps'], 1):>8}  {row['error'] or ''}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end render benchmark")
+    parser.add_argument("--segments", type=int, nargs="+", default=[5, 20, 50], help="Script sizes to benchmark")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=DEFAULT_STAGES, help="Stages to run, in order")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per script size")
+    parser.add_argument("--merge-engine", default="moviepy", choices=["moviepy", "ffmpeg", "copy", "parallel"])
+    parser.add_argument("--caption-backend", default="moviepy", choices=["moviepy", "ass"])
+    parser.add_argument("--render-engine", default="moviepy", choices=["moviepy", "ffmpeg"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Chunk encode workers (parallel engine)")
+    parser.add_argument("--chunk-threads", type=int, default=0, help="Encoder threads per chunk")
+    parser.add_argument("--work-dir", default=str(BACKBONE_DIR / "benchmarks" / "output"), help="Where the synthetic data and outputs go")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    parser.add_argument("--keep", action="store_true", help="Keep the rendered outputs")
+    parser.add_argument("--verbose", action="store_true", help="Show the components' own output")
+    args = parser.parse_args()
+
+    work_dir = Path(args.work_dir).resolve()
+    gallery_dir = work_dir / "videos" / GENRE
+    print(f"Building synthetic gallery in {gallery_dir}")
+    videos = build_gallery(gallery_dir)
+
+    options = {
+        "gallery_dir": str(gallery_dir),
+        "merge_engine": args.merge_engine,
+        "caption_backend": args.caption_backend,
+        "render_engine": args.render_engine,
+        "workers": args.workers,
+        "chunk_threads": args.chunk_threads,
+        "quiet": not args.verbose,
+    }
+    print(f"Options: {json.dumps({k: v for k, v in options.items() if k != 'gallery_dir'})}")
+
+    results = []
+    for segments in args.segments:
+        for run in range(args.repeat):
+            case_dir = work_dir / f"case_{segments}_{run}"
+            case = build_case(case_dir, segments, videos, args.seed)
+            print(f"\n{segments} segments ({case['duration']:.1f}s of speech), run {run + 1}/{args.repeat}")
+            for stage in args.stages:
+                result = run_stage(stage, case, options)
+                result.update({"segments": segments, "run": run, "stage": stage, "duration": case["duration"]})
+                results.append(result)
+                print(f"  {stage:<9} wall {format_value(result['wall'])}s  cpu {format_value(result['cpu'])}s  "
+                      f"rss {format_value(result['peak_rss_mb'], 1)}MB  fps {format_value(result['fps'], 1)}"
+                      + (f"  ERROR {result['error']}" if result["error"] else ""))
+                if result["error"]:
+                    break  # Later stages depend on this one's output
+            if not args.keep:
+                shutil.rmtree(case_dir, ignore_errors=True)
+
+    print()
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"options": options, "results": results}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Body, Query, Path, Depends
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Body, Query, Path, Depends, Request
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
+import asyncio
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from typing import Dict, Any, Optional, List, Union
@@ -19,13 +20,26 @@ import sys
 import shutil
 # Import the components from our app
 sys.path.append('./app')
-from app.audio_manage import AudioManager
-from app.script_manage import ScriptManager
-from app.merge_video import VideoMerger
-from app.captions import CaptionAdder
+from app.script_manage import ScriptManager, sanitize_script
 from app.config import Config
-from app.agent import Agent_Medium
+from app.agent import Agent_Medium, DEFAULT_RESPONSE_CACHE_TTL
+from app.retrieval import (select_clips, select_examples, read_clip_descriptions,
+                           DEFAULT_CLIP_K, DEFAULT_EXAMPLE_K)
 from app.delivery import Delivery
+from app.jobs import JobManager
+from app.workspace import Workspace
+from app import progress
+from app import tracing
+from app.pipeline import (
+    stream_script_stage,
+    create_speech_stage,
+    merge_videos_stage,
+    add_captions_stage,
+    add_music_stage,
+    render_stage,
+    gallery_upload_stage,
+    gallery_mezzanine_stage
+)
 
 #gallery
 from app.gallery.gallery import Gallery
@@ -76,9 +90,24 @@ class SessionManager:
                 return True
         return False
 
+def is_session_id(value):
+    """Whether a value has the form of a session id (a UUID, as made by create_session)"""
+    try:
+        return str(uuid.UUID(value)) == value
+    except (ValueError, AttributeError, TypeError):
+        return False
+
 # Initialize the session manager
 session_manager = SessionManager()
 
+# Initialize the job manager that runs the pipeline stages off the event loop
+render_config = Config("", "")
+render_config.config_pipeline('render', 'get', None)
+job_manager = JobManager(
+    process_workers=render_config.data.get('job_workers') or os.cpu_count() or 1,
+    thread_workers=render_config.data.get('speech_workers', 8)
+)
+
 app = FastAPI(
     title="Video Generation API",
     description="API for generating videos with AI-generated scripts, text-to-speech, and video editing",
@@ -182,9 +211,17 @@ class ScriptRequest(BaseModel):
     genre: str = "military"
     agent: str = "medium"
     session_id: Optional[str] = None
+    reroll: bool = False  # Skip the response cache and generate a new script for the same request
+
+class BatchScriptRequest(BaseModel):
+    scripts: List[ScriptRequest]
+
+class StreamScriptRequest(ScriptRequest):
+    background: bool = False  # Return 202 with a job id instead of waiting for the stage
 
 class SessionRequest(BaseModel):
     session_id: str
+    background: bool = False  # Return 202 with a job id instead of waiting for the stage
 
 class GenericResponse(BaseModel):
     success: bool
@@ -192,35 +229,62 @@ class GenericResponse(BaseModel):
     data: Any = None
     session_id: Optional[str] = None
 
-def sanitize_script(script):
-    """
-    Sanitize the script to fix common issues with AI-generated content.
-    """
-    if not script:
-        return script
-        
-    # Fix duplicate line keys
-    script = re.sub(r'"line": "(.*?)"\s*"line": "(.*?)"', r'"line": "\1\2"', script)
-    
-    # Fix incomplete JSON blocks
-    if '```json' in script and '```' not in script.split('```json', 1)[1]:
-        script += "\n```"
-    
-    # Make sure the final tag is present
-    if not script.strip().endswith('final'):
-        script = script.strip() + "\nfinal"
-    
-    return script
+async def run_stage(request, stage, fn, *args, cpu=True, message=""):
+    """
+    Submit a pipeline stage to the job manager.
+
+    The stage runs in a worker, so the event loop stays free while it renders. With
+    request.background the job id is returned right away (202) and the result can be
+    polled from /api/jobs/{job_id}; otherwise the response waits for the job.
+    """
+    session_id = request.session_id
+
+    # Tag the stage's trace spans with the session's genre, agent and segment count
+    session = session_manager.get_session(session_id) or {}
+    parsed_script = session.get("parsed_script") or {}
+    tags = {
+        "genre": session.get("genre"),
+        "agent": session.get("agent"),
+        "segments": len(parsed_script.get("videos", []))
+    }
+
+    def store_results(result):
+        # Store the stage outputs in the session
+        for key, value in result["session"].items():
+            session_manager.update_session(session_id, key, value)
+
+    # Every stage works inside the session's own workspace directory
+    workspace = Workspace(session_id)
+    job_id, future = job_manager.submit(session_id, stage, fn, workspace, *args, cpu=cpu, on_success=store_results, tags=tags)
+
+    if request.background:
+        return JSONResponse(
+            status_code=202,
+            content=GenericResponse(
+                success=True,
+                message=f"{stage} job queued",
+                data={"job_id": job_id, "status": "queued"},
+                session_id=session_id
+            ).model_dump()
+        )
 
+    try:
+        result = await asyncio.wrap_future(future)
+    except Exception as e:
+        print(f"Error in {stage}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error in {stage}: {str(e)}")
 
-@app.post("/api/generate-script", response_model=GenericResponse, tags=["Script"])
-async def generate_script(request: ScriptRequest):
+    return GenericResponse(
+        success=True,
+        message=message,
+        data=result["data"],
+        session_id=session_id
+    )
+
+async def build_agent(request):
     """
-    Generate an AI script based on the provided prompt and parameters.
+    Create the script agent for a request's genre and agent config.
     """
-    # Create a new session or use the provided one
-    session_id = request.session_id or session_manager.create_session()
-    
     try:
         with open(f"app/data/videos/{request.genre}/video_list.json", "r") as f:
             video_list = json.load(f)
@@ -231,13 +295,42 @@ async def generate_script(request: ScriptRequest):
     # Fix: Await the async function and access the data property of the returned object
     config_response = await update_config(object='agent', action='get', genre=request.genre, agent=request.agent, data=None)
     system = config_response.data['system_prompt']
-
-    
-    
     print(f'system: {system}\n\n')
+
+    # Only the clips and examples most relevant to the request go into the prompt, so its
+    # size stays bounded however many clips the genre has
+    training_config = Config(request.genre, request.agent)
+    try:
+        training_config.training_data()
+        training_data = training_config.agent_training_data
+    except (AttributeError, FileNotFoundError):
+        # No examples for this genre and agent: fall back to the default ones
+        default_config = Config("military", "medium")
+        default_config.training_data()
+        training_data = default_config.agent_training_data
+    query = f"{request.mothership} {request.prompt}"
+    with tracing.span("retrieval.select", clips=len(video_list)) as span:
+        clips = select_clips(video_list, query, config_response.data.get('clip_k', DEFAULT_CLIP_K),
+                             read_clip_descriptions(f"app/data/videos/{request.genre}"))
+        examples = select_examples(training_data, query, config_response.data.get('example_k', DEFAULT_EXAMPLE_K))
+        span["selected_clips"] = len(clips)
+        span["examples"] = list(examples)
+    print(f"Selected {len(clips)} of {len(video_list)} clips and examples {list(examples)}\n\n")
+
+    # Identical requests are answered from the response cache for response_cache_ttl seconds
+    return Agent_Medium(system, request.mothership, request.prompt, str(clips), training_data=examples,
+                        use_cache=not request.reroll,
+                        cache_ttl=config_response.data.get('response_cache_ttl', DEFAULT_RESPONSE_CACHE_TTL))
+
+async def generate_and_store_script(request, session_id):
+    """
+    Generate a script on the async agent client and store it in the session.
+    Waits on the model without blocking the event loop.
+    """
+    agent = await build_agent(request)
     print("Generating script...\n\n")
-    agent = Agent_Medium(system, request.mothership, request.prompt, str(video_list))
-    raw_script = agent.generate_response()
+    with tracing.bind(session_id=session_id, genre=request.genre, agent=request.agent), tracing.span("generate-script"):
+        raw_script = await agent.agenerate_response()
     print(f"Raw script received from agent (length: {len(raw_script)})\n\n")
 
     script = sanitize_script(raw_script)
@@ -252,6 +345,17 @@ async def generate_script(request: ScriptRequest):
     script_file = session_manager.session_dir / f"{session_id}_script.txt"
     with open(script_file, "w") as f:
         f.write(script)
+    return script
+
+@app.post("/api/generate-script", response_model=GenericResponse, tags=["Script"])
+async def generate_script(request: ScriptRequest):
+    """
+    Generate an AI script based on the provided prompt and parameters.
+    """
+    # Create a new session or use the provided one
+    session_id = request.session_id or session_manager.create_session()
+    
+    script = await generate_and_store_script(request, session_id)
 
     return GenericResponse(
         success=True,
@@ -260,6 +364,34 @@ async def generate_script(request: ScriptRequest):
         session_id=session_id
     )
 
+@app.post("/api/generate-scripts", response_model=GenericResponse, tags=["Script"])
+async def generate_scripts(request: BatchScriptRequest):
+    """
+    Generate scripts for many (mothership, prompt, genre) requests concurrently, one
+    session each. The model requests share the process-wide async client, and at most
+    AGENT_CONCURRENCY of them are in flight at once. A failed script does not fail the batch.
+    """
+    if not request.scripts:
+        raise HTTPException(status_code=400, detail="No scripts requested")
+    
+    async def generate_one(item):
+        session_id = item.session_id or session_manager.create_session()
+        try:
+            script = await generate_and_store_script(item, session_id)
+            return {"session_id": session_id, "success": True, "script": script}
+        except Exception as e:
+            print(f"Error generating script for session {session_id}: {str(e)}")
+            return {"session_id": session_id, "success": False, "error": str(e)}
+    
+    results = await asyncio.gather(*(generate_one(item) for item in request.scripts))
+    succeeded = sum(1 for result in results if result["success"])
+    
+    return GenericResponse(
+        success=succeeded == len(results),
+        message=f"Generated {succeeded} of {len(results)} scripts",
+        data={"results": results}
+    )
+
 @app.post("/api/parse-script", response_model=GenericResponse, tags=["Script"])
 async def parse_script(request: SessionRequest):
     """
@@ -330,6 +462,52 @@ async def parse_script(request: SessionRequest):
         session_id=request.session_id
     )
 
+@app.post("/api/stream-script", response_model=GenericResponse, tags=["Script"])
+async def stream_script(request: StreamScriptRequest):
+    """
+    Generate the script and its speech in one stage.
+    
+    The agent's response is streamed and every line's speech starts as soon as the line
+    is complete, instead of after the whole script has been generated and parsed. With the
+    copy and parallel merge engines the segment chunks are also encoded along the way, so
+    /api/merge-videos or /api/render can follow directly. Replaces /api/generate-script,
+    /api/parse-script and /api/create-speech, which always synthesize in "lines" mode here.
+    """
+    # Create a new session or use the provided one
+    if request.session_id and not session_manager.get_session(request.session_id):
+        session_manager._load_session(request.session_id)
+    if not request.session_id or not session_manager.get_session(request.session_id):
+        request.session_id = session_manager.create_session()
+    session_manager.update_session(request.session_id, "genre", request.genre)
+    session_manager.update_session(request.session_id, "agent", request.agent)
+    
+    agent = await build_agent(request)
+    
+    config_response = await update_config(object='voice', action='get', genre=request.genre, agent=request.agent, data=None)
+    voice = {
+        "voice_id": config_response.data['voice_id'],
+        "speed": config_response.data['speed'],
+        "pitch": config_response.data['pitch'],
+        "line_workers": config_response.data.get('line_workers', 4),
+        # None falls back to the SPEECH_BACKEND environment variable
+        "backend": config_response.data.get('backend')
+    }
+    
+    config_response = await update_config(object='render', action='get', data=None)
+    render_settings = {
+        "merge_engine": config_response.data.get('merge_engine', 'moviepy'),
+        "merge_workers": config_response.data.get('merge_workers') or os.cpu_count() or 1,
+        "chunk_threads": config_response.data.get('chunk_threads', 0)
+    }
+    
+    # The stage mostly waits on the model and the TTS API, so it runs in the thread pool
+    return await run_stage(
+        request, "stream-script", stream_script_stage,
+        agent, voice, render_settings,
+        cpu=False,
+        message="Script and speech created successfully"
+    )
+
 @app.post("/api/create-speech", response_model=GenericResponse, tags=["Speech"])
 async def create_speech(request: SessionRequest):
     """
@@ -387,54 +565,35 @@ async def create_speech(request: SessionRequest):
     if not isinstance(script_text, str):
         script_text = str(script_text)
     
-    # Use AudioManager to generate speech from the script text
-    audio_manager = AudioManager()
-
     # Get voice configuration using genre and agent from session
     config_response = await update_config(object='voice', action='get', genre=genre, agent=agent, data=None)
     voice_id = config_response.data['voice_id']
     speed = config_response.data['speed']
     pitch = config_response.data['pitch']
+    # "lines" synthesizes each script line in parallel, "script" sends the full script at once
+    speech_mode = config_response.data.get('mode', 'script')
+    line_workers = config_response.data.get('line_workers', 4)
+    # None falls back to the SPEECH_BACKEND environment variable
+    speech_backend = config_response.data.get('backend')
+    lines = [line.get("line", "") for line in parsed_script.get("lines", [])]
 
     print(f"voice_id: {voice_id}\n\n")
     print(f"speed: {speed}\n\n")
     print(f"pitch: {pitch}\n\n")
-    try:
-        # Use the process_text_to_speech method instead, which handles the generation and saving
-        audio_path, timestamps_path = audio_manager.process_text_to_speech(
-            text=script_text,
-            voice_id=voice_id,
-            audio_filename="output_audio.mp3",
-            timestamps_filename="output_timestamps.json",
-            speed=speed,
-            pitch=pitch
-        )
-        print(f"Speech generation successful. Audio saved to: {audio_path}")
-    except Exception as e:
-        # Provide more detailed error information
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"Speech generation error: {str(e)}\n{error_trace}")
-        raise HTTPException(status_code=500, detail=f"Error generating speech: {str(e)}")
-    
-    # Store audio path in session
-    session_manager.update_session(request.session_id, "audio_path", audio_path)
-    session_manager.update_session(request.session_id, "timestamps_path", timestamps_path)
-    
-    return GenericResponse(
-        success=True,
-        message="Speech created successfully",
-        data={"audio_path": audio_path, "timestamps_path": timestamps_path},
-        session_id=request.session_id
+    print(f"speech mode: {speech_mode} ({len(lines)} lines)\n\n")
+
+    # Speech generation waits on the TTS API, so it runs in the thread pool
+    return await run_stage(
+        request, "create-speech", create_speech_stage,
+        script_text, voice_id, speed, pitch, lines, speech_mode, line_workers, speech_backend,
+        cpu=False,
+        message="Speech created successfully"
     )
 
-@app.post("/api/merge-videos", response_model=GenericResponse, tags=["Video"])
-async def merge_videos(request: SessionRequest):
+def require_rendering_inputs(session):
     """
-    Merge videos according to the script and audio.
+    Check that a session has everything needed to build its video control file.
     """
-    # Get data from session
-    session = session_manager.get_session(request.session_id)
     if not session:
         raise HTTPException(status_code=400, detail="Session not found")
     
@@ -443,57 +602,60 @@ async def merge_videos(request: SessionRequest):
     
     if not session.get("timestamps_path"):
         raise HTTPException(status_code=400, detail="Missing timestamps path in session. Speech generation must be completed first.")
+
+async def resolve_music_params(session):
+    """
+    Get the music parameters for a session, preferring values set through /api/set-music-params.
+    """
+    # Get genre and agent from session
+    genre = session.get("genre", "military")  # Default to military if not found
+    agent = session.get("agent", "medium")    # Default to medium if not found
+    print(f"Using genre: {genre}, agent: {agent}")
     
-    parsed_script = session["parsed_script"]
-    audio_path = session["audio_path"]
-    timestamps_path = session["timestamps_path"]
+    # Override defaults with any music parameters already set in the session
+    stored_youtube_url = session.get("youtube_url")
+    stored_volume = session.get("volume")
+    stored_start_time = session.get("start_time")
     
-    # Step 1: Load the timestamps and create video control file
-    print("\nCreating video control file...")
-    try:
-        # Load timestamps from file
-        with open(timestamps_path, 'r') as f:
-            timestamps = json.load(f)
-        
-        # Create the video control file using the ScriptManager
-        script_manager = ScriptManager(session.get("script", ""))
-        script_manager.full_script = parsed_script.get("full_script", "")
-        script_manager.videos = parsed_script.get("videos", [])
-        
-        # Use the existing parsed data
-        video_control = script_manager.create_video_control(timestamps)
-        video_control_path = script_manager.save_video_control(video_control, "video_control.json")
-        print(f"Video control file created: {video_control_path}")
-        
-        # Store video control path in session
-        session_manager.update_session(request.session_id, "video_control_path", video_control_path)
-    except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"Error creating video control file: {str(e)}\n{error_trace}")
-        raise HTTPException(status_code=500, detail=f"Error creating video control file: {str(e)}")
+    config_response = await update_config(object='music', action='get', genre=genre, agent=agent, data=None)
+    # How far the music is lowered under the speech (0 disables ducking)
+    duck_db = config_response.data.get('duck_db', 0)
     
-    # Step 2: Merge videos using the VideoMerger
-    print("\nMerging videos...")
-    try:
-        # Initialize the VideoMerger with the video control file
-        merger = VideoMerger(video_control_path)
-        video_path = merger.process()
-        print(f"Merged video saved to: {video_path}")
-    except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"Error merging videos: {str(e)}\n{error_trace}")
-        raise HTTPException(status_code=500, detail=f"Error merging videos: {str(e)}")
-    
-    # Store video path in session
-    session_manager.update_session(request.session_id, "video_path", video_path)
+    # If we have music parameters stored in the session, use those instead of getting from config
+    if stored_youtube_url or stored_volume is not None or stored_start_time is not None:
+        youtube_url = stored_youtube_url or "https://www.youtube.com/watch?v=AtPrjYp75uA"
+        volume = 50 if stored_volume is None else stored_volume
+        start_time = 0 if stored_start_time is None else stored_start_time
+        print(f"Using stored music parameters: url={youtube_url}, volume={volume}, start_time={start_time}")
+    else:
+        # Otherwise get from config
+        youtube_url = config_response.data['url']
+        volume = config_response.data['volume']
+        start_time = config_response.data['start_time']
+        print(f"Using config music parameters: url={youtube_url}, volume={volume}, start_time={start_time}")
     
-    return GenericResponse(
-        success=True,
-        message="Videos merged successfully",
-        data={"video_path": video_path, "video_control_path": video_control_path},
-        session_id=request.session_id
+    return youtube_url, volume, start_time, duck_db
+
+@app.post("/api/merge-videos", response_model=GenericResponse, tags=["Video"])
+async def merge_videos(request: SessionRequest):
+    """
+    Merge videos according to the script and audio.
+    """
+    # Get data from session
+    session = session_manager.get_session(request.session_id)
+    require_rendering_inputs(session)
+    
+    config_response = await update_config(object='render', action='get', data=None)
+    render_settings = {
+        "merge_engine": config_response.data.get('merge_engine', 'moviepy'),
+        "merge_workers": config_response.data.get('merge_workers') or os.cpu_count() or 1,
+        "chunk_threads": config_response.data.get('chunk_threads', 0)
+    }
+    
+    return await run_stage(
+        request, "merge-videos", merge_videos_stage,
+        session.get("script", ""), session["parsed_script"], session["timestamps_path"], session["audio_path"], render_settings,
+        message="Videos merged successfully"
     )
 
 @app.post("/api/add-captions", response_model=GenericResponse, tags=["Video"])
@@ -506,21 +668,15 @@ async def add_captions(request: SessionRequest):
     if not session or not session.get("video_path"):
         raise HTTPException(status_code=400, detail="No video path found in session")
     
-    video_path = session["video_path"]
-    parsed_script = session["parsed_script"]
-    
-    # Add captions
-    caption_adder = CaptionAdder('app/data/current/video_control.json')
-    captioned_video_path = caption_adder.add_captions_to_video()
+    video_control_path = session.get("video_control_path") or Workspace(request.session_id, create=False).video_control_path
     
-    # Store captioned video path in session
-    session_manager.update_session(request.session_id, "captioned_video_path", captioned_video_path)
+    config_response = await update_config(object='render', action='get', data=None)
+    caption_backend = config_response.data.get('caption_backend', 'moviepy')
     
-    return GenericResponse(
-        success=True,
-        message="Captions added successfully",
-        data={"video_path": captioned_video_path},
-        session_id=request.session_id
+    return await run_stage(
+        request, "add-captions", add_captions_stage,
+        video_control_path, session["video_path"], caption_backend,
+        message="Captions added successfully"
     )
 
 @app.post("/api/add-music", response_model=GenericResponse, tags=["Audio"])
@@ -533,49 +689,64 @@ async def add_music(request: SessionRequest):
     if not session or not session.get("captioned_video_path"):
         raise HTTPException(status_code=400, detail="No captioned video path found in session")
     
-    captioned_video_path = session["captioned_video_path"]
+    youtube_url, volume, start_time, duck_db = await resolve_music_params(session)
     
-    # Get genre and agent from session
-    genre = session.get("genre", "military")  # Default to military if not found
-    agent = session.get("agent", "medium")    # Default to medium if not found
-    print(f"Using genre: {genre}, agent: {agent}")
+    return await run_stage(
+        request, "add-music", add_music_stage,
+        youtube_url, volume, start_time, session["captioned_video_path"], duck_db,
+        message="Music added successfully"
+    )
+
+@app.post("/api/render", response_model=GenericResponse, tags=["Video"])
+async def render_video(request: SessionRequest):
+    """
+    Render the final video (merge, captions and music) in a single encode.
     
-    # Import Music class
-    from app.music import Music
+    Runs after /api/create-speech and replaces /api/merge-videos, /api/add-captions
+    and /api/add-music, which stay available for debugging individual stages.
+    """
+    # Get data from session
+    session = session_manager.get_session(request.session_id)
+    require_rendering_inputs(session)
     
-    # Override defaults with any music parameters already set in the session
-    stored_youtube_url = session.get("youtube_url")
-    stored_volume = session.get("volume")
-    stored_start_time = session.get("start_time")
+    music_params = await resolve_music_params(session)
     
-    # If we have music parameters stored in the session, use those instead of getting from config
-    if stored_youtube_url or stored_volume is not None or stored_start_time is not None:
-        youtube_url = stored_youtube_url or "https://www.youtube.com/watch?v=AtPrjYp75uA"
-        volume = 50 if stored_volume is None else stored_volume
-        start_time = 0 if stored_start_time is None else stored_start_time
-        print(f"Using stored music parameters: url={youtube_url}, volume={volume}, start_time={start_time}")
-    else:
-        # Otherwise get from config
-        config_response = await update_config(object='music', action='get', genre=genre, agent=agent, data=None)
-        youtube_url = config_response.data['url']
-        volume = config_response.data['volume']
-        start_time = config_response.data['start_time']
-        print(f"Using config music parameters: url={youtube_url}, volume={volume}, start_time={start_time}")
-
-    # Download and add music
-    music = Music(youtube_url, volume, start_time)
-    music_file = music.get_music()
-    print(f"music_file: {music_file}\n\n")
-    final_output = music.merge_with_video(video_path='app/data/current/output_with_captions.mp4', output_path='app/data/current/output_final.mp4')
+    config_response = await update_config(object='render', action='get', data=None)
+    render_engine = config_response.data.get('render_engine', 'moviepy')
     
-    # Store final video path in session
-    session_manager.update_session(request.session_id, "final_video_path", final_output)
+    return await run_stage(
+        request, "render", render_stage,
+        session.get("script", ""), session["parsed_script"], session["timestamps_path"],
+        session["audio_path"], music_params, render_engine,
+        message="Video rendered successfully"
+    )
+
+@app.get("/api/jobs/{job_id}", response_model=GenericResponse, tags=["Jobs"])
+async def get_job(job_id: str):
+    """
+    Get the status of a background job (queued, running, completed or failed).
+    """
+    job = job_manager.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
     
     return GenericResponse(
         success=True,
-        message="Music added successfully",
-        data={"video_path": final_output},
-        session_id=request.session_id
+        message="Job retrieved successfully",
+        data=job,
+        session_id=job["session_id"]
+    )
+
+@app.get("/api/session/{session_id}/jobs", response_model=GenericResponse, tags=["Jobs"])
+async def get_session_jobs(session_id: str):
+    """
+    List the jobs submitted for a session.
+    """
+    return GenericResponse(
+        success=True,
+        message="Jobs retrieved successfully",
+        data={"jobs": job_manager.session_jobs(session_id)},
+        session_id=session_id
     )
 
 # Add endpoints to set music parameters in the session
@@ -625,6 +796,40 @@ async def get_session(session_id: str):
         session_id=session_id
     )
 
+@app.get("/api/session/{session_id}/progress", tags=["Session"])
+async def stream_progress(session_id: str, request: Request):
+    """
+    Stream the progress of the session's running stage as Server-Sent Events.
+    
+    Each event is the JSON state written by the stage: stage, status, phase,
+    percent, fps and eta (seconds).
+    """
+    # The id becomes a path, so only known sessions get there
+    if not is_session_id(session_id) or not session_manager.get_session(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    workspace = Workspace(session_id, create=False)
+    
+    async def events():
+        last_state = None
+        last_sent = time.time()
+        while not await request.is_disconnected():
+            state = progress.read_progress(workspace.path)
+            if state is not None and state != last_state:
+                last_state = state
+                last_sent = time.time()
+                yield f"data: {json.dumps(state)}\n\n"
+            elif time.time() - last_sent > 15:
+                # Comment line keeps proxies from closing an idle stream
+                last_sent = time.time()
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(0.5)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/api/get-video-url")
 async def get_video_url(request: SessionRequest):
     """
@@ -636,15 +841,19 @@ async def get_video_url(request: SessionRequest):
         raise HTTPException(status_code=404, detail="Session not found")
     
     # Check if we have a final video path in the session
-    final_video_path = session.get("final_video_path", "app/data/current/output_final.mp4")
+    final_video_path = session.get("final_video_path") or Workspace(request.session_id, create=False).final_video_path
     
     # Print debugging information
     print(f"Session ID: {request.session_id}")
     print(f"Final video path from session: {final_video_path}")
     
-    # Create the delivery object and upload the video
+    # Create the delivery object and upload the video off the event loop
     delivery = Delivery()
-    result = delivery.upload_video(file_path=final_video_path)
+    with progress.track(Workspace(request.session_id).path, "get-video-url"), \
+         tracing.bind(session_id=request.session_id, genre=session.get("genre"), agent=session.get("agent")), \
+         tracing.span("get-video-url"):
+        progress.phase("upload")
+        result = await asyncio.to_thread(delivery.upload_video, file_path=final_video_path)
     
     # Check for errors
     if "error" in result:
@@ -675,8 +884,28 @@ class GalleryDeleteRequest(BaseModel):
     genre: str
     video_name: str
 
+def queue_gallery_job(genre, stage, fn, *args):
+    """
+    Submit a gallery job to the job manager and return 202 with its job id.
+
+    Gallery jobs are grouped under a "gallery-<genre>" session id, so they can be listed
+    from /api/session/gallery-<genre>/jobs and polled from /api/jobs/{job_id}.
+    """
+    session_id = f"gallery-{genre}"
+    job_id, _ = job_manager.submit(session_id, stage, fn, *args, cpu=False, tags={"genre": genre})
+
+    return JSONResponse(
+        status_code=202,
+        content=GenericResponse(
+            success=True,
+            message=f"{stage} job queued",
+            data={"job_id": job_id, "status": "queued", "genre": genre},
+            session_id=session_id
+        ).model_dump()
+    )
+
 @app.post("/api/gallery/create")
-async def create_gallery(request: GenreRequest):
+def create_gallery(request: GenreRequest):
     """
     Create a new gallery for a genre.
     """
@@ -688,23 +917,17 @@ async def create_gallery(request: GenreRequest):
         data={"genre": request.genre},
     )
 
-@app.post("/api/gallery/upload")
-async def upload_to_gallery(request: GalleryUploadRequest):
+@app.post("/api/gallery/upload", status_code=202)
+def upload_to_gallery(request: GalleryUploadRequest):
     """
-    Upload a video to the gallery.
+    Upload a video to the gallery. The download, naming and screenshots run as a job.
     """
-    gallery = Gallery(request.genre)
-    gallery.upload_pipeline(request.video_url, request.description)
-
-    return GenericResponse(
-        success=True,
-        message="Video uploaded to gallery successfully",
-        data={"genre": request.genre},
-    )
+    return queue_gallery_job(request.genre, "gallery-upload", gallery_upload_stage,
+                             request.genre, request.video_url, request.description)
 
 
 @app.get("/api/gallery/get")
-async def get_gallery(genre: str):
+def get_gallery(genre: str):
     """
     Get the gallery for a genre.
     """
@@ -737,8 +960,16 @@ async def get_gallery(genre: str):
             detail=f"Error reading screenshots data: {str(e)}"
         )
 
+@app.post("/api/gallery/mezzanine", status_code=202)
+def convert_gallery_to_mezzanine(request: GenreRequest):
+    """
+    Re-encode the clips of a gallery into the mezzanine format used by the copy merge engine.
+    The conversion runs as a job.
+    """
+    return queue_gallery_job(request.genre, "gallery-mezzanine", gallery_mezzanine_stage, request.genre)
+
 @app.post("/api/gallery/delete")
-async def delete_from_gallery(request: GalleryDeleteRequest):
+def delete_from_gallery(request: GalleryDeleteRequest):
     """
     Delete a video from the gallery.
     """
@@ -28,6 +28,8 @@ const GenerationProcess: React.FC<GenerationProcessProps> = ({
   const [isGenerating, setIsGenerating] = useState(false);
   const videoRef = useRef<HTMLVideoElement>(null);
   const [genre, setGenre] = useState<string>('military'); // Default genre
+  const [stageProgress, setStageProgress] = useState<generationApi.StageProgress | null>(null);
+  const stageProgressRef = useRef<generationApi.StageProgress | null>(null);
 
   // For debugging - log the props
   useEffect(() => {
@@ -54,6 +56,7 @@ const GenerationProcess: React.FC<GenerationProcessProps> = ({
     },
     {
       name: "Create Speech",
+      stage: "create-speech",  // Backend stage that reports progress for this step
       description: "Converting text to natural-sounding speech with our advanced voice synthesis technology.",
       icon: <FiMic />,
       apiCall: async (sessionId: string) => {
@@ -62,6 +65,7 @@ const GenerationProcess: React.FC<GenerationProcessProps> = ({
     },
     {
       name: "Merge the Videos",
+      stage: "merge-videos",
       description: "Combining visual elements and creating a seamless video experience from multiple sources.",
       icon: <FiVideo />,
       apiCall: async (sessionId: string) => {
@@ -70,6 +74,7 @@ const GenerationProcess: React.FC<GenerationProcessProps> = ({
     },
     {
       name: "Add the Captions",
+      stage: "add-captions",
       description: "Generating precise captions synchronized with speech for better engagement and accessibility.",
       icon: <FiType />,
       apiCall: async (sessionId: string) => {
@@ -78,6 +83,7 @@ const GenerationProcess: React.FC<GenerationProcessProps> = ({
     },
     {
       name: "Add the Music",
+      stage: "add-music",
       description: "Enhancing your video with the perfect soundtrack to complement your content.",
       icon: <FiMusic />,
       apiCall: async (sessionId: string) => {
@@ -86,6 +92,7 @@ const GenerationProcess: React.FC<GenerationProcessProps> = ({
     },
     {
       name: "Receive URL",
+      stage: "get-video-url",
       description: "Finalizing your video and preparing it for viewing and sharing.",
       icon: <FiLink />,
       apiCall: async (sessionId: string) => {
@@ -169,6 +176,22 @@ const GenerationProcess: React.FC<GenerationProcessProps> = ({
     setIsGenerating(true);
   }, []);
 
+  // Stream live progress (phase, percent, fps, ETA) of the backend stages for this session
+  useEffect(() => {
+    if (!sessionId || isComplete) {
+      return;
+    }
+
+    const source = generationApi.subscribeToProgress(sessionId, (update) => {
+      stageProgressRef.current = update;
+      setStageProgress(update);
+    });
+
+    return () => {
+      source.close();
+    };
+  }, [sessionId, isComplete]);
+
   useEffect(() => {
     // Get selected genre from localStorage
     const savedGenre = localStorage.getItem('selectedGenre');
@@ -200,6 +223,12 @@ const GenerationProcess: React.FC<GenerationProcessProps> = ({
         const currentStepEnd = (currentStepIndex + 1) * stepSize;
         // Only go to 90% of the way to the next step until the API call is complete
         const maxForNow = currentStepEnd - (stepSize * 0.1);
+
+        // Use the real progress reported by the backend when this step's stage is running
+        const live = stageProgressRef.current;
+        if (live && currentStep.stage && live.stage === currentStep.stage && live.status === 'running') {
+          return Math.max(prev, currentStepStart + (maxForNow - currentStepStart) * live.percent / 100);
+        }
         return Math.min(prev + 0.5, maxForNow);
       });
     }, 100);
@@ -259,6 +288,17 @@ const GenerationProcess: React.FC<GenerationProcessProps> = ({
 
   const currentStep = steps[currentStepIndex];
 
+  // Live status line for the running stage, e.g. "encode · 42% · 38 fps · ETA 12s"
+  const liveStatus = (() => {
+    if (!stageProgress || stageProgress.stage !== currentStep.stage || stageProgress.status !== 'running' || !stageProgress.phase) {
+      return null;
+    }
+    const parts = [stageProgress.phase, `${Math.round(stageProgress.percent)}%`];
+    if (stageProgress.fps) parts.push(`${Math.round(stageProgress.fps)} fps`);
+    if (stageProgress.eta !== null && stageProgress.eta > 0) parts.push(`ETA ${Math.ceil(stageProgress.eta)}s`);
+    return parts.join(' · ');
+  })();
+
   return (
     <LoadingBackground>
       <div className={styles.processContainer}>
@@ -346,6 +386,9 @@ const GenerationProcess: React.FC<GenerationProcessProps> = ({
                 </div>
                 <h2 className={styles.stepName}>{currentStep.name}</h2>
                 <p className={styles.stepDescription}>{currentStep.description}</p>
+                {liveStatus && (
+                  <p className={styles.liveStatus}>{liveStatus}</p>
+                )}
               </div>
             </>
           )}